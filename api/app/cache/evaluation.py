@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+from typing import AsyncGenerator
+
+from langchain_core.messages import BaseMessage
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache.lru import LRUCache
+from app.db.models import EvaluationCacheEntry
+from chains import eval_chain
+
+# Set up logging
+logger = logging.getLogger('uvicorn.error')
+
+# Maximum number of evaluations kept in memory (all of them are stored in the database)
+EVAL_CACHE_SIZE = int(os.environ.get("EVAL_CACHE_SIZE", "256"))
+
+
+def evaluation_key(messages: list[BaseMessage]) -> str:
+    """
+    Content address of an evaluation: the transcript with whitespace normalized,
+    the rubric version, the evaluation mode and the rating model.
+    """
+    transcript = [(message.type, " ".join(str(message.content).split())) for message in messages]
+    payload = json.dumps(
+        [transcript, eval_chain.RUBRIC_VERSION, eval_chain.EVAL_MODE, eval_chain.RATING_MODEL],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class EvaluationCache:
+    """
+    Evaluations run at temperature 0, so a transcript that was already rated
+    gets the stored feedback instead of a new rubric generation. Entries are
+    persisted in Postgres, recently used ones are also kept in memory.
+    """
+
+    def __init__(self, maxsize: int):
+        self.feedback = LRUCache(maxsize)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, key: str) -> str | None:
+        feedback = self.feedback.get(key)
+        if feedback is not None:
+            self.memory_hits += 1
+            return feedback
+        entry = await db.get(EvaluationCacheEntry, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self.feedback.put(key, entry.feedback)
+        return entry.feedback
+
+    async def put(self, db: AsyncSession, key: str, feedback: str) -> None:
+        """Store a complete evaluation; failed ones are not cached."""
+        if not feedback or eval_chain.EVAL_ERROR in feedback:
+            return
+        self.feedback.put(key, feedback)
+        db.add(EvaluationCacheEntry(
+            key=key,
+            model=eval_chain.RATING_MODEL,
+            rubric_version=eval_chain.RUBRIC_VERSION,
+            feedback=feedback,
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # The same transcript was rated concurrently and stored first
+            await db.rollback()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "size": len(self.feedback),
+            "maxsize": self.feedback.maxsize,
+            "hits": self.memory_hits + self.db_hits,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+        }
+
+
+async def replay(feedback: str) -> AsyncGenerator[str, None]:
+    """Stream stored feedback line by line, like a generated evaluation."""
+    for line in feedback.splitlines(keepends=True):
+        yield line
+
+
+evaluation_cache = EvaluationCache(EVAL_CACHE_SIZE)
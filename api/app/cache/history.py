@@ -0,0 +1,87 @@
+import os
+import sys
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache.lru import LRUCache
+from app.db.models import ChatMessage
+from app.db.write_behind import write_behind
+
+# Maximum number of chat sessions whose history is kept in memory
+HISTORY_CACHE_SIZE = int(os.environ.get("HISTORY_CACHE_SIZE", "1024"))
+# Seconds after the last write before a session's history is reloaded from the database
+HISTORY_CACHE_TTL = float(os.environ.get("HISTORY_CACHE_TTL", "3600"))
+
+
+def to_langchain_message(role: str, content: str) -> BaseMessage | None:
+    """Convert a stored chat message into its LangChain message, if it has a chat role."""
+    if role == "user":
+        return HumanMessage(content=content)
+    if role == "patient":
+        return AIMessage(content=content)
+    return None
+
+
+class HistoryCache:
+    """
+    Write-through cache of each session's conversation as LangChain messages.
+    The router appends every message it stores, so a turn only reads the
+    database when the session is not cached (new process, evicted or expired).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.sessions = LRUCache(maxsize, ttl=ttl)
+
+    async def get(self, db: AsyncSession, session_id: str) -> list[BaseMessage]:
+        """Return a copy of the session's history, loading it on a miss."""
+        messages = self.sessions.get(session_id)
+        if messages is None:
+            # Queued messages of this session must be in the database before it is read
+            await write_behind.flush()
+            rows = await db.execute(
+                select(ChatMessage.role, ChatMessage.content)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.timestamp.asc(), ChatMessage.id.asc())
+            )
+            messages = [m for role, content in rows if (m := to_langchain_message(role, content)) is not None]
+            self.sessions.put(session_id, messages)
+        return list(messages)
+
+    def start(self, session_id: str) -> None:
+        """Cache an empty history for a session that was just created."""
+        self.sessions.put(session_id, [])
+
+    def append(self, session_id: str, message: BaseMessage) -> None:
+        """Append a message that was just stored; uncached sessions load it on their next read."""
+        messages = self.sessions.peek(session_id)
+        if messages is not None:
+            messages.append(message)
+            self.sessions.put(session_id, messages)
+
+    def invalidate(self, session_id: str) -> None:
+        self.sessions.pop(session_id)
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by cached messages."""
+        return sum(
+            sys.getsizeof(message) + sys.getsizeof(message.content)
+            for messages in self.sessions.values()
+            for message in messages
+        )
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "maxsize": self.sessions.maxsize,
+            "messages": sum(len(messages) for messages in self.sessions.values()),
+            "memory_bytes": self.memory_bytes(),
+            "hits": self.sessions.hits,
+            "misses": self.sessions.misses,
+            "hit_rate": self.sessions.hit_rate(),
+            "evictions": self.sessions.evictions,
+        }
+
+
+history_cache = HistoryCache(HISTORY_CACHE_SIZE, HISTORY_CACHE_TTL)
@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry. With `ttl` set,
+    entries also expire that many seconds after they were last written.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self.data.get(key)
+        if item is None or (self.ttl is not None and item[0] < time.monotonic()):
+            if item is not None:
+                del self.data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data.move_to_end(key)
+        return item[1]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Look up a live entry without counting it or refreshing its position."""
+        item = self.data.get(key)
+        if item is None or (self.ttl is not None and item[0] < time.monotonic()):
+            return default
+        return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self.data[key] = (expires, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self.data.pop(key, None)
+        return default if item is None else item[1]
+
+    def values(self) -> list[Any]:
+        return [value for _, value in self.data.values()]
+
+    def clear(self) -> None:
+        self.data.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
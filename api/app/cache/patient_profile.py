@@ -0,0 +1,79 @@
+import logging
+import os
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.cache.lru import LRUCache
+from app.db.models import PatientFile, Anamnesis
+from chains.formatting import format_patient_details
+from chains.prompt_registry import prompt_registry
+
+# Set up logging
+logger = logging.getLogger('uvicorn.error')
+
+# Maximum number of rendered patient profiles kept in memory
+PATIENT_CACHE_SIZE = int(os.environ.get("PATIENT_CACHE_SIZE", "256"))
+
+
+class PatientProfileCache:
+    """
+    Rendered patient details by patient_file_id. A miss loads the patient file
+    together with its anamneses in a single query and formats it once.
+    """
+
+    def __init__(self, maxsize: int):
+        self.profiles = LRUCache(maxsize)
+
+    async def get(self, db: AsyncSession, patient_file_id: int) -> str | None:
+        """Return the rendered patient details, or None if the file does not exist."""
+        patient_details = self.profiles.get(patient_file_id)
+        if patient_details is not None:
+            return patient_details
+
+        result = await db.execute(
+            select(PatientFile)
+            .options(joinedload(PatientFile.anamneses))
+            .where(PatientFile.id == patient_file_id)
+        )
+        patient_file = result.unique().scalar_one_or_none()
+        if patient_file is None:
+            return None
+
+        patient_details = format_patient_details(patient_file)
+        self.profiles.put(patient_file_id, patient_details)
+        return patient_details
+
+    def invalidate(self, patient_file_id: int) -> None:
+        """Drop the cached profile, and the prompts built from it, after the patient file was edited."""
+        patient_details = self.profiles.pop(patient_file_id)
+        if patient_details is not None:
+            prompt_registry.evict_patient(patient_details)
+            logger.debug("Invalidated cached patient profile %s", patient_file_id)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.profiles),
+            "maxsize": self.profiles.maxsize,
+            "hits": self.profiles.hits,
+            "misses": self.profiles.misses,
+        }
+
+
+patient_profiles = PatientProfileCache(PATIENT_CACHE_SIZE)
+
+
+# Invalidate on edits made through this process's ORM
+@event.listens_for(PatientFile, "after_update")
+@event.listens_for(PatientFile, "after_delete")
+def _patient_file_changed(mapper, connection, target):
+    patient_profiles.invalidate(target.id)
+
+
+@event.listens_for(Anamnesis, "after_insert")
+@event.listens_for(Anamnesis, "after_update")
+@event.listens_for(Anamnesis, "after_delete")
+def _anamnesis_changed(mapper, connection, target):
+    if target.patient_file_id is not None:
+        patient_profiles.invalidate(target.patient_file_id)
@@ -0,0 +1,55 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ChatSession, EvaluationResult, TokenUsage, utcnow
+from app.db.write_behind import write_behind
+from chains.eval_chain import CRITERIA, RATING_MODEL, RUBRIC_VERSION, ScoreExtractor
+
+# EvaluationResult column of each CRI-HT criterion, in rubric order
+CRITERION_COLUMNS = dict(zip(
+    [name for name, _ in CRITERIA],
+    [
+        "score_conversation_lead",
+        "score_relevant_information",
+        "score_symptom_detail",
+        "score_pathophysiology",
+        "score_logical_order",
+        "score_confirmation",
+        "score_summary",
+        "score_efficiency",
+    ],
+))
+
+
+async def save_evaluation_result(db: AsyncSession, session_id: str, extractor: ScoreExtractor) -> EvaluationResult | None:
+    """Store the scores of a session's evaluation, replacing those of an earlier one."""
+    session = await db.get(ChatSession, session_id)
+    if session is None or not (extractor.scores or extractor.overall is not None):
+        return None
+
+    # Condition and model are chosen per turn; the last chat turn describes the session best
+    await write_behind.flush()
+    last_turn = (await db.execute(
+        select(TokenUsage.condition, TokenUsage.model)
+        .where(TokenUsage.session_id == session_id, TokenUsage.kind == "chat")
+        .order_by(TokenUsage.created_at.desc(), TokenUsage.id.desc())
+        .limit(1)
+    )).first()
+
+    result = (await db.execute(
+        select(EvaluationResult).where(EvaluationResult.session_id == session_id)
+    )).scalar_one_or_none()
+    if result is None:
+        result = EvaluationResult(session_id=session_id)
+        db.add(result)
+    result.patient_file_id = session.patient_file_id
+    result.condition = last_turn.condition if last_turn else None
+    result.model = last_turn.model if last_turn else None
+    result.rating_model = RATING_MODEL
+    result.rubric_version = RUBRIC_VERSION
+    for name, column in CRITERION_COLUMNS.items():
+        setattr(result, column, extractor.scores.get(name))
+    result.overall_score = extractor.overall_score()
+    result.created_at = utcnow()
+    await db.commit()
+    return result
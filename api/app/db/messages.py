@@ -0,0 +1,61 @@
+import base64
+import datetime
+
+from sqlalchemy import Table, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ChatMessage
+
+# Largest page of messages a client may request
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp: datetime.datetime, message_id: int) -> str:
+    """Opaque cursor pointing at one message by its (timestamp, id) position."""
+    raw = f"{timestamp.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.split("|")
+        return datetime.datetime.fromisoformat(timestamp), int(message_id)
+    except ValueError as e:
+        raise InvalidCursor(cursor) from e
+
+
+async def fetch_page(
+    db: AsyncSession,
+    session_id: str,
+    limit: int,
+    before: tuple[datetime.datetime, int] | None = None,
+    after: tuple[datetime.datetime, int] | None = None,
+    table: Table = ChatMessage.__table__,
+) -> tuple[list, bool]:
+    """
+    One page of a session's messages in chronological order, plus whether more
+    messages lie beyond it. Without a cursor this is the tail of the
+    conversation; `before` pages backwards and `after` forwards. Each page is a
+    range scan on the (session_id, timestamp, id) index, however deep it is.
+    """
+    position = tuple_(table.c.timestamp, table.c.id)
+    query = select(table.c.id, table.c.role, table.c.content, table.c.timestamp).where(table.c.session_id == session_id)
+    if after is not None:
+        query = query.where(position > tuple_(*after)).order_by(table.c.timestamp.asc(), table.c.id.asc())
+    else:
+        if before is not None:
+            query = query.where(position < tuple_(*before))
+        query = query.order_by(table.c.timestamp.desc(), table.c.id.desc())
+
+    # One extra row tells whether there is another page
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+    return rows, has_more
@@ -0,0 +1,96 @@
+import logging
+from dataclasses import dataclass
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.db.models import utcnow
+
+# Set up logging
+logger = logging.getLogger('migrations')
+logger.setLevel(logging.DEBUG)
+
+# Arbitrary key of the Postgres advisory lock that serializes migrations across workers
+MIGRATION_LOCK_KEY = 724_001
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    A schema change for databases created before it. `create_all` builds new
+    databases in the final state, so statements must be idempotent.
+    """
+    version: int
+    description: str
+    statements: tuple[str, ...]
+    # (table, column) that makes the statements a no-op if it exists, for ADD COLUMN without IF NOT EXISTS (SQLite)
+    unless_column: tuple[str, str] | None = None
+
+
+MIGRATIONS = (
+    Migration(
+        version=1,
+        description="chat_messages (session_id, timestamp, id) index",
+        statements=(
+            # CONCURRENTLY keeps chat_messages writable while a large table is indexed (Postgres only)
+            "CREATE INDEX {concurrently} IF NOT EXISTS ix_chat_messages_session_timestamp_id "
+            "ON chat_messages (session_id, timestamp, id)",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="chat_messages.truncated flag for partial replies",
+        statements=("ALTER TABLE chat_messages ADD COLUMN truncated BOOLEAN NOT NULL DEFAULT FALSE",),
+        unless_column=("chat_messages", "truncated"),
+    ),
+)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, default=utcnow),
+)
+
+
+async def apply(conn: AsyncConnection, migration: Migration) -> None:
+    concurrently = "CONCURRENTLY" if conn.dialect.name == "postgresql" else ""
+    if migration.unless_column is not None:
+        table, column = migration.unless_column
+        columns = await conn.run_sync(lambda c: [col["name"] for col in inspect(c).get_columns(table)])
+        statements = () if column in columns else migration.statements
+    else:
+        statements = migration.statements
+    for statement in statements:
+        await conn.execute(text(statement.format(concurrently=concurrently)))
+    try:
+        await conn.execute(insert(schema_migrations).values(version=migration.version, description=migration.description))
+    except IntegrityError:
+        # Applied by another worker in the meantime
+        pass
+
+
+async def run_migrations(engine: AsyncEngine) -> list[int]:
+    """Apply pending migrations in order and return their versions."""
+    applied_now = []
+    # Autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.run_sync(schema_migrations.metadata.create_all)
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            applied = set((await conn.execute(select(schema_migrations.c.version))).scalars())
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+                logger.info("Applying migration %d: %s", migration.version, migration.description)
+                await apply(conn, migration)
+                applied_now.append(migration.version)
+        finally:
+            if is_postgres:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    return applied_now
@@ -1,24 +1,40 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Float, Boolean, Index, false
 from sqlalchemy.orm import relationship
 from app.db.db import Base
 import datetime
 
+
+def utcnow() -> datetime.datetime:
+    """Current UTC time without tzinfo, as stored in the timestamp columns (asyncpg rejects aware values there)."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def as_naive_utc(value: datetime.datetime) -> datetime.datetime:
+    """Convert an aware datetime (e.g. a query parameter) to the naive UTC of the timestamp columns."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
 
     id = Column(String, primary_key=True, index=True)
     patient_file_id = Column(Integer, ForeignKey('patient_files.id'))
-    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
     messages = relationship("ChatMessage", back_populates="session")
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    # History reads and keyset pagination of a session; created on existing databases by migration 1
+    __table_args__ = (Index("ix_chat_messages_session_timestamp_id", "session_id", "timestamp", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, ForeignKey('chat_sessions.id'))
     role = Column(String)
     content = Column(Text)
-    timestamp = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    timestamp = Column(DateTime, default=utcnow)
+    # Partial reply of a generation cancelled because the client disconnected; added by migration 2
+    truncated = Column(Boolean, nullable=False, default=False, server_default=false())
     session = relationship("ChatSession", back_populates="messages")
 
 class PatientFile(Base):
@@ -42,4 +58,59 @@ class Anamnesis(Base):
     category = Column(String)
     answer = Column(String)
     patient_file_id = Column(Integer, ForeignKey("patient_files.id"))
-    patient_file = relationship("PatientFile", back_populates="anamneses")
\ No newline at end of file
+    patient_file = relationship("PatientFile", back_populates="anamneses")
+
+class TokenUsage(Base):
+    __tablename__ = "token_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # No foreign key: usage is kept for capacity planning after a session is reset
+    session_id = Column(String, index=True)
+    kind = Column(String)  # "chat" or "eval"
+    model = Column(String, index=True)
+    condition = Column(String)
+    talkativeness = Column(String)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    # True if ChatAI reported no usage and the counts are local estimates
+    estimated = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=utcnow, index=True)
+
+class EvaluationCacheEntry(Base):
+    __tablename__ = "evaluation_cache"
+
+    # sha256 of the normalized transcript, rubric version, evaluation mode and model
+    key = Column(String(64), primary_key=True)
+    model = Column(String)
+    rubric_version = Column(String)
+    feedback = Column(Text)
+    created_at = Column(DateTime, default=utcnow)
+
+class EvaluationResult(Base):
+    __tablename__ = "evaluation_results"
+    __table_args__ = (
+        Index("ix_evaluation_results_patient_file_created", "patient_file_id", "created_at"),
+        Index("ix_evaluation_results_condition_model", "condition", "model"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Latest evaluation of the session; kept for cohort statistics when the session is reset
+    session_id = Column(String, ForeignKey('chat_sessions.id', ondelete="SET NULL"), unique=True)
+    patient_file_id = Column(Integer, ForeignKey('patient_files.id'))
+    # Patient condition and chat model of the session's last turn
+    condition = Column(String)
+    model = Column(String)
+    rating_model = Column(String)
+    rubric_version = Column(String)
+    # CRI-HT criterion scores (1-5), None if the rubric had no score for it
+    score_conversation_lead = Column(Integer)
+    score_relevant_information = Column(Integer)
+    score_symptom_detail = Column(Integer)
+    score_pathophysiology = Column(Integer)
+    score_logical_order = Column(Integer)
+    score_confirmation = Column(Integer)
+    score_summary = Column(Integer)
+    score_efficiency = Column(Integer)
+    overall_score = Column(Float)
+    created_at = Column(DateTime, default=utcnow, index=True)
+    session = relationship("ChatSession")
@@ -0,0 +1,131 @@
+import asyncio
+import contextvars
+import logging
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Set up logging
+logger = logging.getLogger('uvicorn.error')
+
+# Label of the request currently being served, set by the request middleware
+current_request: contextvars.ContextVar[str] = contextvars.ContextVar("current_request", default="<no request>")
+
+
+@dataclass
+class Checkout:
+    """A connection that is currently checked out of the pool."""
+    started: float
+    request: str
+    reported: bool = False
+
+
+class PoolMonitor:
+    """
+    Tracks checkouts, wait times and overflow events of a connection pool and
+    logs requests that hold a connection longer than `leak_threshold` seconds.
+    """
+
+    def __init__(self, leak_threshold: float):
+        self.leak_threshold = leak_threshold
+        self.engine = None
+        self.checkouts: dict[int, Checkout] = {}
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.leaks_detected = 0
+
+    @property
+    def pool(self):
+        return self.engine.pool if self.engine is not None else None
+
+    def attach(self, engine) -> None:
+        """Register pool event listeners on an engine (sync or async)."""
+        self.engine = getattr(engine, "sync_engine", engine)
+        self.engine.pool.monitor = self
+        event.listen(self.engine, "connect", self.on_connect)
+        event.listen(self.engine, "checkout", self.on_checkout)
+        event.listen(self.engine, "checkin", self.on_checkin)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        self.wait_count += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        if timed_out:
+            self.timeouts += 1
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        # A positive overflow means the new connection exceeds pool_size
+        if self.pool is not None and self.pool.overflow() > 0:
+            self.overflow_events += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts[id(connection_record)] = Checkout(time.monotonic(), current_request.get())
+
+    def on_checkin(self, dbapi_connection, connection_record) -> None:
+        checkout = self.checkouts.pop(id(connection_record), None)
+        if checkout is None:
+            return
+        held = time.monotonic() - checkout.started
+        if held > self.leak_threshold and not checkout.reported:
+            self.leaks_detected += 1
+            logger.warning("Connection held for %.1fs by request %s", held, checkout.request)
+
+    def check_leaks(self) -> None:
+        """Log connections that are still checked out past the leak threshold."""
+        now = time.monotonic()
+        for checkout in list(self.checkouts.values()):
+            held = now - checkout.started
+            if held > self.leak_threshold and not checkout.reported:
+                checkout.reported = True
+                self.leaks_detected += 1
+                logger.warning("Possible connection leak: held for %.1fs by request %s", held, checkout.request)
+
+    async def watch(self, interval: float) -> None:
+        """Periodically check for leaked connections until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            self.check_leaks()
+
+    def stats(self) -> dict:
+        pool = self.pool
+        return {
+            "pool_size": pool.size() if pool is not None else 0,
+            "checked_out": len(self.checkouts),
+            "checked_in": pool.checkedin() if pool is not None else 0,
+            "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+            "overflow_events": self.overflow_events,
+            "wait_count": self.wait_count,
+            "wait_avg_ms": self.wait_total / self.wait_count * 1000 if self.wait_count else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+            "timeouts": self.timeouts,
+            "leaks_detected": self.leaks_detected,
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that reports how long each checkout waited."""
+
+    monitor: PoolMonitor | None = None
+
+    def connect(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.monitor is not None:
+                self.monitor.record_wait(time.perf_counter() - started, timed_out)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting to the same monitor
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        return pool
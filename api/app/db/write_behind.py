@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+from contextlib import suppress
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db.db import SessionLocal
+
+# Set up logging
+logger = logging.getLogger('write_behind')
+logger.setLevel(logging.DEBUG)
+
+# Queue chat messages and token usage and insert them in batches instead of one commit per row
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+# Flush as soon as this many rows are queued
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "200"))
+# Seconds a queued row waits at most before it is flushed
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+
+
+def row_values(obj) -> dict:
+    """
+    Column values of a new ORM object, with Python-side defaults filled in now
+    so timestamps reflect when the row was queued rather than flushed.
+    """
+    values = {}
+    for column in obj.__table__.columns:
+        value = getattr(obj, column.key, None)
+        if value is None and column.default is not None:
+            if column.default.is_callable:
+                value = column.default.arg(None)
+            elif column.default.is_scalar:
+                value = column.default.arg
+        if value is not None:
+            values[column.key] = value
+    return values
+
+
+class WriteBehindQueue:
+    """
+    Buffers inserts and writes them with one multi-row INSERT per table and a
+    single commit, whenever the batch is full or the flush interval elapsed.
+    Readers that go to the database call `flush()` first, which also waits for
+    a flush in progress, so a session always reads its own writes.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], batch_size: int, flush_interval: float):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows: list[tuple] = []
+        self.lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.closing = False
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.max_batch = 0
+
+    def add(self, *objects) -> None:
+        """Queue new ORM objects for insertion."""
+        for obj in objects:
+            self.rows.append((obj.__table__, row_values(obj)))
+        if len(self.rows) >= self.batch_size:
+            self.wakeup.set()
+
+    async def flush(self) -> None:
+        """Insert all queued rows in one transaction."""
+        async with self.lock:
+            rows, self.rows = self.rows, []
+            if not rows:
+                return
+            # executemany needs the same keys for every row of a statement
+            batches: dict[tuple, list[dict]] = {}
+            for table, values in rows:
+                batches.setdefault((table, tuple(values)), []).append(values)
+            try:
+                async with self.session_factory() as db:
+                    for (table, _), values in batches.items():
+                        await db.execute(insert(table), values)
+                    await db.commit()
+            except Exception as e:
+                logger.error("Batched insert of %d rows failed, retrying row by row: %s", len(rows), str(e))
+                await self.insert_each(rows)
+                return
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            self.max_batch = max(self.max_batch, len(rows))
+
+    async def insert_each(self, rows: list[tuple]) -> None:
+        """Insert rows one transaction each so a single bad row (e.g. of a reset session) is the only loss."""
+        for table, values in rows:
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(table), values)
+                    await db.commit()
+                self.flushes += 1
+                self.flushed_rows += 1
+            except Exception as e:
+                self.failed_rows += 1
+                logger.error("Dropping queued %s row: %s", table.name, str(e))
+
+    async def run(self) -> None:
+        """Flush on the interval, or earlier when a batch is full."""
+        while not self.closing:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Write-behind flush failed: %s", str(e))
+
+    def start(self) -> None:
+        # Bind the event to the running loop
+        self.wakeup = asyncio.Event()
+        self.closing = False
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """Stop the flush loop and write everything still queued."""
+        if self.task is not None:
+            # Not cancelled: a flush in progress must finish or its rows are lost
+            self.closing = True
+            self.wakeup.set()
+            await self.task
+            self.task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "pending": len(self.rows),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "max_batch": self.max_batch,
+        }
+
+
+write_behind = WriteBehindQueue(SessionLocal, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL)
+
+
+async def store(db: AsyncSession, *objects) -> None:
+    """Persist new rows, through the write-behind queue if it is enabled."""
+    if WRITE_BEHIND_ENABLED:
+        write_behind.add(*objects)
+        return
+    db.add_all(objects)
+    await db.commit()
@@ -1,21 +1,84 @@
 # API entry point
-from fastapi import FastAPI
-from app.routers import chat
-from app.db.db import engine
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.routers import analytics, chat, metrics, patients, sessions
+from app.db.db import engine, pool_monitor
+from app.db.pool import current_request
+from app.db.write_behind import WRITE_BEHIND_ENABLED, write_behind
 from app.db import models
+from app.db.migrations import run_migrations
+from app.streams import stream_hub
+from chains.breaker import CLOSED, breakers
+from chains.llm_clients import llm_clients
+from chains.prompt_registry import prompt_registry
+from chains.tokens import get_encoding
+
+# Seconds between checks for connections held past the leak threshold
+DB_LEAK_CHECK_INTERVAL = float(os.environ.get("DB_LEAK_CHECK_INTERVAL", "10"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Init database schema
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    await run_migrations(engine)
+    # Load the tokenizer (may download its vocabulary) before the first turn needs it
+    await asyncio.to_thread(get_encoding)
+    leak_watcher = asyncio.create_task(pool_monitor.watch(DB_LEAK_CHECK_INTERVAL))
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start()
+    yield
+    # Detached generations persist their replies, so they go before the queue and the engine
+    await stream_hub.close()
+    # Write queued messages while the engine is still open
+    await write_behind.close()
+    leak_watcher.cancel()
+    with suppress(asyncio.CancelledError):
+        await leak_watcher
+    # Cached chains hold pooled LLM clients, drop them before closing the pool
+    prompt_registry.clear()
+    await llm_clients.aclose()
+    await engine.dispose()
 
 app = FastAPI(
     title="Symptex LangChain Server",
     version="1.0",
     description="API server for Symptex, a LangChain-based chat application for patient simulation",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def label_request(request: Request, call_next):
+    # Start of the request for stage timings, before the body is parsed
+    request.state.received_at = time.perf_counter()
+    # Attribute pool checkouts to the request that made them
+    current_request.set(f"{request.method} {request.url.path}")
+    return await call_next(request)
+
 @app.get("/")
 def read_root():
     return {"message": "Hello, World!"}
 
-# Include chat router
-app.include_router(chat.router, prefix="/api/v1")
+@app.get("/health")
+def health():
+    """Liveness and the state of the ChatAI circuits; "degraded" while one is not closed"""
+    circuits = breakers.stats()
+    degraded = any(circuit["state"] != CLOSED for circuit in circuits.values())
+    return {"status": "degraded" if degraded else "ok", "circuits": circuits}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint for latency histograms, token counters, pool and cache stats"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-# Init database schema
-models.Base.metadata.create_all(bind=engine)
+# Include routers
+app.include_router(chat.router, prefix="/api/v1")
+app.include_router(patients.router, prefix="/api/v1")
+app.include_router(sessions.router, prefix="/api/v1")
+app.include_router(metrics.router, prefix="/api/v1")
+app.include_router(analytics.router, prefix="/api/v1")
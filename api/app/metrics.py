@@ -0,0 +1,292 @@
+import time
+from contextlib import contextmanager
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.constants import TAG_NOSTREAM
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.db.db import pool_monitor
+from app.db.write_behind import write_behind
+from app.cache.patient_profile import patient_profiles
+from app.cache.history import history_cache
+from app.cache.evaluation import evaluation_cache
+from app.streams import stream_hub
+from app.turns import session_turns
+from chains.admission import admission
+from chains.breaker import CLOSED, HALF_OPEN, OPEN, breakers
+from chains.routing import model_router
+from chains.prompt_registry import prompt_registry
+
+STAGE_SECONDS = Histogram(
+    "symptex_stage_seconds",
+    "Duration of request stages",
+    ["endpoint", "stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+TTFT_SECONDS = Histogram(
+    "symptex_upstream_ttft_seconds",
+    "Time from sending the prompt to ChatAI until the first token",
+    ["endpoint", "model"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30),
+)
+INTER_TOKEN_SECONDS = Histogram(
+    "symptex_inter_token_seconds",
+    "Gap between consecutive streamed tokens",
+    ["endpoint", "model"],
+    buckets=(0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2),
+)
+STREAM_SECONDS = Histogram(
+    "symptex_stream_seconds",
+    "Duration of a streamed response from the first byte of the request to the last token",
+    ["endpoint", "model"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+TOKENS = Counter(
+    "symptex_tokens",
+    "Prompt and completion tokens used",
+    ["kind", "model", "type"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "symptex_admission_wait_seconds",
+    "Time a request waited for a free slot of its model",
+    ["model", "kind"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+CANCELLED = Counter(
+    "symptex_cancelled_generations",
+    "Generations cancelled because the client disconnected",
+    ["kind", "model"],
+)
+CANCELLED_TOKENS = Counter(
+    "symptex_cancelled_completion_tokens",
+    "Completion tokens of cancelled generations: generated before the disconnect (wasted) "
+    "and estimated as not generated thanks to the cancellation (saved)",
+    ["kind", "model", "type"],
+)
+
+FAILED = Counter(
+    "symptex_failed_generations",
+    "Generations that ended in an error streamed to the client; failed chat turns are not stored",
+    ["kind", "model"],
+)
+
+# Completion tokens and count of finished generations per (kind, model), for the saved-token estimate
+completion_totals: dict[tuple[str, str], list[int]] = {}
+
+
+class RequestTimer:
+    """Collects the durations of the stages of one request."""
+
+    def __init__(self, endpoint: str, started: float | None = None):
+        self.endpoint = endpoint
+        self.started = started if started is not None else time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_SECONDS.labels(self.endpoint, stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value for the stages recorded so far."""
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items())
+
+
+class StreamTimingHandler(BaseCallbackHandler):
+    """
+    Times the LLM calls of a streamed request: our own work until the prompt
+    is sent (prompt_build), context summaries, upstream time to first token,
+    gaps between tokens and the total stream duration.
+    """
+
+    run_inline = True
+
+    def __init__(self, timer: RequestTimer, model: str):
+        self.timer = timer
+        self.model = model
+        self.graph_started = time.perf_counter()
+        self.summary_runs: dict[UUID, float] = {}
+        self.run_id: UUID | None = None
+        self.sent_at: float | None = None
+        self.last_token_at: float | None = None
+
+    def on_chat_model_start(
+        self, serialized: dict[str, Any], messages: list, *, run_id: UUID, tags: list[str] | None = None, **kwargs: Any
+    ) -> None:
+        now = time.perf_counter()
+        if tags and TAG_NOSTREAM in tags:
+            self.summary_runs[run_id] = now
+            return
+        # Only the first call is timed (a parallel evaluation starts one per criterion)
+        if self.run_id is not None:
+            return
+        # Our own work in the graph before ChatAI is called, excluding summaries and the admission wait
+        self.timer.record("prompt_build", now - self.graph_started - self.timer.stages.get("summarize", 0.0)
+                          - self.timer.stages.get("admission", 0.0))
+        self.run_id = run_id
+        self.sent_at = now
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id != self.run_id or not token:
+            return
+        now = time.perf_counter()
+        if self.last_token_at is None:
+            TTFT_SECONDS.labels(self.timer.endpoint, self.model).observe(now - self.sent_at)
+            self.timer.stages["upstream_ttft"] = now - self.sent_at
+        else:
+            INTER_TOKEN_SECONDS.labels(self.timer.endpoint, self.model).observe(now - self.last_token_at)
+        self.last_token_at = now
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self.summary_runs.pop(run_id, None)
+        if started is not None:
+            self.timer.record("summarize", time.perf_counter() - started)
+
+    def finish(self) -> None:
+        """Record the total stream duration once the last token was sent."""
+        STREAM_SECONDS.labels(self.timer.endpoint, self.model).observe(time.perf_counter() - self.timer.started)
+
+
+def record_tokens(kind: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    TOKENS.labels(kind, model, "prompt").inc(prompt_tokens)
+    TOKENS.labels(kind, model, "completion").inc(completion_tokens)
+    totals = completion_totals.setdefault((kind, model), [0, 0])
+    totals[0] += completion_tokens
+    totals[1] += 1
+
+
+def record_cancelled(kind: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """Count a generation cut off by a client disconnect; savings are estimated from the average finished reply."""
+    TOKENS.labels(kind, model, "prompt").inc(prompt_tokens)
+    TOKENS.labels(kind, model, "completion").inc(completion_tokens)
+    CANCELLED.labels(kind, model).inc()
+    CANCELLED_TOKENS.labels(kind, model, "wasted").inc(completion_tokens)
+    total, count = completion_totals.get((kind, model), (0, 0))
+    if count:
+        CANCELLED_TOKENS.labels(kind, model, "saved").inc(max(0.0, total / count - completion_tokens))
+
+
+def record_failed(kind: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """Count a generation that ended in an error; its tokens were spent even though nothing is stored."""
+    TOKENS.labels(kind, model, "prompt").inc(prompt_tokens)
+    TOKENS.labels(kind, model, "completion").inc(completion_tokens)
+    FAILED.labels(kind, model).inc()
+
+
+def cache_stats() -> dict:
+    """Stats of the in-process caches."""
+    return {
+        "patient_profiles": patient_profiles.stats(),
+        "history": history_cache.stats(),
+        "prompts": prompt_registry.stats(),
+        "evaluations": evaluation_cache.stats(),
+    }
+
+
+class StatsCollector:
+    """Exposes connection pool and cache stats at scrape time."""
+
+    def collect(self):
+        pool = pool_monitor.stats()
+        for name in ("pool_size", "checked_out", "checked_in", "overflow"):
+            yield GaugeMetricFamily(f"symptex_db_pool_{name}", f"Connection pool {name.replace('_', ' ')}", value=pool[name])
+        for name in ("overflow_events", "timeouts", "leaks_detected", "wait_count"):
+            yield CounterMetricFamily(f"symptex_db_pool_{name}", f"Connection pool {name.replace('_', ' ')}", value=pool[name])
+        yield GaugeMetricFamily("symptex_db_pool_wait_max_seconds", "Longest connection checkout wait", value=pool["wait_max_ms"] / 1000)
+
+        hits = CounterMetricFamily("symptex_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("symptex_cache_misses", "Cache misses", labels=["cache"])
+        size = GaugeMetricFamily("symptex_cache_entries", "Entries held by a cache", labels=["cache"])
+        caches = cache_stats()
+        for cache, stats in caches.items():
+            hits.add_metric([cache], stats["hits"])
+            misses.add_metric([cache], stats["misses"])
+            size.add_metric([cache], stats.get("size", stats.get("sessions", 0)))
+        yield hits
+        yield misses
+        yield size
+        tiers = CounterMetricFamily("symptex_eval_cache_hits", "Evaluation cache hits by tier", labels=["tier"])
+        tiers.add_metric(["memory"], caches["evaluations"]["memory_hits"])
+        tiers.add_metric(["database"], caches["evaluations"]["db_hits"])
+        yield tiers
+        queue = write_behind.stats()
+        yield GaugeMetricFamily("symptex_write_behind_pending", "Rows waiting in the write-behind queue", value=queue["pending"])
+        yield CounterMetricFamily("symptex_write_behind_flushes", "Write-behind commits", value=queue["flushes"])
+        yield CounterMetricFamily("symptex_write_behind_rows", "Rows written by the write-behind queue", value=queue["flushed_rows"])
+        yield CounterMetricFamily("symptex_write_behind_failed_rows", "Queued rows that could not be written", value=queue["failed_rows"])
+        yield GaugeMetricFamily("symptex_history_cache_bytes", "Approximate memory held by the history cache",
+                                value=caches["history"]["memory_bytes"])
+        streams = stream_hub.stats()
+        yield GaugeMetricFamily("symptex_streams_active", "SSE generations in progress", value=streams["active"])
+        yield CounterMetricFamily("symptex_streams_started", "SSE generations started", value=streams["started"])
+        yield CounterMetricFamily("symptex_streams_resumed", "SSE streams resumed with Last-Event-ID", value=streams["resumed"])
+        yield CounterMetricFamily("symptex_streams_deduplicated", "Repeated requests attached to a stream by Idempotency-Key",
+                                  value=streams["deduplicated"])
+        turns = session_turns.stats()
+        yield GaugeMetricFamily("symptex_session_turns_waiting", "Chat turns waiting for an earlier turn of their session",
+                                value=turns["waiting"])
+        yield CounterMetricFamily("symptex_session_turns_serialized", "Chat turns that had to wait for an earlier turn of their session",
+                                  value=turns["serialized"])
+        waiting = GaugeMetricFamily("symptex_admission_waiting", "Requests waiting for a model slot", labels=["model", "kind"])
+        active = GaugeMetricFamily("symptex_admission_active", "Model slots in use", labels=["model"])
+        rejected = CounterMetricFamily("symptex_admission_rejected", "Requests rejected with 429", labels=["model"])
+        for model, gate in admission.stats().items():
+            for kind, count in gate["waiting_by_priority"].items():
+                waiting.add_metric([model, kind], count)
+            active.add_metric([model], gate["active"])
+            rejected.add_metric([model], gate["rejected"])
+        yield waiting
+        yield active
+        yield rejected
+        routing = model_router.stats()
+        for name, description in (
+            ("rerouted", "Patient replies sent to a faster equivalent model"),
+            ("hedged", "Patient replies that sent a second request after a late first token"),
+            ("hedge_wins", "Hedged replies answered by the second request"),
+            ("hedges_skipped", "Late first tokens not hedged because the other model had no free slot"),
+            ("failovers", "Patient replies retried on another model after a failed first request"),
+        ):
+            yield CounterMetricFamily(f"symptex_routing_{name}", description, value=routing[name])
+        ttft = GaugeMetricFamily("symptex_routing_ttft_p50_seconds", "Median upstream TTFT of recent routed calls", labels=["model"])
+        speed = GaugeMetricFamily("symptex_routing_tokens_per_second", "Median throughput of recent routed calls", labels=["model"])
+        extra_calls = CounterMetricFamily("symptex_routing_extra_calls",
+                                          "Routed calls besides the one that answered (hedge losers, failed attempts)", labels=["model"])
+        extra_tokens = CounterMetricFamily("symptex_routing_extra_tokens",
+                                           "Estimated tokens of extra routed calls, not included in symptex_tokens", labels=["model", "type"])
+        for model, stats in routing["models"].items():
+            extra_calls.add_metric([model], stats["extra_calls"])
+            extra_tokens.add_metric([model, "prompt"], stats["extra_prompt_tokens"])
+            extra_tokens.add_metric([model, "completion"], stats["extra_completion_tokens"])
+            if stats["ttft_p50_s"] is not None:
+                ttft.add_metric([model], stats["ttft_p50_s"])
+            if stats["tokens_per_second_p50"] is not None:
+                speed.add_metric([model], stats["tokens_per_second_p50"])
+        yield ttft
+        yield speed
+        yield extra_calls
+        yield extra_tokens
+        state = GaugeMetricFamily("symptex_circuit_state", "ChatAI circuit state: 0 closed, 1 half-open, 2 open",
+                                  labels=["endpoint", "model"])
+        opened = CounterMetricFamily("symptex_circuit_opened", "Times a ChatAI circuit opened", labels=["endpoint", "model"])
+        rejected = CounterMetricFamily("symptex_circuit_rejected", "Calls failed fast by an open circuit", labels=["endpoint", "model"])
+        for breaker in breakers.breakers.values():
+            labels = [breaker.endpoint, breaker.model]
+            state.add_metric(labels, {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[breaker.state])
+            opened.add_metric(labels, breaker.opened)
+            rejected.add_metric(labels, breaker.rejected)
+        yield state
+        yield opened
+        yield rejected
+
+
+REGISTRY.register(StatsCollector())
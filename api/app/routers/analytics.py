@@ -0,0 +1,69 @@
+import datetime
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.db import get_db
+from app.db.evaluations import CRITERION_COLUMNS
+from app.db.models import EvaluationResult, as_naive_utc
+
+router = APIRouter()
+
+# Dimensions evaluation scores can be grouped by
+GROUPS = {
+    "patient_file": EvaluationResult.patient_file_id,
+    "condition": EvaluationResult.condition,
+    "model": EvaluationResult.model,
+    "day": func.date(EvaluationResult.created_at),
+}
+
+
+# Evaluation score aggregates endpoint
+@router.get("/analytics/evaluations")
+async def evaluation_stats(
+    group_by: list[str] = Query(["condition"]),
+    patient_file_id: int | None = None,
+    condition: str | None = None,
+    model: str | None = None,
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Average CRI-HT scores of the latest evaluation per session, grouped by patient file, condition, model and/or day"""
+    unknown = [group for group in group_by if group not in GROUPS]
+    if unknown:
+        return PlainTextResponse(f"Invalid group_by: {', '.join(unknown)}", status_code=400)
+
+    columns = [GROUPS[group].label(group) for group in group_by]
+    query = select(
+        *columns,
+        func.count().label("sessions"),
+        func.avg(EvaluationResult.overall_score).label("overall_score"),
+        *(func.avg(getattr(EvaluationResult, column)).label(column) for column in CRITERION_COLUMNS.values()),
+    ).group_by(*columns).order_by(*columns)
+    if patient_file_id is not None:
+        query = query.where(EvaluationResult.patient_file_id == patient_file_id)
+    if condition is not None:
+        query = query.where(EvaluationResult.condition == condition)
+    if model is not None:
+        query = query.where(EvaluationResult.model == model)
+    if since is not None:
+        query = query.where(EvaluationResult.created_at >= as_naive_utc(since))
+    if until is not None:
+        query = query.where(EvaluationResult.created_at < as_naive_utc(until))
+
+    rows = await db.execute(query)
+    return [
+        {
+            **{group: str(row._mapping[group]) if group == "day" else row._mapping[group] for group in group_by},
+            "sessions": row.sessions,
+            "overall_score": float(row.overall_score) if row.overall_score is not None else None,
+            "criteria": {
+                name: float(row._mapping[column]) if row._mapping[column] is not None else None
+                for name, column in CRITERION_COLUMNS.items()
+            },
+        }
+        for row in rows
+    ]
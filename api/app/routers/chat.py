@@ -1,16 +1,31 @@
-from fastapi import (APIRouter, Depends)
+from fastapi import (APIRouter, Depends, Request)
 from fastapi.responses import StreamingResponse, PlainTextResponse
 from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel
+import asyncio
 import logging
+import time
+import uuid
+from contextlib import aclosing
 from typing import AsyncGenerator
-from chains.chat_chain import symptex_model
-from chains.eval_chain import eval_history
-from chains.formatting import format_patient_details
+from chains.admission import CHAT, EVAL, AdmissionRejected, Reservation, admission
+from chains.chat_chain import symptex_model, summaries
+from chains.eval_chain import eval_fan_out, eval_history, RATING_MODEL, ScoreExtractor
+from chains.errors import ErrorText
+from chains.usage import TokenUsageHandler
 
-from app.db.db import get_db
-from sqlalchemy.orm import Session
-from app.db.models import ChatSession, ChatMessage, PatientFile
+from app.db.db import SessionLocal, get_db
+from app.db.write_behind import store, write_behind
+from app.db.evaluations import save_evaluation_result
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import ChatSession, ChatMessage, TokenUsage, utcnow
+from app.cache.patient_profile import patient_profiles
+from app.cache.history import history_cache
+from app.cache.evaluation import evaluation_cache, evaluation_key, replay
+from app.metrics import ADMISSION_WAIT_SECONDS, RequestTimer, StreamTimingHandler, record_cancelled, record_failed, record_tokens
+from app.streams import event_source, follow, reply_events, resume, stream_hub, wants_events
+from app.turns import session_turns
 
 # Set up logging
 logger = logging.getLogger('uvicorn.error')
@@ -18,6 +33,9 @@ logger.setLevel(logging.DEBUG)
 
 router = APIRouter()
 
+# Strong references to fire-and-forget tasks until they are done, with the session they write to
+background_tasks: dict[asyncio.Task, str] = {}
+
 
 # Chat request schema
 class ChatRequest(BaseModel):
@@ -34,9 +52,15 @@ class RateRequest(BaseModel):
 
 # Chat endpoint
 @router.post("/chat")
-async def chat_with_llm(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat_with_llm(request: ChatRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
     """Endpoint to chat with the LLM"""
+    timer = RequestTimer("chat", http_request.state.received_at)
+    timer.record("parse", time.perf_counter() - timer.started)
     logger.debug("Received chat request: %s", request)
+
+    # A client that lost an SSE stream picks up the same generation
+    if last_event_id := http_request.headers.get("last-event-id"):
+        return resume(last_event_id)
    
     # Validate message, condition and talkativeness first
     if not request.message:
@@ -51,113 +75,221 @@ async def chat_with_llm(request: ChatRequest, db: Session = Depends(get_db)):
     if request.talkativeness not in ["kurz angebunden", "ausgewogen", "ausschweifend"]:
         logger.error("Invalid talkativeness: %s", request.talkativeness)
         raise PlainTextResponse(f"Invalid talkativeness: {request.talkativeness}", status_code=400)
-    
-    # Get patient profile from database
-    patient_file = db.query(PatientFile).filter(PatientFile.id == request.patient_file_id).first()
-    if not patient_file:
+
+    # Get rendered patient profile (cached per patient file)
+    with timer.stage("patient_lookup"):
+        patient_details = await patient_profiles.get(db, request.patient_file_id)
+    if patient_details is None:
         return PlainTextResponse("Patient not found", status_code=404)
-    patient_details = format_patient_details(patient_file)
-
-    # Create or get chat session
-    session = db.query(ChatSession).filter(
-        ChatSession.id == request.session_id
-    ).first()
-    if not session:
-        session = ChatSession(
-            id=request.session_id,
-            patient_file_id=request.patient_file_id
-        )
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-
-     # Get previous messages from database
-    previous_messages = []
-    chat_history = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session.id
-    ).order_by(ChatMessage.timestamp.asc()).all()
-    
-    for msg in chat_history:
-        if msg.role == "user":
-            previous_messages.append(HumanMessage(content=msg.content))
-        elif msg.role == "patient":
-            previous_messages.append(AIMessage(content=msg.content))
-
-
-    # Store message
-    message = ChatMessage(
-        session_id=session.id,
-        role="user",
-        content=request.message
-    )
-    db.add(message)
-    db.commit()
+    # The request's session stays open while the response streams; do not keep the lookup's transaction
+    await db.commit()
 
-    try:
-        llm_response = ""
+    # A repeated request (double submit, retry after a timeout) follows the generation of the first one
+    idempotency_key = http_request.headers.get("idempotency-key")
+    if idempotency_key:
+        idempotency_key = f"{request.session_id}:{idempotency_key}"
+        if (stream := stream_hub.find(idempotency_key)) is not None:
+            logger.debug("Request of session %s attached to stream %s", request.session_id, stream.id)
+            return follow(stream, http_request)
+
+    # Turned away before anything is stored if the model's wait queue is full
+    place = queue_place(request.model)
+    if isinstance(place, PlainTextResponse):
+        return place
 
+    # No await from here until the stream is registered under the Idempotency-Key
+    try:
         # Stream response and store LLM message
-        async def generate_and_store():
-            nonlocal llm_response
-            try:
-                messages = previous_messages + [HumanMessage(content=request.message)]
-                async for chunk in stream_response(
-                    message=request.message,
-                    model=request.model,
-                    condition=request.condition,
-                    talkativeness=request.talkativeness,
-                    patient_details=patient_details,
-                    session_id=request.session_id,
-                    previous_messages=messages
-                ):
-                    llm_response += chunk
-                    yield chunk
-                
-                # After streaming is complete, store LLM message
-                llm_message = ChatMessage(
+        async def generate_and_store(db: AsyncSession, usage: TokenUsageHandler):
+            # Turns of a session run one after the other, from reading the history to storing the reply
+            async with session_turns.turn(request.session_id) as waited:
+                timer.record("turn_wait", waited)
+
+                # Create or get chat session (committed right away, queued messages reference it)
+                with timer.stage("session"):
+                    session = await db.get(ChatSession, request.session_id)
+                    if not session:
+                        session = ChatSession(
+                            id=request.session_id,
+                            patient_file_id=request.patient_file_id
+                        )
+                        db.add(session)
+                        await db.commit()
+                        history_cache.start(session.id)
+
+                # Get previous messages (cached per session, loaded from database on a miss)
+                with timer.stage("history_load"):
+                    previous_messages = await history_cache.get(db, session.id)
+
+                # Stored together with the reply: a failed turn leaves nothing in the transcript or the context
+                message = ChatMessage(
                     session_id=session.id,
-                    role="patient",
-                    content=llm_response
+                    role="user",
+                    content=request.message,
+                    timestamp=utcnow(),
                 )
-                db.add(llm_message)
-                db.commit()
-            finally:
-                db.close()
-
-        return StreamingResponse(
-            generate_and_store(), 
-            media_type="text/plain"
+                # End the read transaction, no connection is held while waiting for a slot and streaming
+                await db.commit()
+
+                llm_response = ""
+                # Set once an error was streamed in place of (the rest of) the reply
+                failed = False
+                timing = StreamTimingHandler(timer, request.model)
+                try:
+                    # One of the model's slots for the whole turn, including context summaries
+                    async with admission.slot(request.model, CHAT, session.id, reservation=place) as slot:
+                        timer.record("admission", slot.waited)
+                        ADMISSION_WAIT_SECONDS.labels(request.model, "chat").observe(slot.waited)
+                        # Closing the stream cancels the LangGraph run and the ChatAI request
+                        async with aclosing(in_own_task(stream_response(
+                            message=request.message,
+                            model=request.model,
+                            condition=request.condition,
+                            talkativeness=request.talkativeness,
+                            patient_details=patient_details,
+                            session_id=request.session_id,
+                            previous_messages=previous_messages,
+                            callbacks=[usage, timing],
+                        ))) as chunks:
+                            async for chunk in chunks:
+                                if isinstance(chunk, ErrorText):
+                                    failed = True
+                                else:
+                                    llm_response += chunk
+                                yield chunk
+                except (asyncio.CancelledError, GeneratorExit):
+                    if failed:
+                        record_failed("chat", request.model, usage.prompt_tokens, usage.completion_tokens)
+                    else:
+                        # Client disconnected (or the session was reset): stop generating, keep what was said
+                        logger.debug("Chat stream of session %s cancelled after %d characters", session.id, len(llm_response))
+                        store_truncated_reply(request, message, llm_response, usage)
+                    raise
+                timing.finish()
+                if failed:
+                    # The student sees the error and can ask again; neither message is kept
+                    logger.warning("Chat turn of session %s failed, not storing it", session.id)
+                    record_failed("chat", request.model, usage.prompt_tokens, usage.completion_tokens)
+                    return
+
+                # After streaming is complete, store the user message and LLM message
+                with timer.stage("persist"):
+                    llm_message = ChatMessage(
+                        session_id=session.id,
+                        role="patient",
+                        content=llm_response
+                    )
+                    await store(db, message, llm_message, TokenUsage(
+                        session_id=session.id,
+                        kind="chat",
+                        model=request.model,
+                        condition=request.condition,
+                        talkativeness=request.talkativeness,
+                        prompt_tokens=usage.prompt_tokens,
+                        completion_tokens=usage.completion_tokens,
+                        estimated=usage.estimated,
+                    ))
+                history_cache.append(session.id, HumanMessage(content=request.message))
+                history_cache.append(session.id, AIMessage(content=llm_response))
+                record_tokens("chat", request.model, usage.prompt_tokens, usage.completion_tokens)
+
+        # Stages until the stream starts; streaming stages are exported to /metrics
+        headers = {"Server-Timing": timer.server_timing()}
+        # With an Idempotency-Key the generation is shared, so repeated requests can attach to it
+        if wants_events(http_request) or idempotency_key:
+            return start_stream(generate_and_store, http_request, headers, request.session_id, idempotency_key, place)
+        return AdmittedStreamingResponse(
+            generate_and_store(db, TokenUsageHandler()),
+            place,
+            media_type="text/plain",
+            headers=headers,
         )
     except Exception as e:
         logger.error("Error in chat_with_llm endpoint: %s", str(e))
+        place.release()
         return PlainTextResponse("Internal server error", status_code=500)
     
+def store_truncated_reply(request: ChatRequest, message: ChatMessage, partial_reply: str, usage: TokenUsageHandler) -> None:
+    """
+    Record the tokens of a cancelled chat turn and persist its user message
+    and partial reply, flagged as truncated. A turn cancelled before the
+    first token is not stored, like a failed one. The request's task is being
+    cancelled, so the rows are written by a separate task with its own session.
+    """
+    usage.abort(partial_reply)
+    record_cancelled("chat", request.model, usage.prompt_tokens, usage.completion_tokens)
+    if not partial_reply:
+        # An empty patient turn would end up in the transcript and the context
+        return
+    rows = [
+        message,
+        ChatMessage(session_id=request.session_id, role="patient", content=partial_reply, truncated=True),
+        TokenUsage(
+            session_id=request.session_id,
+            kind="chat",
+            model=request.model,
+            condition=request.condition,
+            talkativeness=request.talkativeness,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            estimated=usage.estimated,
+        ),
+    ]
+    history_cache.append(request.session_id, HumanMessage(content=message.content))
+    history_cache.append(request.session_id, AIMessage(content=partial_reply))
+
+    async def persist():
+        try:
+            async with SessionLocal() as db:
+                await store(db, *rows)
+        except Exception as e:
+            # E.g. the session was reset in the meantime
+            logger.error("Error storing truncated reply of session %s: %s", request.session_id, str(e))
+
+    task = asyncio.create_task(persist())
+    background_tasks[task] = request.session_id
+    task.add_done_callback(lambda done: background_tasks.pop(done, None))
+
 # Reset endpoint
 @router.post("/reset/{session_id}")
-async def reset_memory(session_id: str, db: Session = Depends(get_db)):
+async def reset_memory(session_id: str, db: AsyncSession = Depends(get_db)):
     """Reset the LangChain memory for a specific session"""
     try:
+        # Stop SSE generations of the session, their partial replies must not outlive the reset
+        await stream_hub.cancel_session(session_id)
+        # Truncated replies of its cancelled turns are written before the session is deleted, not after
+        pending = {task for task, task_session in background_tasks.items() if task_session == session_id}
+        if pending:
+            await asyncio.wait(pending)
+        # Queued messages of the session would otherwise be inserted after the delete
+        await write_behind.flush()
         # Delete messages from db
-        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
+        await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
         # Delete the session itself
-        db.query(ChatSession).filter(ChatSession.id == session_id).delete()
-        db.commit()
+        await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+        await db.commit()
+        history_cache.invalidate(session_id)
+        summaries.invalidate(session_id)
         return PlainTextResponse(f"Chat data deleted for session {session_id}", status_code=200)
     except Exception as e:
         logger.error(f"Error deleting session {session_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return PlainTextResponse("Error deleting session", status_code=500)
-    finally:
-        db.close()
     
-# Evaluation endpoint
+# Evaluation endpoint (fallback for clients that post the transcript)
 @router.post("/eval")
-async def eval_chat(request: RateRequest):
-    # Convert frontend messages to LangChain messages
-    from langchain_core.messages import HumanMessage, AIMessage
+async def eval_chat(request: RateRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
+    timer = RequestTimer("eval", http_request.state.received_at)
+    timer.record("parse", time.perf_counter() - timer.started)
+    if last_event_id := http_request.headers.get("last-event-id"):
+        return resume(last_event_id)
+    place = queue_place(RATING_MODEL)
+    if isinstance(place, PlainTextResponse):
+        return place
 
-    async def generate_eval():
+    async def generate_eval(db: AsyncSession, usage: TokenUsageHandler):
         try:
+            # Convert frontend messages to LangChain messages
             lc_messages = []
             for msg in request.messages:
                 if msg["role"] == "user":
@@ -165,23 +297,252 @@ async def eval_chat(request: RateRequest):
                 elif msg["role"] == "patient":
                     lc_messages.append(AIMessage(content=msg["output"]))
 
-            # Stream evaluation chunks
-            async for chunk in eval_history(lc_messages):
+            async for chunk in stream_evaluation(lc_messages, timer, db, usage=usage, reservation=place):
                 yield chunk
-            
         except Exception as e:
             logger.error(f"Error generating evaluation: {str(e)}")
-            yield f"Entschuldigung, es ist ein Fehler aufgetreten: {str(e)}"
+            yield ErrorText(f"Entschuldigung, es ist ein Fehler aufgetreten: {str(e)}")
 
     try:
-        return StreamingResponse(
-            generate_eval(),
-            media_type="text/plain"
+        headers = {"Server-Timing": timer.server_timing()}
+        if wants_events(http_request):
+            return start_stream(generate_eval, http_request, headers, reservation=place)
+        return AdmittedStreamingResponse(
+            generate_eval(db, TokenUsageHandler()),
+            place,
+            media_type="text/plain",
+            headers=headers,
         )
     except Exception as e:
         logger.error(f"Error rating chat: {str(e)}")
+        place.release()
         return PlainTextResponse("Error rating chat", status_code=500)
 
+# Session evaluation endpoint
+@router.post("/eval/{session_id}")
+async def eval_session(session_id: str, http_request: Request, db: AsyncSession = Depends(get_db)):
+    """Evaluate a session from its stored history instead of a client-posted transcript"""
+    timer = RequestTimer("eval", http_request.state.received_at)
+    timer.record("parse", time.perf_counter() - timer.started)
+    if last_event_id := http_request.headers.get("last-event-id"):
+        return resume(last_event_id)
+
+    # Same history the chat uses (cached per session, loaded from database on a miss)
+    with timer.stage("history_load"):
+        messages = await history_cache.get(db, session_id)
+    if not messages:
+        if await db.get(ChatSession, session_id) is None:
+            return PlainTextResponse("Session not found", status_code=404)
+        return PlainTextResponse("Session has no messages to evaluate", status_code=400)
+    # The request's session stays open while the response streams; do not keep the read transaction
+    await db.commit()
+    place = queue_place(RATING_MODEL)
+    if isinstance(place, PlainTextResponse):
+        return place
+
+    def evaluate(db: AsyncSession, usage: TokenUsageHandler):
+        return stream_evaluation(messages, timer, db, session_id=session_id, usage=usage, reservation=place)
+
+    headers = {"Server-Timing": timer.server_timing()}
+    if wants_events(http_request):
+        return start_stream(evaluate, http_request, headers, session_id, reservation=place)
+    return AdmittedStreamingResponse(
+        evaluate(db, TokenUsageHandler()),
+        place,
+        media_type="text/plain",
+        headers=headers,
+    )
+
+
+# Resume endpoint for SSE streams
+@router.get("/streams/{stream_id}")
+async def follow_stream(stream_id: str, http_request: Request):
+    """Replay a stream from the start, or after the event given as Last-Event-ID, and follow it"""
+    if last_event_id := http_request.headers.get("last-event-id"):
+        if not last_event_id.startswith(f"{stream_id}:"):
+            return PlainTextResponse("Last-Event-ID belongs to another stream", status_code=400)
+        return resume(last_event_id)
+    stream = stream_hub.get(stream_id)
+    if stream is None:
+        return PlainTextResponse("Stream not found", status_code=404)
+    return event_source(stream)
+
+
+def queue_place(model: str) -> Reservation | PlainTextResponse:
+    """A place in the model's admission queue, or a 429 response with Retry-After if it is full."""
+    try:
+        return admission.reserve(model)
+    except AdmissionRejected as e:
+        logger.warning("Rejected request for %s, admission queue full", model)
+        return PlainTextResponse(str(e), status_code=429, headers={"Retry-After": str(e.retry_after)})
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Plain text response that gives up the request's queue place if it ends
+    before the generation took it, e.g. when the client left before the
+    first chunk and the generator never ran.
+    """
+
+    def __init__(self, content, reservation: Reservation, **kwargs):
+        super().__init__(content, **kwargs)
+        self.reservation = reservation
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.reservation.release()
+
+
+def start_stream(
+    reply,
+    http_request: Request,
+    headers: dict,
+    session_id: str | None = None,
+    idempotency_key: str | None = None,
+    reservation: Reservation | None = None,
+):
+    """
+    Run `reply(db, usage)` detached from the request and send its typed events
+    as SSE, or its text if the client did not ask for SSE. It gets its own
+    database session because the request's session is closed with the
+    response, while the generation continues if an SSE client disconnects so
+    it can reconnect with Last-Event-ID. Plain text clients cannot resume;
+    their generation stops as soon as no client follows it. The request's
+    queue `reservation`, if not taken by the generation, is released with it.
+    """
+    async def events():
+        usage = TokenUsageHandler()
+        async with SessionLocal() as db:
+            async for event in reply_events(reply(db, usage), usage):
+                yield event
+
+    stream = stream_hub.start(
+        events(),
+        key=session_id,
+        idempotency_key=idempotency_key,
+        abandon_timeout=None if wants_events(http_request) else 0,
+    )
+    if reservation is not None:
+        # Also if the generation is cancelled before it started
+        stream.task.add_done_callback(lambda task: reservation.release())
+    return follow(stream, http_request, headers)
+
+
+async def stream_evaluation(
+    messages: list,
+    timer: RequestTimer,
+    db: AsyncSession,
+    session_id: str | None = None,
+    usage: TokenUsageHandler | None = None,
+    reservation: Reservation | None = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Stream the evaluation of a conversation, or replay it if the same transcript
+    was already rated, and record its token usage and, for a session, its scores.
+
+    Args:
+        messages (list): The conversation as LangChain messages.
+        timer (RequestTimer): Timer of the evaluation request.
+        db (AsyncSession): Session used to store the token usage, evaluation and scores.
+        session_id (str, optional): The evaluated chat session, if known.
+        usage (TokenUsageHandler, optional): Collects the token usage of a new evaluation.
+        reservation (Reservation, optional): The request's place in the rating model's queue.
+    """
+    # Scores are picked up while the rubric streams
+    scores = ScoreExtractor()
+    key = evaluation_key(messages)
+    with timer.stage("eval_cache"):
+        cached = await evaluation_cache.get(db, key)
+    # No connection is held while waiting for a slot and streaming the evaluation
+    await db.commit()
+    if cached is not None:
+        # A replay needs no slot
+        if reservation is not None:
+            reservation.release()
+        async for chunk in replay(cached):
+            scores.feed(chunk)
+            yield chunk
+    else:
+        usage = usage or TokenUsageHandler()
+        timing = StreamTimingHandler(timer, RATING_MODEL)
+        feedback = ""
+        failed = False
+        try:
+            # A parallel evaluation reserves a slot per criterion call it runs at once
+            calls = min(eval_fan_out(), admission.gate(RATING_MODEL).limit)
+            # Evaluations queue behind chat turns; posted transcripts count as a session of their own
+            async with admission.slot(RATING_MODEL, EVAL, session_id or uuid.uuid4().hex, calls, reservation) as slot:
+                timer.record("admission", slot.waited)
+                ADMISSION_WAIT_SECONDS.labels(RATING_MODEL, "eval").observe(slot.waited)
+                evaluation = eval_history(messages, callbacks=[usage, timing], concurrency=calls)
+                async with aclosing(in_own_task(evaluation)) as chunks:
+                    async for chunk in chunks:
+                        failed = failed or isinstance(chunk, ErrorText)
+                        feedback += chunk
+                        scores.feed(chunk)
+                        yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client disconnected: stop rating; a partial evaluation is neither cached nor scored
+            usage.abort(feedback)
+            record_cancelled("eval", RATING_MODEL, usage.prompt_tokens, usage.completion_tokens)
+            raise
+        timing.finish()
+        if failed:
+            # Like a failed chat turn: neither cached nor scored, nor stored as an evaluation's usage
+            record_failed("eval", RATING_MODEL, usage.prompt_tokens, usage.completion_tokens)
+            return
+        record_tokens("eval", RATING_MODEL, usage.prompt_tokens, usage.completion_tokens)
+    scores.close()
+
+    # Accounting, caching and scores must not turn a delivered evaluation into an error
+    try:
+        with timer.stage("persist"):
+            if cached is None:
+                await store(db, TokenUsage(
+                    session_id=session_id,
+                    kind="eval",
+                    model=RATING_MODEL,
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens,
+                    estimated=usage.estimated,
+                ))
+                await evaluation_cache.put(db, key, feedback)
+            if session_id is not None:
+                await save_evaluation_result(db, session_id, scores)
+    except Exception as e:
+        logger.error("Error storing evaluation: %s", str(e))
+
+
+async def in_own_task(chunks: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Iterate an LLM stream in a task of its own and cancel that task when the
+    consumer stops early. Starlette cancels a streaming response on client
+    disconnect through an anyio cancel scope, which also cancels every await
+    of LangGraph's cleanup and leaves the model call running; a plain
+    task.cancel() lets the run and the ChatAI request shut down.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def pump():
+        try:
+            async with aclosing(chunks) as stream:
+                async for chunk in stream:
+                    queue.put_nowait(chunk)
+        finally:
+            queue.put_nowait(end)
+
+    task = asyncio.create_task(pump())
+    try:
+        while (chunk := await queue.get()) is not end:
+            yield chunk
+        # Raise what ended the stream, if anything
+        await task
+    finally:
+        task.cancel()
+
 
 async def stream_response(
     message: str, 
@@ -190,7 +551,8 @@ async def stream_response(
     talkativeness: str, 
     patient_details: str, 
     session_id: str,
-    previous_messages: list
+    previous_messages: list,
+    callbacks: list | None = None,
 ) -> AsyncGenerator[str, None]:
     """
     Stream responses from the symptex_model.
@@ -202,7 +564,8 @@ async def stream_response(
         talkativeness (str): The level of talkativeness for the response.
         patient_details (str): Details about the patient.
         session_id (str): The ID of the chat session.
-        previous_messages (list): A list of previous messages in the chat.
+        previous_messages (list): A list of previous messages in the chat, without the current message.
+        callbacks (list, optional): Callback handlers for all LLM calls (token usage, timing).
 
     Returns:
         str: The response message from the LLM.
@@ -210,20 +573,23 @@ async def stream_response(
     logger.debug("Starting to stream response for message: %s", message)
 
     try:
-        async for msg, metadata in symptex_model.astream(
+        async with aclosing(symptex_model.astream(
             {
                 "messages": previous_messages + [HumanMessage(message)],
                 "model": model,
                 "condition": condition,
                 "talkativeness": talkativeness,
                 "patient_details": patient_details,
+                "session_id": session_id,
             },
-            stream_mode="messages"
-        ):
-            # Get AIMessageChunks only
-            if msg.content and not isinstance(msg, HumanMessage):
-                # logger.debug(msg.content)
-                yield msg.content
+            stream_mode="messages",
+            config={"callbacks": callbacks} if callbacks else None,
+        )) as stream:
+            async for msg, metadata in stream:
+                # Get AIMessageChunks only
+                if msg.content and not isinstance(msg, HumanMessage):
+                    # logger.debug(msg.content)
+                    yield msg.content
     except Exception as e:
         logger.error("Error while streaming response: %s", str(e))
-        yield f"Entschuldigung, es ist ein Fehler aufgetreten: {str(e)}"
+        yield ErrorText(f"Entschuldigung, es ist ein Fehler aufgetreten: {str(e)}")
@@ -0,0 +1,101 @@
+import datetime
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.db import get_db, pool_monitor
+from app.db.models import TokenUsage, as_naive_utc
+from app.db.write_behind import write_behind
+from app.metrics import cache_stats as collect_cache_stats
+from app.streams import stream_hub
+from app.turns import session_turns
+from chains.admission import admission
+from chains.routing import model_router
+
+router = APIRouter()
+
+
+# Connection pool stats endpoint
+@router.get("/metrics/pool")
+async def pool_stats():
+    """Live connection pool statistics"""
+    return pool_monitor.stats()
+
+
+# Cache stats endpoint
+@router.get("/metrics/cache")
+async def cache_stats():
+    """Hit/miss counters and sizes of the in-process caches"""
+    return collect_cache_stats()
+
+
+# Write-behind queue stats endpoint
+@router.get("/metrics/write-behind")
+async def write_behind_stats():
+    """Queued rows and batch flushes of the write-behind queue"""
+    return write_behind.stats()
+
+
+# SSE stream hub stats endpoint
+@router.get("/metrics/streams")
+async def stream_stats():
+    """Running and resumable generations, and chat turns waiting for their session"""
+    return {**stream_hub.stats(), "turns": session_turns.stats()}
+
+
+# Admission control stats endpoint
+@router.get("/metrics/admission")
+async def admission_stats():
+    """Slots in use, waiting requests and rejections per model"""
+    return admission.stats()
+
+
+# Model routing stats endpoint
+@router.get("/metrics/routing")
+async def routing_stats():
+    """Rolling TTFT and throughput per model, reroutes and hedges (MODEL_ROUTING)"""
+    return model_router.stats()
+
+
+# Token usage endpoint
+@router.get("/metrics/usage")
+async def usage_stats(
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Token usage aggregated by kind (chat/eval), model, condition and talkativeness"""
+    query = select(
+        TokenUsage.kind,
+        TokenUsage.model,
+        TokenUsage.condition,
+        TokenUsage.talkativeness,
+        func.count().label("requests"),
+        func.sum(TokenUsage.prompt_tokens).label("prompt_tokens"),
+        func.sum(TokenUsage.completion_tokens).label("completion_tokens"),
+        func.avg(TokenUsage.prompt_tokens).label("avg_prompt_tokens"),
+        func.avg(TokenUsage.completion_tokens).label("avg_completion_tokens"),
+        func.sum(cast(TokenUsage.estimated, Integer)).label("estimated_requests"),
+    ).group_by(TokenUsage.kind, TokenUsage.model, TokenUsage.condition, TokenUsage.talkativeness)
+    if since is not None:
+        query = query.where(TokenUsage.created_at >= as_naive_utc(since))
+    if until is not None:
+        query = query.where(TokenUsage.created_at < as_naive_utc(until))
+
+    rows = await db.execute(query)
+    return [
+        {
+            "kind": row.kind,
+            "model": row.model,
+            "condition": row.condition,
+            "talkativeness": row.talkativeness,
+            "requests": row.requests,
+            "prompt_tokens": int(row.prompt_tokens or 0),
+            "completion_tokens": int(row.completion_tokens or 0),
+            "avg_prompt_tokens": float(row.avg_prompt_tokens or 0),
+            "avg_completion_tokens": float(row.avg_completion_tokens or 0),
+            "estimated_requests": int(row.estimated_requests or 0),
+        }
+        for row in rows
+    ]
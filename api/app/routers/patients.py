@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.cache.patient_profile import patient_profiles
+
+router = APIRouter()
+
+
+# Patient file invalidation endpoint
+@router.post("/patients/{patient_file_id}/invalidate")
+async def invalidate_patient(patient_file_id: int):
+    """Drop the cached profile of a patient file that was edited outside Symptex"""
+    patient_profiles.invalidate(patient_file_id)
+    return PlainTextResponse(f"Patient profile invalidated for patient file {patient_file_id}", status_code=200)
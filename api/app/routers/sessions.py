@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.db import get_db
+from app.db.messages import MAX_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor, fetch_page
+from app.db.models import ChatSession
+from app.db.write_behind import write_behind
+
+router = APIRouter()
+
+
+# Session history endpoint
+@router.get("/sessions/{session_id}/messages")
+async def session_messages(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    before: str | None = None,
+    after: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Page through the messages of a session, starting with the most recent ones.
+    Pass `before` to get the previous page and `after` to get newer messages.
+    """
+    if before and after:
+        return PlainTextResponse("Use either before or after, not both", status_code=400)
+    try:
+        before_position = decode_cursor(before) if before else None
+        after_position = decode_cursor(after) if after else None
+    except InvalidCursor:
+        return PlainTextResponse("Invalid cursor", status_code=400)
+
+    # Queued messages of the session must be in the database before it is read
+    await write_behind.flush()
+    rows, has_more = await fetch_page(db, session_id, limit, before=before_position, after=after_position)
+    if not rows and before_position is None and after_position is None and await db.get(ChatSession, session_id) is None:
+        return PlainTextResponse("Session not found", status_code=404)
+
+    # Paging forward, the message at the `after` cursor is always older than this page
+    has_older = has_more if after_position is None else True
+    if rows and has_older:
+        older = encode_cursor(rows[0].timestamp, rows[0].id)
+    else:
+        older = after if after_position is not None else None
+    return {
+        "messages": [
+            {"id": row.id, "role": row.role, "content": row.content, "timestamp": row.timestamp.isoformat()}
+            for row in rows
+        ],
+        # Cursor for the previous page, None at the start of the conversation
+        "before": older,
+        # Cursor for messages newer than this page (poll with it)
+        "after": encode_cursor(rows[-1].timestamp, rows[-1].id) if rows else after,
+    }
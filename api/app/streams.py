@@ -0,0 +1,309 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from sse_starlette import EventSourceResponse, ServerSentEvent
+
+from chains.errors import ErrorText
+from chains.usage import TokenUsageHandler
+
+# Set up logging
+logger = logging.getLogger('streams')
+logger.setLevel(logging.DEBUG)
+
+# Events kept per stream for clients that reconnect with Last-Event-ID
+STREAM_REPLAY_SIZE = int(os.environ.get("STREAM_REPLAY_SIZE", "4096"))
+# Seconds a finished stream can still be replayed
+STREAM_RETENTION = float(os.environ.get("STREAM_RETENTION", "300"))
+# Seconds a generation keeps running without any connected client before it is cancelled
+STREAM_ABANDON_TIMEOUT = float(os.environ.get("STREAM_ABANDON_TIMEOUT", "30"))
+# Seconds running streams get to finish (and persist their reply) at shutdown
+STREAM_SHUTDOWN_TIMEOUT = float(os.environ.get("STREAM_SHUTDOWN_TIMEOUT", "30"))
+
+
+@dataclass
+class Event:
+    id: int
+    event: str
+    data: str
+
+
+class ReplayExpired(Exception):
+    """The events after the client's Last-Event-ID are no longer buffered."""
+
+
+class Stream:
+    """
+    Events of one generation, numbered from 0. The newest STREAM_REPLAY_SIZE
+    events are kept so any number of subscribers can follow the stream or
+    pick it up again after a dropped connection.
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        replay_size: int,
+        key: str | None = None,
+        idempotency_key: str | None = None,
+        abandon_timeout: float | None = None,
+    ):
+        self.id = stream_id
+        self.key = key
+        self.idempotency_key = idempotency_key
+        self.abandon_timeout = abandon_timeout
+        self.subscribers = 0
+        self.events: deque[Event] = deque(maxlen=replay_size)
+        self.next_id = 0
+        self.finished_at: float | None = None
+        self.changed = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: str, data: dict) -> None:
+        self.events.append(Event(self.next_id, event, json.dumps(data, ensure_ascii=False)))
+        self.next_id += 1
+        self.wake()
+
+    def finish(self) -> None:
+        self.finished_at = time.monotonic()
+        self.wake()
+
+    def wake(self) -> None:
+        # Waiting subscribers hold the old event; the next wait uses a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def event_id(self, event: Event) -> str:
+        return f"{self.id}:{event.id}"
+
+    async def subscribe(self, after: int | None = None) -> AsyncIterator[Event]:
+        """Yield the events after `after` (all buffered ones if None), then follow the stream until it ends."""
+        position = 0 if after is None else after + 1
+        while True:
+            changed = self.changed
+            oldest = self.events[0].id if self.events else self.next_id
+            if position < oldest:
+                raise ReplayExpired(f"Events of stream {self.id} before {oldest} are no longer buffered")
+            for event in list(self.events):
+                if event.id >= position:
+                    yield event
+                    position = event.id + 1
+            if self.finished and position >= self.next_id:
+                return
+            await changed.wait()
+
+
+def parse_event_id(event_id: str) -> tuple[str, int] | None:
+    """Split a Last-Event-ID into stream id and event number."""
+    stream_id, _, number = event_id.rpartition(":")
+    if not stream_id or not number.isdigit():
+        return None
+    return stream_id, int(number)
+
+
+class StreamHub:
+    """
+    Runs generations detached from the request that started them. A producer
+    publishes typed events into its Stream, so a client that loses the
+    connection resumes the same generation instead of starting a new LLM call.
+    A repeated request with the same Idempotency-Key follows the stream of
+    the first one. Streams live in this process only.
+    """
+
+    def __init__(self, replay_size: int, retention: float, abandon_timeout: float):
+        self.replay_size = replay_size
+        self.retention = retention
+        self.abandon_timeout = abandon_timeout
+        self.streams: dict[str, Stream] = {}
+        # Idempotency-Key to stream id, while the stream is retained
+        self.idempotent: dict[str, str] = {}
+        self.started = 0
+        self.resumed = 0
+        self.expired_replays = 0
+        self.abandoned = 0
+        self.deduplicated = 0
+
+    def start(
+        self,
+        events: AsyncIterator[tuple[str, dict]],
+        key: str | None = None,
+        idempotency_key: str | None = None,
+        abandon_timeout: float | None = None,
+    ) -> Stream:
+        """
+        Publish (event, data) pairs from `events` into a new stream in the
+        background; `key` is its chat session. Without clients the stream is
+        cancelled after `abandon_timeout` seconds (STREAM_ABANDON_TIMEOUT if None).
+        """
+        self.prune()
+        stream = Stream(uuid.uuid4().hex, self.replay_size, key, idempotency_key, abandon_timeout)
+        self.streams[stream.id] = stream
+        if idempotency_key is not None:
+            self.idempotent[idempotency_key] = stream.id
+        stream.task = asyncio.create_task(self.produce(stream, events))
+        self.started += 1
+        return stream
+
+    async def produce(self, stream: Stream, events: AsyncIterator[tuple[str, dict]]) -> None:
+        try:
+            async for event, data in events:
+                stream.publish(event, data)
+        except asyncio.CancelledError:
+            stream.publish("error", {"message": "Generierung abgebrochen"})
+            raise
+        except Exception as e:
+            logger.error("Stream %s failed: %s", stream.id, str(e))
+            stream.publish("error", {"message": str(e)})
+        finally:
+            stream.finish()
+
+    def get(self, stream_id: str) -> Stream | None:
+        return self.streams.get(stream_id)
+
+    def find(self, idempotency_key: str) -> Stream | None:
+        """The stream started by an earlier request with this Idempotency-Key, if it is still retained."""
+        stream = self.streams.get(self.idempotent.get(idempotency_key, ""))
+        if stream is not None:
+            self.deduplicated += 1
+        return stream
+
+    def leave(self, stream: Stream) -> None:
+        """A client disconnected; cancel the generation if nobody reconnects in time."""
+        stream.subscribers -= 1
+        if stream.subscribers == 0 and not stream.finished:
+            timeout = self.abandon_timeout if stream.abandon_timeout is None else stream.abandon_timeout
+            asyncio.get_running_loop().call_later(timeout, self.cancel_abandoned, stream)
+
+    def cancel_abandoned(self, stream: Stream) -> None:
+        if stream.subscribers == 0 and not stream.finished and stream.task is not None:
+            logger.debug("Cancelling stream %s, no client connected", stream.id)
+            self.abandoned += 1
+            stream.task.cancel()
+
+    async def cancel_session(self, key: str) -> None:
+        """Cancel the running generations of a chat session and wait until they stopped."""
+        tasks = [s.task for s in self.streams.values() if s.key == key and s.task is not None and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def prune(self) -> None:
+        """Forget finished streams past their retention."""
+        cutoff = time.monotonic() - self.retention
+        for stream_id in [s.id for s in self.streams.values() if s.finished and s.finished_at < cutoff]:
+            stream = self.streams.pop(stream_id)
+            if stream.idempotency_key is not None:
+                self.idempotent.pop(stream.idempotency_key, None)
+
+    async def close(self) -> None:
+        """Let running streams finish within the shutdown timeout, then cancel the rest."""
+        tasks = [s.task for s in self.streams.values() if s.task is not None and not s.task.done()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=STREAM_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("Cancelled %d streams at shutdown", len(pending))
+                await asyncio.wait(pending)
+        self.streams.clear()
+        self.idempotent.clear()
+
+    def stats(self) -> dict:
+        return {
+            "active": sum(not s.finished for s in self.streams.values()),
+            "retained": sum(s.finished for s in self.streams.values()),
+            "started": self.started,
+            "resumed": self.resumed,
+            "expired_replays": self.expired_replays,
+            "abandoned": self.abandoned,
+            "deduplicated": self.deduplicated,
+        }
+
+
+async def reply_events(chunks: AsyncIterator[str], usage: TokenUsageHandler) -> AsyncIterator[tuple[str, dict]]:
+    """Type the chunks of a reply: tokens, then usage and done, or an error instead of the last two."""
+    failed = False
+    # Consumed to the end even after an error, the reply records its failed generation after its last chunk
+    async for chunk in chunks:
+        if isinstance(chunk, ErrorText):
+            failed = True
+            yield "error", {"message": str(chunk)}
+        else:
+            yield "token", {"text": chunk}
+    if failed:
+        return
+    yield "usage", {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "estimated": usage.estimated,
+    }
+    yield "done", {}
+
+
+def event_source(stream: Stream, after: int | None = None, headers: dict | None = None) -> EventSourceResponse:
+    """SSE response following the stream from the event after `after`."""
+    async def events():
+        stream.subscribers += 1
+        try:
+            async for event in stream.subscribe(after):
+                yield ServerSentEvent(event.data, event=event.event, id=stream.event_id(event))
+        except ReplayExpired as e:
+            stream_hub.expired_replays += 1
+            yield ServerSentEvent(json.dumps({"message": str(e)}), event="error")
+        finally:
+            stream_hub.leave(stream)
+
+    return EventSourceResponse(events(), headers={"X-Stream-ID": stream.id, **(headers or {})})
+
+
+def text_source(stream: Stream, headers: dict | None = None) -> StreamingResponse:
+    """Plain text response following the stream: the reply text, and error messages in place of the rest."""
+    async def text():
+        stream.subscribers += 1
+        try:
+            async for event in stream.subscribe():
+                if event.event == "token":
+                    yield json.loads(event.data)["text"]
+                elif event.event == "error":
+                    yield json.loads(event.data)["message"]
+        finally:
+            stream_hub.leave(stream)
+
+    return StreamingResponse(text(), media_type="text/plain", headers={"X-Stream-ID": stream.id, **(headers or {})})
+
+
+def follow(stream: Stream, http_request: Request, headers: dict | None = None) -> Response:
+    """Response following the stream, as SSE if the client asked for it, else as plain text."""
+    if wants_events(http_request):
+        return event_source(stream, headers=headers)
+    return text_source(stream, headers)
+
+
+def wants_events(http_request: Request) -> bool:
+    """Whether the client asked for the SSE protocol instead of plain text."""
+    return "text/event-stream" in http_request.headers.get("accept", "")
+
+
+def resume(last_event_id: str) -> Response:
+    """SSE response continuing the stream after the given event."""
+    parsed = parse_event_id(last_event_id)
+    stream = stream_hub.get(parsed[0]) if parsed else None
+    if stream is None:
+        return PlainTextResponse("Stream not found", status_code=404)
+    stream_hub.resumed += 1
+    return event_source(stream, parsed[1])
+
+
+stream_hub = StreamHub(STREAM_REPLAY_SIZE, STREAM_RETENTION, STREAM_ABANDON_TIMEOUT)
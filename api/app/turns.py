@@ -0,0 +1,49 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class SessionTurns:
+    """
+    One lock per chat session, held from reading the history to storing the
+    reply. Overlapping requests of a session (double submit, retry after a
+    timeout) run one after the other, each on the history including the
+    previous reply, instead of generating from the same history and
+    interleaving their messages. Locks exist only while a turn holds or
+    waits for them.
+    """
+
+    def __init__(self):
+        self.locks: dict[str, asyncio.Lock] = {}
+        self.holders: dict[str, int] = {}
+        self.turns = 0
+        self.serialized = 0
+
+    @asynccontextmanager
+    async def turn(self, session_id: str):
+        """Hold the session's lock for the block; yields the seconds spent waiting for it."""
+        lock = self.locks.setdefault(session_id, asyncio.Lock())
+        self.holders[session_id] = self.holders.get(session_id, 0) + 1
+        try:
+            if lock.locked():
+                self.serialized += 1
+            started = time.perf_counter()
+            async with lock:
+                self.turns += 1
+                yield time.perf_counter() - started
+        finally:
+            self.holders[session_id] -= 1
+            if not self.holders[session_id]:
+                del self.holders[session_id]
+                del self.locks[session_id]
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.locks),
+            "waiting": sum(self.holders.values()) - sum(lock.locked() for lock in self.locks.values()),
+            "turns": self.turns,
+            "serialized": self.serialized,
+        }
+
+
+session_turns = SessionTurns()
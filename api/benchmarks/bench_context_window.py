@@ -0,0 +1,103 @@
+"""
+Benchmark of prompt size and time to first token as a conversation grows.
+
+Plays a long conversation through symptex_model against the local mock ChatAI
+server (with a prefill cost per prompt token), once sending the full history
+(CONTEXT_TOKEN_BUDGET=0) and once with the default context budget and rolling
+summary. Prints the estimated prompt tokens and TTFT every few turns.
+
+Usage (from the api/ folder):
+    python -m benchmarks.bench_context_window --turns 60
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from benchmarks.mock_chatai import run_mock_server
+
+PORT = 8102
+QUESTIONS = [
+    "Wie geht es Ihnen heute?",
+    "Seit wann haben Sie die Schmerzen in der Hüfte?",
+    "Können Sie mir beschreiben, wie der Sturz passiert ist?",
+    "Welche Medikamente nehmen Sie regelmäßig ein?",
+    "Haben Sie Allergien gegen irgendwelche Medikamente?",
+    "Wie ist das bei Ihnen zu Hause, wohnen Sie allein?",
+]
+
+
+async def play(turns: int, budget: int) -> list[tuple[int, float]]:
+    from langchain_core.messages import AIMessage, HumanMessage
+    from chains import chat_chain
+    from chains.patient_data import PATIENT_INNEN, format_patient_details
+    from chains.prompt_registry import prompt_registry
+    from chains.tokens import count_message_tokens, count_tokens
+
+    chat_chain.CONTEXT_TOKEN_BUDGET = budget
+    patient_details = format_patient_details(PATIENT_INNEN["DEFAULT_DEMENTE_PATIENTIN"])
+    system_tokens = count_tokens(prompt_registry.get_prompt("alzheimer", "ausgewogen", patient_details).messages[0].prompt.template)
+    session_id = str(uuid.uuid4())
+    history, results = [], []
+
+    for turn in range(turns):
+        question = HumanMessage(QUESTIONS[turn % len(QUESTIONS)])
+        started, ttft, reply, values = time.perf_counter(), None, "", None
+        async for mode, payload in chat_chain.symptex_model.astream(
+            {
+                "messages": history + [question],
+                "model": "mock",
+                "condition": "alzheimer",
+                "talkativeness": "ausgewogen",
+                "patient_details": patient_details,
+                "session_id": session_id,
+            },
+            stream_mode=["messages", "values"],
+        ):
+            if mode == "messages" and payload[0].content and not isinstance(payload[0], HumanMessage):
+                ttft = ttft or time.perf_counter() - started
+                reply += payload[0].content
+            elif mode == "values":
+                values = payload
+        context = values.get("context") or values["messages"]
+        prompt_tokens = system_tokens + count_tokens(values.get("summary", "")) + count_message_tokens(context)
+        results.append((prompt_tokens, ttft or 0.0))
+        history += [question, AIMessage(reply)]
+    return results
+
+
+async def run(turns: int, every: int) -> None:
+    from chains import chat_chain
+    from chains.llm_clients import llm_clients
+
+    budget = chat_chain.CONTEXT_TOKEN_BUDGET
+    full = await play(turns, 0)
+    managed = await play(turns, budget)
+    print(f"{'turn':>4} | {'full tokens':>11} {'full TTFT':>10} | {'budget tokens':>13} {'budget TTFT':>11}")
+    for turn in range(0, turns, every):
+        (full_tokens, full_ttft), (managed_tokens, managed_ttft) = full[turn], managed[turn]
+        print(
+            f"{turn + 1:>4} | {full_tokens:>11} {full_ttft * 1000:>8.0f}ms | "
+            f"{managed_tokens:>13} {managed_ttft * 1000:>9.0f}ms"
+        )
+    await llm_clients.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--every", type=int, default=5, help="print every n-th turn")
+    parser.add_argument("--ttft", type=float, default=0.05, help="mock server base time to first token")
+    parser.add_argument("--prefill-per-1k-tokens", type=float, default=0.1, help="mock server prefill cost")
+    args = parser.parse_args()
+
+    with run_mock_server(PORT, ttft=args.ttft, prefill_per_1k_tokens=args.prefill_per_1k_tokens,
+                         tokens_per_second=500) as base_url:
+        os.environ["CHATAI_API_URL"] = base_url
+        os.environ.setdefault("CHATAI_API_KEY", "mock")
+        asyncio.run(run(args.turns, args.every))
+
+
+if __name__ == "__main__":
+    main()
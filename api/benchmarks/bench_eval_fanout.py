@@ -0,0 +1,73 @@
+"""
+Benchmark of the single-call evaluation against the per-criterion fan-out.
+
+Evaluates the same transcript through eval_history against the local mock
+ChatAI server, which answers evaluation prompts with a rubric of realistic
+length at a fixed token rate. Reports time to the first rubric section and
+total wall-clock time for the single call and for several fan-out limits.
+
+Usage (from the api/ folder):
+    python -m benchmarks.bench_eval_fanout --tokens-per-second 30
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.mock_chatai import run_mock_server
+
+PORT = 8103
+TRANSCRIPT = [
+    ("user", "Guten Tag, was führt Sie zu mir?"),
+    ("patient", "Ach, die Hüfte tut weh, seit ich heute Morgen gestürzt bin."),
+    ("user", "Wo genau tut es weh und wie stark, auf einer Skala von 1 bis 10?"),
+    ("patient", "Rechts, an der Seite. Vielleicht eine 7, beim Gehen schlimmer."),
+    ("user", "Haben Sie sich den Kopf angeschlagen oder waren Sie bewusstlos?"),
+    ("patient", "Nein, ich glaube nicht. Aber ich weiß es nicht mehr so genau."),
+]
+
+
+async def evaluate(mode: str, concurrency: int) -> tuple[float, float, str]:
+    from langchain_core.messages import AIMessage, HumanMessage
+    from chains import eval_chain
+
+    eval_chain.EVAL_MODE = mode
+    eval_chain.EVAL_CONCURRENCY = concurrency
+    messages = [HumanMessage(text) if role == "user" else AIMessage(text) for role, text in TRANSCRIPT]
+
+    started = time.perf_counter()
+    first_section = None
+    output = ""
+    async for chunk in eval_chain.eval_history(messages):
+        output += chunk
+        if first_section is None and eval_chain.SCORE_PATTERN.search(output):
+            first_section = time.perf_counter() - started
+    return first_section or 0.0, time.perf_counter() - started, output
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ttft", type=float, default=0.5, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0, help="mock generation speed per call")
+    parser.add_argument("--eval-section-words", type=int, default=80, help="justification words per criterion")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[2, 4, 8], help="fan-out limits to compare")
+    args = parser.parse_args()
+
+    with run_mock_server(PORT, ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                         eval_section_words=args.eval_section_words) as base_url:
+        os.environ["CHATAI_API_URL"] = base_url
+        os.environ["CHATAI_API_KEY"] = "mock"
+        from chains.eval_chain import SCORE_PATTERN
+        from chains.llm_clients import llm_clients
+
+        runs = [("single", 1)] + [("parallel", c) for c in args.concurrency]
+        for mode, concurrency in runs:
+            first_section, total, output = await evaluate(mode, concurrency)
+            scores = sum(name != "Gesamtbewertung" for name, _ in SCORE_PATTERN.findall(output))
+            label = mode if mode == "single" else f"parallel x{concurrency}"
+            print(f"{label:>12}: first section {first_section:5.2f}s | total {total:5.2f}s | {scores} scored criteria")
+        await llm_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
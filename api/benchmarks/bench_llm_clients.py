@@ -0,0 +1,75 @@
+"""
+Time-to-first-token benchmark for upstream LLM clients.
+
+Runs a sequence of chat turns against the local mock ChatAI server, once
+building a new ChatOpenAI per turn (the previous get_llm behaviour) and once
+using the shared client pool. A think time between turns mimics a student
+typing; with the default httpx keep-alive of 5s the fresh clients lose their
+connection between turns, the pool keeps it.
+
+Usage (from the api/ folder):
+    python -m benchmarks.bench_llm_clients --turns 8 --think-time 6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.mock_chatai import run_mock_server
+
+PORT = 8101
+
+
+async def measure_ttft(llm) -> float:
+    started = time.perf_counter()
+    async for chunk in llm.astream("Wie geht es Ihnen?"):
+        if chunk.content:
+            return time.perf_counter() - started
+    return time.perf_counter() - started
+
+
+async def run(turns: int, think_time: float) -> None:
+    # Import after CHATAI_API_URL points at the mock server
+    from langchain_openai import ChatOpenAI
+    from chains.llm_clients import llm_clients
+
+    base_url, api_key = os.environ["CHATAI_API_URL"], os.environ["CHATAI_API_KEY"]
+    variants = {
+        "fresh ChatOpenAI": lambda: ChatOpenAI(
+            openai_api_base=base_url, openai_api_key=api_key, model="mock", temperature=0.7
+        ),
+        "pooled client": lambda: llm_clients.get(
+            "mock", openai_api_base=base_url, openai_api_key=api_key, temperature=0.7
+        ),
+    }
+    for name, factory in variants.items():
+        ttfts = []
+        for turn in range(turns):
+            if turn:
+                await asyncio.sleep(think_time)
+            ttfts.append(await measure_ttft(factory()))
+        # The first turn always pays for connection setup
+        steady = ttfts[1:] or ttfts
+        print(
+            f"{name:>17}: first {ttfts[0] * 1000:7.1f}ms | "
+            f"mean {statistics.mean(steady) * 1000:7.1f}ms | max {max(steady) * 1000:7.1f}ms"
+        )
+    await llm_clients.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--think-time", type=float, default=6.0, help="seconds between turns")
+    parser.add_argument("--ttft", type=float, default=0.05, help="mock server time to first token")
+    args = parser.parse_args()
+
+    with run_mock_server(PORT, ttft=args.ttft) as base_url:
+        os.environ["CHATAI_API_URL"] = base_url
+        os.environ.setdefault("CHATAI_API_KEY", "mock")
+        asyncio.run(run(args.turns, args.think_time))
+
+
+if __name__ == "__main__":
+    main()
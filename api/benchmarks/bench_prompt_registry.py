@@ -0,0 +1,77 @@
+"""
+Microbenchmark for per-turn prompt construction.
+
+Compares building a fresh ChatPromptTemplate and `prompt | llm` chain on every
+turn (the previous behaviour of call_patient_model) with looking both up in the
+prompt registry. Rendering the messages is measured separately since it happens
+on every turn either way.
+
+Usage (from the api/ folder):
+    python -m benchmarks.bench_prompt_registry --turns 2000
+"""
+import argparse
+import itertools
+import time
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chains.patient_data import PATIENT_INNEN, format_patient_details
+from chains.prompt_registry import PromptRegistry
+from chains.prompts import get_prompt
+
+CONDITIONS = ["default", "alzheimer", "schwerhörig", "verdrängung"]
+TALKATIVENESS_LEVELS = ["kurz angebunden", "ausgewogen", "ausschweifend"]
+
+
+def fake_llm(model: str) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([AIMessage(content="...")]))
+
+
+def time_per_turn(turn, turns: int) -> float:
+    """Average microseconds per call of `turn`."""
+    started = time.perf_counter()
+    for i in range(turns):
+        turn(i)
+    return (time.perf_counter() - started) / turns * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000, help="simulated turns per variant")
+    args = parser.parse_args()
+
+    patients = [format_patient_details(patient) for patient in PATIENT_INNEN.values()]
+    combinations = list(itertools.product(CONDITIONS, TALKATIVENESS_LEVELS, patients))
+    history = [HumanMessage("Wie geht es Ihnen?"), AIMessage("Ach, es geht so ...")] * 5
+    registry = PromptRegistry(maxsize=len(combinations))
+    llm = fake_llm("bench")
+
+    def fresh_build(i: int):
+        condition, talkativeness, patient_details = combinations[i % len(combinations)]
+        return get_prompt(condition, talkativeness, patient_details) | llm
+
+    def registry_lookup(i: int):
+        condition, talkativeness, patient_details = combinations[i % len(combinations)]
+        return registry.get_chain(condition, talkativeness, patient_details, "bench", fake_llm)
+
+    def render(build):
+        def turn(i: int):
+            chain = build(i)
+            chain.first.format_messages(messages=history)
+        return turn
+
+    results = {
+        "fresh build": time_per_turn(fresh_build, args.turns),
+        "registry": time_per_turn(registry_lookup, args.turns),
+        "fresh build + render": time_per_turn(render(fresh_build), args.turns),
+        "registry + render": time_per_turn(render(registry_lookup), args.turns),
+    }
+    for name, micros in results.items():
+        print(f"{name:>22}: {micros:8.1f} µs/turn")
+    print(f"speedup (build only): {results['fresh build'] / results['registry']:.1f}x")
+    print(f"registry: {registry.stats()}")
+
+
+if __name__ == "__main__":
+    main()
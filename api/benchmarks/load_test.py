@@ -0,0 +1,237 @@
+"""
+Load test of /chat and /eval with many concurrent simulated students.
+
+Starts the local mock ChatAI server (configurable TTFT, token rate and error
+rates) and the API as a uvicorn subprocess pointed at it. Each student opens a
+session, chats for a number of turns with some think time and then requests
+an evaluation. Reports throughput, errors and p50/p95/p99 time to first byte
+and full-stream latency per endpoint, and writes them as JSON for comparison.
+
+The API uses DATABASE_URL (a throwaway SQLite file if unset); use Postgres
+for realistic numbers. With --api-url an already running API is tested
+instead, and its database must contain --patient-file-id.
+
+Usage (from the api/ folder):
+    python -m benchmarks.load_test --students 50 --turns 5 --ttft 0.5 --error-rate 0.02
+    python -m benchmarks.load_test --compare before.json after.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+
+from benchmarks.mock_chatai import run_mock_server, wait_for_port
+
+MOCK_PORT = 8104
+API_PORT = 8105
+RESULTS_DIR = Path(__file__).parent / "results"
+QUESTIONS = [
+    "Guten Tag, was führt Sie zu mir?",
+    "Seit wann haben Sie die Schmerzen in der Hüfte?",
+    "Wie ist der Sturz passiert?",
+    "Welche Medikamente nehmen Sie regelmäßig ein?",
+    "Haben Sie Allergien?",
+    "Wohnen Sie allein?",
+]
+MODELS = ["gemma-3-27b-it", "llama-3.3-70b-instruct", "mistral-large-instruct"]
+CONDITIONS = ["default", "alzheimer", "schwerhörig", "verdrängung"]
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    ok: bool
+    status: int
+    ttfb: float | None
+    total: float
+
+
+async def timed_stream(client: httpx.AsyncClient, endpoint: str, url: str, payload: dict | None = None) -> Sample:
+    """POST and read a streamed response, timing the first non-empty chunk and the end of the stream."""
+    started = time.perf_counter()
+    ttfb = None
+    try:
+        async with client.stream("POST", url, json=payload) as response:
+            text = ""
+            async for chunk in response.aiter_text():
+                if ttfb is None and chunk:
+                    ttfb = time.perf_counter() - started
+                text += chunk
+            # The API reports upstream failures inside a 200 stream
+            ok = response.status_code == 200 and "Fehler aufgetreten" not in text
+            return Sample(endpoint, ok, response.status_code, ttfb, time.perf_counter() - started)
+    except httpx.HTTPError:
+        return Sample(endpoint, False, 0, ttfb, time.perf_counter() - started)
+
+
+async def student(client: httpx.AsyncClient, args: argparse.Namespace, samples: list[Sample]) -> None:
+    session_id = f"load-{uuid.uuid4()}"
+    model = random.choice(MODELS)
+    condition = random.choice(CONDITIONS)
+    # Students do not all start at the same moment
+    await asyncio.sleep(random.uniform(0, args.ramp_up))
+    for turn in range(args.turns):
+        samples.append(await timed_stream(client, "chat", "/api/v1/chat", {
+            "message": QUESTIONS[turn % len(QUESTIONS)],
+            "model": model,
+            "condition": condition,
+            "talkativeness": "ausgewogen",
+            "patient_file_id": args.patient_file_id,
+            "session_id": session_id,
+        }))
+        await asyncio.sleep(random.uniform(0, args.think_time))
+    if args.eval:
+        samples.append(await timed_stream(client, "eval", f"/api/v1/eval/{session_id}"))
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    summary = {}
+    for endpoint in sorted({s.endpoint for s in samples}):
+        endpoint_samples = [s for s in samples if s.endpoint == endpoint]
+        ok = [s for s in endpoint_samples if s.ok]
+        ttfb = [s.ttfb for s in ok if s.ttfb is not None]
+        total = [s.total for s in ok]
+        summary[endpoint] = {
+            "requests": len(endpoint_samples),
+            "errors": len(endpoint_samples) - len(ok),
+            "throughput_rps": len(ok) / elapsed,
+            **{f"ttfb_p{p}_s": percentile(ttfb, p) for p in (50, 95, 99)},
+            **{f"total_p{p}_s": percentile(total, p) for p in (50, 95, 99)},
+        }
+    return summary
+
+
+async def seed_patient(patient_file_id: int) -> None:
+    """Create the simulated patient file in the API's database."""
+    from app.db.db import SessionLocal, engine
+    from app.db.models import Anamnesis, PatientFile
+
+    async with SessionLocal() as db:
+        if await db.get(PatientFile, patient_file_id) is None:
+            db.add(PatientFile(
+                id=patient_file_id, first_name="Anna", last_name="Zank", height=165, weight=70.0,
+                gender_identity="weiblich", gender_medical="weiblich",
+                anamneses=[
+                    Anamnesis(category="Aktuelle Beschwerden", answer="Schmerzen in der rechten Hüfte nach Sturz"),
+                    Anamnesis(category="Allergien", answer="keine bekannt"),
+                    Anamnesis(category="Medikamente", answer="Ramipril 5 mg"),
+                ],
+            ))
+            await db.commit()
+    await engine.dispose()
+
+
+@contextlib.contextmanager
+def run_api(port: int, env: dict):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    try:
+        wait_for_port(port, process, "API", timeout=60)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+async def drive(api_url: str, args: argparse.Namespace) -> dict:
+    samples: list[Sample] = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(student(client, args, samples) for _ in range(args.students)))
+        elapsed = time.perf_counter() - started
+    return {"elapsed_s": elapsed, "endpoints": summarize(samples, elapsed)}
+
+
+def print_summary(result: dict) -> None:
+    print(f"elapsed {result['elapsed_s']:.1f}s")
+    for endpoint, stats in result["endpoints"].items():
+        ms = lambda value: f"{value * 1000:7.0f}" if value is not None else "      -"
+        print(
+            f"{endpoint:>5}: {stats['requests']} requests, {stats['errors']} errors, "
+            f"{stats['throughput_rps']:.2f}/s | ttfb ms p50 {ms(stats['ttfb_p50_s'])} p95 {ms(stats['ttfb_p95_s'])} "
+            f"p99 {ms(stats['ttfb_p99_s'])} | total ms p50 {ms(stats['total_p50_s'])} "
+            f"p95 {ms(stats['total_p95_s'])} p99 {ms(stats['total_p99_s'])}"
+        )
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Print the relative change of every metric between two result files."""
+    before = json.loads(Path(before_path).read_text())["result"]["endpoints"]
+    after = json.loads(Path(after_path).read_text())["result"]["endpoints"]
+    for endpoint in sorted(before.keys() & after.keys()):
+        print(endpoint)
+        for metric, old in before[endpoint].items():
+            new = after[endpoint].get(metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+6.1f}%" if old else "      -"
+            print(f"  {metric:<16} {old:10.3f} -> {new:10.3f}  {change}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=50, help="concurrent simulated students")
+    parser.add_argument("--turns", type=int, default=5, help="chat turns per student")
+    parser.add_argument("--think-time", type=float, default=2.0, help="max seconds between turns")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which students start")
+    parser.add_argument("--no-eval", dest="eval", action="store_false", help="skip the evaluation per student")
+    parser.add_argument("--patient-file-id", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0, help="client timeout per request")
+    parser.add_argument("--ttft", type=float, default=0.5, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="mock tokens per second per stream")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock share of requests failing with HTTP 500")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="mock share of streams breaking off")
+    parser.add_argument("--api-url", help="test a running API instead of starting one")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/load_test-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.api_url:
+        result = await drive(args.api_url, args)
+    else:
+        database_url = os.environ.get("DATABASE_URL") or f"sqlite:///{tempfile.gettempdir()}/symptex-load-{os.getpid()}.db"
+        with run_mock_server(MOCK_PORT, ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                             error_rate=args.error_rate, stream_error_rate=args.stream_error_rate) as mock_url:
+            env = {"CHATAI_API_URL": mock_url, "CHATAI_API_KEY": "mock", "DATABASE_URL": database_url}
+            with run_api(API_PORT, env) as api_url:
+                os.environ.update(env)
+                await seed_patient(args.patient_file_id)
+                result = await drive(api_url, args)
+
+    print_summary(result)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load_test-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "output")}
+    output.write_text(json.dumps({"config": config, "result": result}, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+"""
+Local OpenAI-compatible stand-in for the ChatAI service.
+
+Serves /v1/chat/completions (streaming and non-streaming) with a configurable
+time to first token, prefill cost per prompt token and token rate, so
+benchmarks can run without a ChatAI key. Evaluation prompts (CRI-HT) get a
+rubric in the requested format: all criteria, or the single criterion asked for.
+A share of requests can fail up front (HTTP error) or break off mid-stream;
+POST /mock/settings changes the settings of a running server, e.g.
+{"error_rate": 1.0} to simulate an outage and {"error_rate": 0.0} to end it.
+
+Usage (from the api/ folder):
+    python -m benchmarks.mock_chatai --port 8100 --ttft 0.3 --tokens-per-second 40
+    CHATAI_API_URL=http://127.0.0.1:8100/v1 CHATAI_API_KEY=mock ...
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY = (
+    "Ach, Herr Doktor ... *schaut aus dem Fenster* ... ich weiß gar nicht so genau, "
+    "warum ich hier bin. Die Hüfte tut halt weh, seit heute Morgen."
+)
+
+FILLER = (
+    "Der Doktor fragt nach dem Beginn der Beschwerden und greift die Aussage zur Hüfte auf, "
+    "vertieft aber Dauer und Charakter der Schmerzen nur teilweise."
+)
+
+
+class MockSettings:
+    ttft: float = 0.3
+    # Extra time to first token per 1000 prompt tokens, like a real prefill
+    prefill_per_1k_tokens: float = 0.0
+    tokens_per_second: float = 40.0
+    reply: str = REPLY
+    # Words of justification per rated criterion in evaluation replies
+    eval_section_words: int = 80
+    # Share of requests answered with `error_status` instead of a completion
+    error_rate: float = 0.0
+    error_status: int = 500
+    # Share of streams that break off after half of the tokens
+    stream_error_rate: float = 0.0
+
+
+settings = MockSettings()
+app = FastAPI(title="Mock ChatAI")
+
+
+def reply_tokens(text: str) -> list[str]:
+    """Split the reply into word-sized tokens, keeping the separating spaces."""
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def rubric_section(number: int, name: str) -> str:
+    words = (FILLER.split(" ") * (settings.eval_section_words // len(FILLER.split(" ")) + 1))[:settings.eval_section_words]
+    return (
+        f"{number}. **{name}: {len(name) % 5 + 1}/5**\n"
+        f"    - **Begründung:** {' '.join(words)}\n"
+        f"    - **Verbesserungsvorschlag:** Symptome gezielter nachfragen und Zwischenergebnisse zusammenfassen."
+    )
+
+
+def reply_for(messages: list[dict]) -> str:
+    """The configured reply, or a rubric if the system prompt asks for an evaluation."""
+    system = str(messages[0].get("content", "")) if messages and messages[0].get("role") == "system" else ""
+    if "CRI-HT" not in system:
+        return settings.reply
+    single = re.search(r"Kriterium: (.+)\n", system)
+    if single:
+        number = re.search(r"(\d+)\. \*\*", system)
+        return rubric_section(int(number.group(1)) if number else 1, single.group(1).strip())
+    names = re.findall(r"\* ([^:\n]+):", system)
+    sections = "\n\n".join(rubric_section(i, name) for i, name in enumerate(names, start=1))
+    return (
+        f"**Personalisierte Bewertung der Anamnese**\n\n---\n\n{sections}\n\n"
+        "**Gesamtbewertung: 3/5**\n- **Stärken**: Gesprächsführung\n- **Verbesserungspotenzial**: Zusammenfassung geben"
+    )
+
+
+def count_prompt_tokens(messages: list[dict]) -> int:
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+
+def chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/mock/settings")
+async def update_settings(request: Request):
+    """Change settings at runtime, e.g. to start and end an outage."""
+    for name, value in (await request.json()).items():
+        if not hasattr(MockSettings, name):
+            return JSONResponse({"error": f"Unknown setting {name}"}, status_code=400)
+        setattr(settings, name, value)
+    return {name: getattr(settings, name) for name in vars(MockSettings) if not name.startswith("_")}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    if random.random() < settings.error_rate:
+        return JSONResponse(
+            {"error": {"message": "Mock ChatAI error", "type": "server_error"}}, status_code=settings.error_status
+        )
+    reply = reply_for(body.get("messages", []))
+    tokens = reply_tokens(reply)
+    usage = {
+        "prompt_tokens": count_prompt_tokens(body.get("messages", [])),
+        "completion_tokens": len(tokens),
+        "total_tokens": count_prompt_tokens(body.get("messages", [])) + len(tokens),
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    ttft = settings.ttft + usage["prompt_tokens"] / 1000 * settings.prefill_per_1k_tokens
+
+    if not body.get("stream"):
+        await asyncio.sleep(ttft + len(tokens) / settings.tokens_per_second)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    break_after = len(tokens) // 2 if random.random() < settings.stream_error_rate else None
+
+    async def stream():
+        await asyncio.sleep(ttft)
+        yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            if i == break_after:
+                raise RuntimeError("Mock ChatAI stream broke off")
+            yield chunk(completion_id, model, {"content": token})
+            await asyncio.sleep(1 / settings.tokens_per_second)
+        yield chunk(completion_id, model, {}, finish_reason="stop")
+        if include_usage:
+            yield chunk(completion_id, model, {}, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def wait_for_port(port: int, process: subprocess.Popen, name: str, timeout: float = 15) -> None:
+    """Block until a server subprocess accepts connections."""
+    deadline = time.monotonic() + timeout
+    while True:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError(f"{name} did not start")
+        time.sleep(0.1)
+
+
+@contextlib.contextmanager
+def run_mock_server(port: int = 8100, **options):
+    """
+    Start the mock server in a subprocess and yield its base URL. Keyword
+    options map onto the command line flags, e.g. ttft=0.2.
+    """
+    args = [sys.executable, "-m", "benchmarks.mock_chatai", "--port", str(port)]
+    for name, value in options.items():
+        args += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(args)
+    try:
+        wait_for_port(port, process, "Mock ChatAI server")
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft", type=float, default=settings.ttft, help="seconds before the first token")
+    parser.add_argument("--prefill-per-1k-tokens", type=float, default=settings.prefill_per_1k_tokens,
+                        help="extra seconds to first token per 1000 prompt tokens")
+    parser.add_argument("--tokens-per-second", type=float, default=settings.tokens_per_second)
+    parser.add_argument("--eval-section-words", type=int, default=settings.eval_section_words,
+                        help="words of justification per criterion in evaluation replies")
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate,
+                        help="share of requests answered with an HTTP error")
+    parser.add_argument("--error-status", type=int, default=settings.error_status)
+    parser.add_argument("--stream-error-rate", type=float, default=settings.stream_error_rate,
+                        help="share of streams that break off halfway")
+    args = parser.parse_args()
+
+    settings.ttft = args.ttft
+    settings.prefill_per_1k_tokens = args.prefill_per_1k_tokens
+    settings.tokens_per_second = args.tokens_per_second
+    settings.eval_section_words = args.eval_section_words
+    settings.error_rate = args.error_rate
+    settings.error_status = args.error_status
+    settings.stream_error_rate = args.stream_error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
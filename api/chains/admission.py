@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Set up logging
+logger = logging.getLogger('admission')
+logger.setLevel(logging.DEBUG)
+
+# Generations running at the same time per model, unless overridden in LLM_CONCURRENCY_LIMITS
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "16"))
+# Per-model limits, e.g. "qwen3-235b-a22b=4,gemma-3-27b-it=24"
+LLM_CONCURRENCY_LIMITS = os.environ.get("LLM_CONCURRENCY_LIMITS", "")
+# Requests waiting per model before new ones are rejected
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "64"))
+
+# Priorities, lower runs first: a student waiting for the patient beats a pending evaluation
+CHAT = 0
+EVAL = 1
+PRIORITY_NAMES = {CHAT: "chat", EVAL: "eval"}
+
+
+def parse_limits(spec: str) -> dict[str, int]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, limit = entry.partition("=")
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """The model's wait queue is full; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(f"Too many requests waiting for {model}")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class Slot:
+    def __init__(self, waited: float):
+        self.waited = waited
+
+
+class Reservation:
+    """
+    Place in a model's queue, taken when the request is admitted and handed
+    to its slot; released if the request ends before it asked for one.
+    """
+
+    def __init__(self, gate: "ModelGate"):
+        self.gate = gate
+        self.held = True
+        gate.reserved += 1
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            self.gate.reserved -= 1
+
+
+class ModelGate:
+    """
+    Concurrency limit of one model. Waiters queue per priority and, within a
+    priority, per session; free slots go to the highest priority and rotate
+    over its sessions, so one student's burst cannot starve the others. A
+    request that makes several calls at once reserves one slot per call.
+    """
+
+    def __init__(self, model: str, limit: int, queue_size: int):
+        self.model = model
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        # Waiters as (future, slots) per priority and session
+        self.queues: dict[int, OrderedDict[str, deque[tuple[asyncio.Future, int]]]] = {CHAT: OrderedDict(), EVAL: OrderedDict()}
+        self.waiting = 0
+        # Requests admitted with a queue place that have not asked for their slots yet
+        self.reserved = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self.hold_seconds = 5.0
+
+    def has_free_slot(self) -> bool:
+        return self.active + self.reserved < self.limit and self.waiting == 0
+
+    def is_full(self) -> bool:
+        return self.active + self.waiting + self.reserved >= self.limit + self.queue_size
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely moved by its own length."""
+        return max(1, math.ceil(self.hold_seconds * (self.waiting + self.reserved + 1) / self.limit))
+
+    async def acquire(self, priority: int, key: str, slots: int = 1) -> None:
+        """
+        Wait for `slots` slots. The queue bound is enforced by reserve() before
+        the response starts; a request that passed it is not turned away here.
+        """
+        if self.active + slots <= self.limit and self.waiting == 0:
+            self.active += slots
+            self.admitted += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, slots)
+        self.queues[priority].setdefault(key, deque()).append(waiter)
+        self.waiting += 1
+        logger.debug("Queued %s request of %s for %s, %d waiting", PRIORITY_NAMES[priority], key, self.model, self.waiting)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the cancellation, pass the slots on
+                self.release(0.0, slots)
+            else:
+                self.remove(priority, key, waiter)
+                # A large reservation at the head may have held back smaller ones
+                self.grant()
+            raise
+
+    def remove(self, priority: int, key: str, waiter: tuple[asyncio.Future, int]) -> None:
+        waiters = self.queues[priority].get(key)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self.waiting -= 1
+            if not waiters:
+                del self.queues[priority][key]
+
+    def release(self, held: float, slots: int = 1) -> None:
+        if held:
+            self.hold_seconds = 0.9 * self.hold_seconds + 0.1 * held
+        self.active -= slots
+        self.grant()
+
+    def grant(self) -> None:
+        """
+        Hand free slots to the next waiters: first priority, then round-robin
+        over sessions. A reservation that does not fit yet waits at the head,
+        so smaller requests cannot starve it.
+        """
+        while self.active < self.limit and self.waiting:
+            sessions = next(queue for queue in self.queues.values() if queue)
+            key, waiters = next(iter(sessions.items()))
+            future, slots = waiters[0]
+            if self.active + slots > self.limit:
+                break
+            waiters.popleft()
+            self.waiting -= 1
+            # The session moves to the back of the rotation
+            del sessions[key]
+            if waiters:
+                sessions[key] = waiters
+            self.active += slots
+            self.admitted += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "reserved": self.reserved,
+            "waiting_by_priority": {PRIORITY_NAMES[p]: sum(map(len, q.values())) for p, q in self.queues.items()},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "hold_seconds": self.hold_seconds,
+        }
+
+
+class AdmissionController:
+    """
+    Limits the generations in flight per ChatAI model, so a whole course
+    sending at once queues here instead of running into upstream rate limits
+    and retry storms.
+    """
+
+    def __init__(self, default_limit: int, limits: dict[str, int], queue_size: int):
+        self.default_limit = default_limit
+        self.limits = limits
+        self.queue_size = queue_size
+        self.gates: dict[str, ModelGate] = {}
+
+    def gate(self, model: str) -> ModelGate:
+        gate = self.gates.get(model)
+        if gate is None:
+            gate = self.gates[model] = ModelGate(model, self.limits.get(model, self.default_limit), self.queue_size)
+        return gate
+
+    def reserve(self, model: str) -> Reservation:
+        """
+        Take a place in the model's queue before a response is started, or
+        reject right away if it is full. Requests of a burst are counted as soon
+        as they are admitted, not only once their generation asks for a slot.
+        """
+        gate = self.gate(model)
+        if gate.is_full():
+            gate.rejected += 1
+            raise AdmissionRejected(model, gate.retry_after())
+        return Reservation(gate)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int, key: str, calls: int = 1, reservation: Reservation | None = None):
+        """
+        Hold the model's slots for `calls` concurrent upstream calls (at most
+        its limit) for the duration of the block, in place of `reservation` if
+        the request was admitted with one; yields how long it waited.
+        """
+        gate = self.gate(model)
+        slots = max(1, min(calls, gate.limit))
+        if reservation is not None:
+            # The queue place becomes a waiter or an active slot without an await in between
+            reservation.release()
+        started = time.perf_counter()
+        await gate.acquire(priority, key, slots)
+        admitted = time.perf_counter()
+        try:
+            yield Slot(admitted - started)
+        finally:
+            gate.release(time.perf_counter() - admitted, slots)
+
+    def stats(self) -> dict:
+        return {model: gate.stats() for model, gate in self.gates.items()}
+
+
+admission = AdmissionController(LLM_CONCURRENCY, parse_limits(LLM_CONCURRENCY_LIMITS), ADMISSION_QUEUE_SIZE)
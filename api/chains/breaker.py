@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+
+# Set up logging
+logger = logging.getLogger('breaker')
+logger.setLevel(logging.DEBUG)
+
+# Consecutive failed ChatAI calls of a model and endpoint that open its circuit
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+# Seconds an open circuit fails calls right away before a probe call is let through
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """ChatAI calls of a model and endpoint are failing fast; shown to the student."""
+
+    def __init__(self, endpoint: str, model: str, retry_after: int):
+        super().__init__(
+            f"ChatAI ist für {model} gerade nicht erreichbar, bitte in {retry_after} Sekunden erneut versuchen."
+        )
+        self.endpoint = endpoint
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed calls of one model and endpoint. After
+    `threshold` of them the circuit opens and calls fail at once instead of
+    waiting through timeouts and retries. After `reset_timeout` one probe call
+    is let through (half-open): its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self, endpoint: str, model: str, threshold: int, reset_timeout: float):
+        self.endpoint = endpoint
+        self.model = model
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.opened_at + self.reset_timeout - time.monotonic()))
+
+    def check(self) -> None:
+        """Raise CircuitOpen if a call would be rejected right now."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            logger.info("Circuit %s/%s half-open, probing", self.endpoint, self.model)
+        if self.state == OPEN or (self.state == HALF_OPEN and self.probing):
+            self.rejected += 1
+            raise CircuitOpen(self.endpoint, self.model, self.retry_after())
+
+    @contextmanager
+    def guard(self):
+        """Run a call through the circuit; upstream errors count as failures, cancellations as nothing."""
+        self.check()
+        probe = self.state == HALF_OPEN
+        self.probing = self.probing or probe
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception:
+            self.failure()
+            raise
+        else:
+            self.success()
+        finally:
+            if probe:
+                self.probing = False
+
+    def success(self) -> None:
+        if self.state != CLOSED:
+            logger.info("Circuit %s/%s closed", self.endpoint, self.model)
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+            logger.warning("Circuit %s/%s open after %d failures", self.endpoint, self.model, self.failures)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.opened += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after() if self.state != CLOSED else 0,
+        }
+
+
+class CircuitBreakers:
+    """One circuit breaker per endpoint (chat, eval) and model, created on first use."""
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, endpoint: str, model: str) -> CircuitBreaker:
+        breaker = self.breakers.get((endpoint, model))
+        if breaker is None:
+            breaker = self.breakers[(endpoint, model)] = CircuitBreaker(endpoint, model, self.threshold, self.reset_timeout)
+        return breaker
+
+    def is_open(self, endpoint: str, model: str) -> bool:
+        breaker = self.breakers.get((endpoint, model))
+        return breaker is not None and breaker.state == OPEN
+
+    def stats(self) -> dict:
+        return {f"{endpoint}/{model}": breaker.stats() for (endpoint, model), breaker in self.breakers.items()}
+
+
+breakers = CircuitBreakers(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
@@ -1,8 +1,12 @@
 import os
 from dotenv import load_dotenv
 
-from langchain_core.messages import AnyMessage
+from collections import OrderedDict
+from contextlib import nullcontext
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AnyMessage, BaseMessage, HumanMessage
 from langchain_openai import ChatOpenAI
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import START, StateGraph, END
 from langgraph.graph.message import add_messages
 import langsmith as ls
@@ -10,7 +14,12 @@ from typing import Annotated
 from typing_extensions import TypedDict
 import logging
 
-from chains.prompts import get_prompt
+from chains.breaker import breakers
+from chains.prompt_registry import prompt_registry
+from chains.llm_clients import llm_clients
+from chains.prompts import summary_prompt
+from chains.routing import RoutedChatModel, model_router
+from chains.tokens import count_tokens, count_message_tokens
 
 # Load env variables for LangSmith to work
 load_dotenv()
@@ -25,6 +34,10 @@ class CustomState(TypedDict):
     condition: str
     talkativeness: str
     patient_details: str
+    session_id: str
+    # Messages actually sent to the model, after context management
+    context: list[AnyMessage]
+    summary: str
         
 # Set up env variables
 CHATAI_API_URL = os.environ.get("CHATAI_API_URL")
@@ -34,17 +47,147 @@ if not CHATAI_API_URL or not CHATAI_API_KEY:
     raise ValueError("ERROR: Environment variables not set")
 
 def get_llm(model: str) -> ChatOpenAI:
-    """Get the LLM instance."""
-    return ChatOpenAI(
+    """Get the pooled LLM instance."""
+    return llm_clients.get(
+        model,
         openai_api_base=CHATAI_API_URL,
         openai_api_key=CHATAI_API_KEY,
-        model=model,
         temperature=0.7,
         top_p=0.8,
         #max_tokens=1024,
         max_retries=2,
+        # Report token usage in the final stream chunk
+        stream_usage=True,
     )
 
+def get_routed_llm(model: str) -> BaseChatModel:
+    """Get the model answering for `model` through the router (MODEL_ROUTING)."""
+    # get_llm is looked up per call, the routed model may pick another model each time
+    return RoutedChatModel(model_name=model, make_llm=lambda routed: get_llm(routed))
+
+# Context window settings. The budget covers the conversation history only,
+# not the system prompt; set it to 0 to always send the full history.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+# Share of the budget kept as verbatim turns after older turns were summarized
+CONTEXT_RECENT_RATIO = float(os.environ.get("CONTEXT_RECENT_RATIO", "0.5"))
+CONTEXT_MIN_RECENT_MESSAGES = int(os.environ.get("CONTEXT_MIN_RECENT_MESSAGES", "4"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "1024"))
+
+def get_summary_llm(model: str) -> ChatOpenAI:
+    """Get the pooled LLM instance used to summarize older turns."""
+    return llm_clients.get(
+        model,
+        openai_api_base=CHATAI_API_URL,
+        openai_api_key=CHATAI_API_KEY,
+        temperature=0.0,
+        max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+        max_retries=2,
+        stream_usage=True,
+    )
+
+class SummaryCache:
+    """
+    Rolling summary per session: how many leading messages it covers and the
+    summary text. Least recently used sessions are evicted beyond `maxsize`.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, tuple[int, str]] = OrderedDict()
+
+    def get(self, session_id: str) -> tuple[int, str]:
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return 0, ""
+        self.entries.move_to_end(session_id)
+        return entry
+
+    def put(self, session_id: str, covered: int, summary: str) -> None:
+        self.entries[session_id] = (covered, summary)
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, session_id: str) -> None:
+        self.entries.pop(session_id, None)
+
+summaries = SummaryCache(SUMMARY_CACHE_SIZE)
+summary_chain_prompt = summary_prompt()
+
+def plan_context(messages: list[BaseMessage], covered: int, summary_tokens: int) -> int:
+    """
+    Return the index up to which messages should be covered by the summary.
+    Nothing new is summarized while the history fits the budget; once it does
+    not, older turns are folded until the verbatim part is back under
+    CONTEXT_RECENT_RATIO of the budget, so summaries are not redone every turn.
+    """
+    if CONTEXT_TOKEN_BUDGET <= 0:
+        return covered
+    # Only the not yet summarized tail is counted, which the budget keeps short
+    tokens = [count_message_tokens([message]) for message in messages[covered:]]
+    remaining = sum(tokens)
+    if summary_tokens + remaining <= CONTEXT_TOKEN_BUDGET:
+        return covered
+
+    split = covered
+    last = len(messages) - CONTEXT_MIN_RECENT_MESSAGES
+    while split < last and summary_tokens + remaining > CONTEXT_TOKEN_BUDGET * CONTEXT_RECENT_RATIO:
+        remaining -= tokens[split - covered]
+        split += 1
+    # Let the verbatim part start with a question of the doctor
+    while split > covered and not isinstance(messages[split], HumanMessage):
+        split -= 1
+    return split
+
+def format_transcript(messages: list[BaseMessage]) -> str:
+    return "\n".join(
+        f"{'Ärztin/Arzt' if isinstance(message, HumanMessage) else 'Patient/in'}: {message.content}"
+        for message in messages
+    )
+
+async def summarize(model: str, summary: str, messages: list[BaseMessage]) -> str:
+    """Fold messages into the running summary."""
+    chain = summary_chain_prompt | get_summary_llm(model)
+    # Tagged so the summary is not streamed to the student as part of the reply
+    response = await chain.ainvoke(
+        {"summary": summary or "(noch keine)", "transcript": format_transcript(messages)},
+        config={"tags": [TAG_NOSTREAM]},
+    )
+    return str(response.content).strip()
+
+async def manage_context(state: CustomState):
+    """Keep the prompt within CONTEXT_TOKEN_BUDGET by summarizing older turns."""
+    # Fail fast while ChatAI is down for this model, before a summary call waits for it;
+    # a routed reply checks the circuit of each model it goes to instead
+    if not model_router.enabled:
+        breakers.get("chat", state["model"]).check()
+    messages = state["messages"]
+    session_id = state.get("session_id")
+    covered, summary = summaries.get(session_id) if session_id else (0, "")
+    if covered > len(messages):
+        covered, summary = 0, ""
+
+    split = plan_context(messages, covered, count_tokens(summary))
+    if split > covered:
+        try:
+            summary = await summarize(state["model"], summary, messages[covered:split])
+            covered = split
+            if session_id:
+                summaries.put(session_id, covered, summary)
+            logger.debug("Summarized %d messages for session %s", covered, session_id)
+        except Exception as e:
+            # Drop the older turns rather than exceed the budget
+            logger.error("Error summarizing context: %s", str(e))
+            covered = split
+
+    return {"context": messages[covered:], "summary": summary}
+
+def format_summary(summary: str | None) -> str:
+    if not summary:
+        return ""
+    return f"\nZusammenfassung des bisherigen Gesprächs (ältere Fragen und deine Antworten):\n{summary}\n"
+
 @ls.traceable(
     run_type="llm",
     name="Patient LLM Call Decorator",
@@ -58,35 +201,36 @@ async def call_patient_model(state: CustomState):
 
     logger.debug("Calling patient model {model} with condition {condition}, talkativeness {talkativeness} and patient_details {patient_details}")
 
-    # Get appropriate prompt
-    prompt = get_prompt(condition, talkativeness, patient_details)
-    chain = prompt | get_llm(model)
+    # Get appropriate prompt chain, compiled once per condition, talkativeness, patient and model
+    llm_factory = get_routed_llm if model_router.enabled else get_llm
+    chain = prompt_registry.get_chain(condition, talkativeness, patient_details, model, llm_factory)
 
     try:
-        # Invoke the chain
-        response = await chain.ainvoke(state)
+        # Failed calls count towards opening the model's circuit (routed calls towards the model they went to)
+        with nullcontext() if model_router.enabled else breakers.get("chat", model).guard():
+            # Invoke the chain
+            response = await chain.ainvoke({
+                "messages": state.get("context") or state["messages"],
+                "summary": format_summary(state.get("summary")),
+            })
         logger.debug("Received response from patient model")
 
         return {"messages": response}
     except Exception as e:
+        # Streamed to the student as an error carrying the upstream message
         logger.error("Error calling patient model: %s", str(e))
-        return {
-            "messages": [
-                {
-                    "role": "patient",
-                    "content": f"Entschuldigung, es ist ein Fehler aufgetreten: {str(e)}"
-                }
-            ]
-        }
+        raise
 
 # Define new graph
 workflow = StateGraph(state_schema=CustomState)
 
-# Define patient llm node
+# Define context management and patient llm nodes
+workflow.add_node("manage_context", manage_context)
 workflow.add_node("patient_model", call_patient_model)
 
-# Set entrypoint as 'patient_model'
-workflow.add_edge(START, "patient_model")
+# Set entrypoint as 'manage_context', followed by 'patient_model'
+workflow.add_edge(START, "manage_context")
+workflow.add_edge("manage_context", "patient_model")
 workflow.add_edge("patient_model", END)
 
 # Compile into LangChain runnable
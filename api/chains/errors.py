@@ -0,0 +1,6 @@
+class ErrorText(str):
+    """
+    Error message streamed in place of (the rest of) a reply. Plain text
+    clients see it as part of the text; the SSE stream sends it as an error
+    event instead of a token.
+    """
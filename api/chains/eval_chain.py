@@ -1,13 +1,19 @@
+import asyncio
 import os
+import re
+from contextlib import aclosing
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.prompts.chat import SystemMessagePromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage
 
 import logging
 
+from chains.breaker import breakers
+from chains.errors import ErrorText
+from chains.llm_clients import llm_clients
+
 # Load env variables
 load_dotenv()
 
@@ -22,6 +28,35 @@ if not CHATAI_API_URL or not CHATAI_API_KEY:
     logger.error("CHATAI environment variable not set, setting to default")
     raise ValueError("ERROR: Environment variables not set")
 
+# Model used to rate conversations
+RATING_MODEL = "qwen3-235b-a22b"
+# Identifies the rubric prompts in cached evaluations; bump it when they change
+RUBRIC_VERSION = "cri-ht-1"
+# "single": one call writes the whole rubric; "parallel": one focused call per criterion
+EVAL_MODE = os.environ.get("EVAL_MODE", "single")
+# Criterion calls of one parallel evaluation that run at the same time
+EVAL_CONCURRENCY = int(os.environ.get("EVAL_CONCURRENCY", "4"))
+
+# CRI-HT criteria (name, description)
+CRITERIA = [
+    ("Gesprächsführung übernehmen", "Der Doktor führt das Gespräch zielgerichtet, um relevante Informationen zu erhalten."),
+    ("Relevante Informationen erkennen und reagieren", "Der Doktor zeigt aktives Zuhören und Interesse an klinisch relevanten Aussagen des Patienten."),
+    ("Symptome präzisieren", "Der Doktor stellt gezielte Nachfragen, um Symptome detailliert zu erfassen (z.B. Ort, Dauer, Charakter)."),
+    ("Pathophysiologisch begründete Fragen stellen", "Der Doktor fragt spezifisch nach möglichen Ursachen oder Mustern (z.B. Übelkeit bei Schmerz)."),
+    ("Logische Fragerichtung", "Der Doktor folgt einer nachvollziehbaren Struktur (z.B. vom Allgemeinen zum Detaillierten) statt starrer Abfrage."),
+    ("Informationen beim Patienten rückbestätigen", "Der Doktor überprüft Verständnis durch Paraphrasieren oder Zusammenfassen (z.B. \"Habe ich richtig verstanden, dass...?\")."),
+    ("Zusammenfassung geben", "Der Doktor fasst Zwischenergebnisse laut zusammen, um Transparenz und Korrektheit zu sichern."),
+    ("Effizienz und Datenqualität", "Der Doktor erhebt ausreichend hochwertige Daten in angemessener Zeit (gegeben dem Patientenverhalten)."),
+]
+CRITERIA_TEXT = "\n".join(f"            * {name}: {description}" for name, description in CRITERIA)
+
+EVAL_HEADER = "**Personalisierte Bewertung der Anamnese**\n\n---\n\n"
+# A scored rubric line, e.g. "**Symptome präzisieren: 4/5**"
+SCORE_PATTERN = re.compile(r"\*\*([^*\n]+?):\s*([1-5])\s*/\s*5\*\*")
+THINK_PATTERN = re.compile(r"<think>[\s\S]*?</think>\s*")
+# Start of the message shown when an evaluation (or part of it) failed
+EVAL_ERROR = "Entschuldigung, es ist ein Fehler aufgetreten"
+
 def get_eval_prompt():
     return ChatPromptTemplate.from_messages([
         SystemMessagePromptTemplate.from_template(
@@ -31,14 +66,7 @@ def get_eval_prompt():
             Die Bewertung erfolgt auf einer Skala von 1 bis 5 für jede Kategorie.
             
             Bewertungskriterien:
-            * Gesprächsführung übernehmen: Der Doktor führt das Gespräch zielgerichtet, um relevante Informationen zu erhalten.
-            * Relevante Informationen erkennen und reagieren: Der Doktor zeigt aktives Zuhören und Interesse an klinisch relevanten Aussagen des Patienten.
-            * Symptome präzisieren: Der Doktor stellt gezielte Nachfragen, um Symptome detailliert zu erfassen (z.B. Ort, Dauer, Charakter).
-            * Pathophysiologisch begründete Fragen stellen: Der Doktor fragt spezifisch nach möglichen Ursachen oder Mustern (z.B. Übelkeit bei Schmerz).
-            * Logische Fragerichtung: Der Doktor folgt einer nachvollziehbaren Struktur (z.B. vom Allgemeinen zum Detaillierten) statt starrer Abfrage.
-            * Informationen beim Patienten rückbestätigen: Der Doktor überprüft Verständnis durch Paraphrasieren oder Zusammenfassen (z.B. "Habe ich richtig verstanden, dass...?").
-            * Zusammenfassung geben: Der Doktor fasst Zwischenergebnisse laut zusammen, um Transparenz und Korrektheit zu sichern.
-            * Effizienz und Datenqualität: Der Doktor erhebt ausreichend hochwertige Daten in angemessener Zeit (gegeben dem Patientenverhalten).
+{criteria}
 
             Bewertungsskala:
             1: Kriterium nicht erfüllt
@@ -72,29 +100,197 @@ def get_eval_prompt():
             """
         ),
         MessagesPlaceholder(variable_name="messages"),
+    ]).partial(criteria=CRITERIA_TEXT)
+
+def get_criterion_prompt():
+    return ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(
+            """
+            /nothink
+            Ziel: Du ist ein medizinischer Prüfer und bewertest die klinische Gesprächsführung eines Doktors während der Anamneseerhebung anhand eines einzelnen klinischen Indikators (CRI-HT) auf Deutsch.
+
+            Kriterium: {name}
+            Beschreibung: {description}
+
+            Bewertungsskala:
+            1: Kriterium nicht erfüllt
+            2: Kriterium eher nicht erfüllt
+            3: Teilerfüllung
+            4: Kriterium weitgehend erfüllt
+            5: Vollständig erfüllt
+
+            Anweisung:
+            Analysiere den vorgelegten Arzt-Patienten-Dialog und bewerte ausschließlich dieses Kriterium mit einer Punktzahl (1–5).
+            Begründe die Bewertung mit konkreten Beispielen aus dem Dialog.
+            Die Bewertung soll konstruktiv sein und Verbesserungspotenziale aufzeigen.
+
+            Formatiere deine Antwort wie folgt, ohne Einleitung oder Gesamtbewertung:
+            {number}. **{name}: [1-5]/5**
+                - **Begründung:** [konkrete Beispiele]
+                - **Verbesserungsvorschlag:** [konstruktive Vorschläge]
+            """
+        ),
+        MessagesPlaceholder(variable_name="messages"),
     ])
 
 def get_rating_llm():
-    return ChatOpenAI(
+    return llm_clients.get(
+        RATING_MODEL,
         openai_api_base=CHATAI_API_URL,
         openai_api_key=CHATAI_API_KEY,
-        model="qwen3-235b-a22b", 
         temperature=0.0,
+        # Report token usage in the final stream chunk
+        stream_usage=True,
     )
 
-async def eval_history(messages):
+def eval_fan_out() -> int:
+    """Upstream calls one evaluation makes at the same time."""
+    return min(EVAL_CONCURRENCY, len(CRITERIA)) if EVAL_MODE == "parallel" else 1
+
+async def eval_history(messages, callbacks: list | None = None, concurrency: int | None = None):
     try:
+        logger.debug("Evaluating %d messages", len(messages))
+        config = {"callbacks": callbacks} if callbacks else None
+        breaker = breakers.get("eval", RATING_MODEL)
+        # Fail fast while ChatAI is down for the rating model
+        breaker.check()
+        if EVAL_MODE == "parallel":
+            async for chunk in eval_criteria(messages, config, concurrency):
+                yield chunk
+            return
+
         prompt = get_eval_prompt()
         llm = get_rating_llm()
         chain = prompt | llm
 
-        logger.debug("Evaluating messages: %s", messages)
-        async for chunk in chain.astream({"messages": messages}):
-            if isinstance(chunk, (HumanMessage, AIMessage)):
-                yield chunk.content
-            else:
-                yield str(chunk)
+        with breaker.guard():
+            async with aclosing(chain.astream({"messages": messages}, config=config)) as stream:
+                async for chunk in stream:
+                    if isinstance(chunk, (HumanMessage, AIMessage)):
+                        yield chunk.content
+                    else:
+                        yield str(chunk)
             
     except Exception as e:
         logger.error("Error in eval_history: %s", str(e))
-        yield f"Entschuldigung, es ist ein Fehler aufgetreten: {str(e)}"
\ No newline at end of file
+        yield ErrorText(f"{EVAL_ERROR}: {str(e)}")
+
+async def evaluate_criterion(chain, number: int, name: str, description: str, messages, semaphore, config):
+    """
+    Rate one criterion; returns its number, rubric section and score (None if
+    it has none). The section is an ErrorText if the criterion could not be rated.
+    """
+    try:
+        async with semaphore:
+            with breakers.get("eval", RATING_MODEL).guard():
+                reply = await chain.ainvoke(
+                    {"number": number, "name": name, "description": description, "messages": messages}, config=config
+                )
+        section = THINK_PATTERN.sub("", reply.content).strip()
+        match = SCORE_PATTERN.search(section)
+        return number, section, int(match.group(2)) if match else None
+    except Exception as e:
+        logger.error("Error rating criterion %s: %s", name, str(e))
+        # An error, so that the incomplete evaluation is neither cached nor scored
+        return number, ErrorText(f"{number}. **{name}: nicht bewertet**\n    - {EVAL_ERROR}: {str(e)}"), None
+
+def format_overall(scores: dict[str, int]) -> str:
+    """Gesamtbewertung computed from the criterion scores."""
+    if not scores:
+        return "**Gesamtbewertung: nicht ermittelbar**\n"
+    mean = sum(scores.values()) / len(scores)
+    strengths = [name for name, score in scores.items() if score >= 4]
+    weaknesses = [name for name, score in scores.items() if score <= 3]
+    overall = f"**Gesamtbewertung: {mean:.1f}/5**".replace(".", ",")
+    if len(scores) < len(CRITERIA):
+        overall += f" (aus {len(scores)} von {len(CRITERIA)} Kriterien)"
+    return (
+        f"{overall}\n"
+        f"- **Stärken**: {', '.join(strengths) or 'keine Kriterien weitgehend erfüllt'}\n"
+        f"- **Verbesserungspotenzial**: {', '.join(weaknesses) or 'alle Kriterien weitgehend erfüllt'}\n"
+    )
+
+async def eval_criteria(messages, config=None, concurrency: int | None = None):
+    """
+    Rate every criterion with its own call, `concurrency` (default
+    EVAL_CONCURRENCY) at a time, stream each section as soon as it is rated
+    and finish with the Gesamtbewertung.
+    """
+    yield EVAL_HEADER
+    chain = get_criterion_prompt() | get_rating_llm()
+    semaphore = asyncio.Semaphore(concurrency or EVAL_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(evaluate_criterion(chain, number, name, description, messages, semaphore, config))
+        for number, (name, description) in enumerate(CRITERIA, start=1)
+    ]
+    scores = {}
+    try:
+        for next_rated in asyncio.as_completed(tasks):
+            number, section, score = await next_rated
+            if score is not None:
+                scores[CRITERIA[number - 1][0]] = score
+            yield ErrorText(section + "\n\n") if isinstance(section, ErrorText) else section + "\n\n"
+    finally:
+        # The client may disconnect before all criteria are rated
+        for task in tasks:
+            task.cancel()
+    # Report the criteria in rubric order
+    yield format_overall({name: scores[name] for name, _ in CRITERIA if name in scores})
+
+
+# "**Gesamtbewertung: 3,5/5**", generated or computed in parallel mode
+OVERALL_PATTERN = re.compile(r"\*\*Gesamtbewertung:\s*([1-5](?:[.,]\d+)?)\s*/\s*5\*\*")
+
+
+class ScoreExtractor:
+    """
+    Picks the criterion scores and the Gesamtbewertung out of a rubric while it
+    is streamed. Only complete lines are parsed, so a chunk boundary inside a
+    score line does not matter.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.scores: dict[str, int] = {}
+        self.overall: float | None = None
+
+    def feed(self, chunk: str) -> None:
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.parse_line(line)
+
+    def close(self) -> None:
+        """Parse the last line once the stream has ended."""
+        self.parse_line(self.buffer)
+        self.buffer = ""
+
+    def parse_line(self, line: str) -> None:
+        overall = OVERALL_PATTERN.search(line)
+        if overall:
+            self.overall = float(overall.group(1).replace(",", "."))
+            return
+        match = SCORE_PATTERN.search(line)
+        if match:
+            criterion = criterion_name(match.group(1))
+            if criterion is not None:
+                self.scores.setdefault(criterion, int(match.group(2)))
+
+    def overall_score(self) -> float | None:
+        """The Gesamtbewertung, or the mean of the criterion scores if the rubric has none."""
+        if self.overall is not None:
+            return self.overall
+        if self.scores:
+            return sum(self.scores.values()) / len(self.scores)
+        return None
+
+
+def criterion_name(label: str) -> str | None:
+    """Map a rubric label (possibly numbered or slightly reworded) onto its CRI-HT criterion."""
+    label = label.strip().lstrip("0123456789. ").casefold()
+    if not label:
+        return None
+    for name, _ in CRITERIA:
+        if label == name.casefold() or label.startswith(name.casefold()) or name.casefold().startswith(label):
+            return name
+    return None
@@ -2,12 +2,14 @@ def format_patient_details(patient_file):
     """
     Formats patient details from a PatientFile SQLAlchemy model instance.
     """
+    # Index answers by category once; the first entry of a category wins
+    answers = {}
+    for anam in patient_file.anamneses:
+        answers.setdefault(anam.category.lower(), anam.answer)
+
     # Get answer by category
     def get_anamnesis(category):
-        for anam in patient_file.anamneses:
-            if anam.category.lower() == category.lower():
-                return anam.answer
-        return "Keine Angaben"
+        return answers.get(category.lower(), "Keine Angaben")
 
     return f"""
     Name: {patient_file.first_name} {patient_file.last_name}
@@ -0,0 +1,70 @@
+import logging
+import os
+from typing import Any
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+# Set up logging
+logger = logging.getLogger('llm_clients')
+logger.setLevel(logging.DEBUG)
+
+# Connection settings shared by all upstream ChatAI clients
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+# Keep idle connections open across a student's thinking time between turns
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "120"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))
+
+
+class LLMClientPool:
+    """
+    Process-wide ChatOpenAI instances keyed by model and settings. All of them
+    share one async HTTP client, so keep-alive connections and TLS sessions to
+    the ChatAI endpoint are reused across turns.
+    """
+
+    def __init__(self):
+        self.http_client: httpx.AsyncClient | None = None
+        self.clients: dict[tuple, ChatOpenAI] = {}
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared async HTTP client, creating it on first use."""
+        if self.http_client is None or self.http_client.is_closed:
+            # Instances bound to a closed client cannot be reused
+            self.clients.clear()
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self.http_client
+
+    def get(self, model: str, **settings: Any) -> ChatOpenAI:
+        """Return the pooled ChatOpenAI instance for a model and its settings."""
+        http_client = self.get_http_client()
+        key = (model, tuple(sorted(settings.items())))
+        llm = self.clients.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                http_async_client=http_client,
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                **settings,
+            )
+            self.clients[key] = llm
+            logger.debug("Created pooled client for model %s", model)
+        return llm
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client and drop all pooled instances."""
+        self.clients.clear()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+
+llm_clients = LLMClientPool()
@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+
+from chains.prompts import get_prompt
+
+# Set up logging
+logger = logging.getLogger('prompt_registry')
+logger.setLevel(logging.DEBUG)
+
+# Maximum number of (condition, talkativeness, patient) prompts kept compiled
+PROMPT_REGISTRY_SIZE = int(os.environ.get("PROMPT_REGISTRY_SIZE", "128"))
+
+
+def patient_details_hash(patient_details: str) -> str:
+    """Stable short hash identifying a rendered patient profile."""
+    return hashlib.sha256(patient_details.encode()).hexdigest()[:16]
+
+
+class PromptEntry:
+    """A compiled prompt and the chains built from it, one per model."""
+
+    def __init__(self, prompt: ChatPromptTemplate):
+        self.prompt = prompt
+        self.chains: dict[str, Runnable] = {}
+
+
+class PromptRegistry:
+    """
+    Builds each prompt template once per (condition, talkativeness, patient)
+    and caches the runnable chain per model. Least recently used entries are
+    evicted once `maxsize` prompts are held.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple[str, str, str], PromptEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, condition: str, talkativeness: str, patient_details: str) -> PromptEntry:
+        key = (condition, talkativeness, patient_details_hash(patient_details))
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = PromptEntry(get_prompt(condition, talkativeness, patient_details))
+            self.entries[key] = entry
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def get_prompt(self, condition: str, talkativeness: str, patient_details: str) -> ChatPromptTemplate:
+        """Return the compiled prompt template."""
+        return self._entry(condition, talkativeness, patient_details).prompt
+
+    def get_chain(
+        self,
+        condition: str,
+        talkativeness: str,
+        patient_details: str,
+        model: str,
+        llm_factory: Callable[[str], BaseChatModel],
+    ) -> Runnable:
+        """Return the `prompt | llm` chain, building it on first use."""
+        entry = self._entry(condition, talkativeness, patient_details)
+        chain = entry.chains.get(model)
+        if chain is None:
+            chain = entry.prompt | llm_factory(model)
+            entry.chains[model] = chain
+        return chain
+
+    def evict_patient(self, patient_details: str) -> None:
+        """Drop every prompt and chain built for the given patient profile."""
+        digest = patient_details_hash(patient_details)
+        for key in [key for key in self.entries if key[2] == digest]:
+            del self.entries[key]
+        logger.debug("Evicted prompts for patient profile %s", digest)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+prompt_registry = PromptRegistry(PROMPT_REGISTRY_SIZE)
@@ -8,13 +8,16 @@ def get_prompt(patient_condition: str, talkativeness: str, patient_details: str)
     """
     
     if patient_condition == "schwerhörig":
-        return PROMPTS["schwerhoerig"](talkativeness.capitalize(), patient_details)
+        prompt = PROMPTS["schwerhoerig"](talkativeness.capitalize(), patient_details)
     elif patient_condition == "verdrängung":
-        return PROMPTS["verdraengung"](talkativeness.capitalize(), patient_details)
+        prompt = PROMPTS["verdraengung"](talkativeness.capitalize(), patient_details)
     elif patient_condition == "alzheimer":
-        return PROMPTS["alzheimer"](talkativeness.capitalize(), patient_details)
+        prompt = PROMPTS["alzheimer"](talkativeness.capitalize(), patient_details)
     else:
-        return PROMPTS["default"](talkativeness.capitalize(), patient_details)
+        prompt = PROMPTS["default"](talkativeness.capitalize(), patient_details)
+
+    # Summary of older turns, only set once the conversation exceeds the context budget
+    return prompt.partial(summary="")
 
 
 def default_prompt(talkativeness: str, patient_details: str):
@@ -38,6 +41,7 @@ def default_prompt(talkativeness: str, patient_details: str):
 
                 Deine Informationen sind:
                 {patient_details}
+                {{summary}}
 
                 Denk nach, ob deine Antwort {talkativeness} genug ist, bevor du antwortest!
                 """
@@ -72,6 +76,7 @@ def alzheimer_prompt(talkativeness: str, patient_details: str):
 
                 Deine Informationen sind:
                 {patient_details}
+                {{summary}}
 
                 Denk nach, ob deine Antwort {talkativeness} genug ist, bevor du antwortest!
                 """
@@ -105,6 +110,7 @@ def schwerhoerig_prompt(talkativeness: str, patient_details: str):
 
                 Deine Informationen sind:
                 {patient_details}
+                {{summary}}
 
                 Denk nach, ob deine Antwort {talkativeness} genug ist, bevor du antwortest!
                 """
@@ -138,6 +144,7 @@ def verdraengung_prompt(talkativeness: str, patient_details: str):
 
                 Deine Informationen sind:
                 {patient_details}
+                {{summary}}
 
                 Denk nach, ob deine Antwort {talkativeness} genug ist, bevor du antwortest!
                 """
@@ -151,6 +158,33 @@ def verdraengung_prompt(talkativeness: str, patient_details: str):
         ]
     )
 
+def summary_prompt():
+    return ChatPromptTemplate.from_messages(
+        [
+            SystemMessagePromptTemplate.from_template(
+                """
+                /nothink
+                Du fasst ein Anamnesegespräch zwischen einer Ärztin bzw. einem Arzt und einer Patientin bzw. einem Patienten zusammen.
+                Die Zusammenfassung dient der Patientin bzw. dem Patienten als Gedächtnis für den weiteren Gesprächsverlauf.
+                * Halte fest, wonach gefragt wurde und was die Patientin bzw. der Patient geantwortet, verschwiegen oder nicht verstanden hat.
+                * Behalte Namen, Zahlen, Zeitangaben und Beschwerden wörtlich bei.
+                * Schreibe knapp in Stichpunkten auf Deutsch, ohne eigene Bewertungen oder Diagnosen.
+                """
+            ),
+            HumanMessagePromptTemplate.from_template(
+                """
+                Bisherige Zusammenfassung:
+                {summary}
+
+                Neue Gesprächsabschnitte:
+                {transcript}
+
+                Gib die aktualisierte Zusammenfassung des gesamten Gesprächs aus.
+                """
+            ),
+        ]
+    )
+
 PROMPTS = {
     "default": default_prompt,
     "alzheimer": alzheimer_prompt,
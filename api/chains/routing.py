@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import aclosing, nullcontext
+from typing import Any, AsyncIterator, Callable
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from chains.admission import CHAT, admission
+from chains.breaker import breakers
+from chains.tokens import count_message_tokens, count_tokens
+
+# Set up logging
+logger = logging.getLogger('routing')
+logger.setLevel(logging.DEBUG)
+
+# Routing of patient replies: comma-separated "hedge" and/or "fastest", empty to call the selected model only
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "")
+# Groups of models that may answer for each other, e.g. "gemma-3-27b-it,mistral-large-instruct;qwq-32b,qwen3-235b-a22b"
+ROUTING_EQUIVALENT_MODELS = os.environ.get("ROUTING_EQUIVALENT_MODELS", "")
+# Recent calls per model the latency stats are taken from
+ROUTING_WINDOW = int(os.environ.get("ROUTING_WINDOW", "100"))
+# Calls of a model before its stats are trusted for deadlines and routing
+ROUTING_MIN_SAMPLES = int(os.environ.get("ROUTING_MIN_SAMPLES", "20"))
+# A second request is sent once the first token is later than this TTFT percentile of the model
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "90"))
+# Hedge deadline bounds, and the deadline while a model has too few samples
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "5"))
+# Reply length in tokens used to compare models by expected reply time
+ROUTING_REPLY_TOKENS = int(os.environ.get("ROUTING_REPLY_TOKENS", "150"))
+# Consecutive failures after which a model is skipped for routing, and for how long
+ROUTING_FAILURE_THRESHOLD = int(os.environ.get("ROUTING_FAILURE_THRESHOLD", "3"))
+ROUTING_FAILURE_COOLDOWN = float(os.environ.get("ROUTING_FAILURE_COOLDOWN", "30"))
+
+# Marks the end of a candidate's stream in the race queue
+END = object()
+
+
+def parse_groups(spec: str) -> list[set[str]]:
+    return [
+        {model.strip() for model in group.split(",") if model.strip()}
+        for group in spec.split(";")
+        if group.strip()
+    ]
+
+
+def percentile(values, p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class ModelStats:
+    """Rolling latency stats and recent failures of one model."""
+
+    def __init__(self, window: int):
+        self.ttfts: deque[float] = deque(maxlen=window)
+        self.tokens_per_second: deque[float] = deque(maxlen=window)
+        self.failures = 0
+        self.last_failure = 0.0
+        self.calls = 0
+        # Calls beyond the one whose usage the reply reports (hedge losers, failed attempts), and their estimated tokens
+        self.extra_calls = 0
+        self.extra_prompt_tokens = 0
+        self.extra_completion_tokens = 0
+
+    def expected_reply_seconds(self, reply_tokens: int) -> float | None:
+        ttft = percentile(self.ttfts, 50)
+        speed = percentile(self.tokens_per_second, 50)
+        if ttft is None or not speed:
+            return None
+        return ttft + reply_tokens / speed
+
+
+class Candidate:
+    """One upstream call in a race for the first token."""
+
+    def __init__(self, model: str, turn_slot: bool):
+        self.model = model
+        # Runs in the admission slot the chat turn holds for its model, instead of taking one of its own
+        self.turn_slot = turn_slot
+        self.started = time.perf_counter()
+        self.first_token_at: float | None = None
+        self.tokens = 0
+        # Set once the request went upstream, and the text it streamed so far
+        self.sent = False
+        self.completion = ""
+        self.task: asyncio.Task | None = None
+
+
+class ModelRouter:
+    """
+    Picks the model that answers a patient reply. With "fastest", a request
+    goes to the model of its equivalence group with the shortest expected
+    reply time among the healthy ones. With "hedge", a second request is sent
+    when the first token is later than the model's HEDGE_PERCENTILE TTFT, to
+    an equivalent model (or the same one if it has none); whichever streams
+    first is used and the other call is cancelled. Every call holds an
+    admission slot of the model it goes to and counts towards that model's
+    circuit breaker. The reply reports the usage of the call that answered;
+    the tokens of the other calls are estimated and counted per model.
+    """
+
+    def __init__(self, features: set[str], groups: list[set[str]], window: int = ROUTING_WINDOW):
+        self.features = features
+        self.groups = groups
+        self.window = window
+        self.models: dict[str, ModelStats] = {}
+        self.rerouted = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+        self.failovers = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.features)
+
+    def model_stats(self, model: str) -> ModelStats:
+        stats = self.models.get(model)
+        if stats is None:
+            stats = self.models[model] = ModelStats(self.window)
+        return stats
+
+    def equivalents(self, model: str) -> set[str]:
+        return next((group for group in self.groups if model in group), {model})
+
+    def healthy(self, model: str) -> bool:
+        stats = self.model_stats(model)
+        if breakers.is_open("chat", model):
+            return False
+        return (
+            stats.failures < ROUTING_FAILURE_THRESHOLD
+            or time.monotonic() - stats.last_failure > ROUTING_FAILURE_COOLDOWN
+        )
+
+    def fastest(self, models) -> str | None:
+        """The healthy model with the shortest expected reply time, among those with enough samples."""
+        expected = {
+            model: seconds
+            for model in models
+            if self.healthy(model)
+            and len(self.model_stats(model).ttfts) >= ROUTING_MIN_SAMPLES
+            and (seconds := self.model_stats(model).expected_reply_seconds(ROUTING_REPLY_TOKENS)) is not None
+        }
+        return min(expected, key=expected.get) if expected else None
+
+    def choose(self, model: str) -> str:
+        """The model a request for `model` is sent to first."""
+        if "fastest" not in self.features:
+            return model
+        chosen = self.fastest(self.equivalents(model))
+        if chosen is None or (self.healthy(model) and len(self.model_stats(model).ttfts) < ROUTING_MIN_SAMPLES):
+            # The selected model gets to collect its stats before others are compared with it
+            return model
+        if chosen != model:
+            self.rerouted += 1
+        return chosen
+
+    def hedge_target(self, model: str) -> str:
+        """The model the second request of a hedge goes to."""
+        others = self.equivalents(model) - {model}
+        return self.fastest(others) or next((m for m in sorted(others) if self.healthy(m)), model)
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for the first token before hedging."""
+        ttfts = self.model_stats(model).ttfts
+        if len(ttfts) < ROUTING_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, percentile(ttfts, HEDGE_PERCENTILE))
+
+    def record_failure(self, model: str) -> None:
+        stats = self.model_stats(model)
+        stats.calls += 1
+        stats.failures += 1
+        stats.last_failure = time.monotonic()
+
+    def record(self, candidate: Candidate, finished: bool) -> None:
+        """Record a candidate's TTFT, and its throughput if it streamed to the end."""
+        stats = self.model_stats(candidate.model)
+        stats.calls += 1
+        if candidate.first_token_at is None:
+            # A cancelled loser without a first token: its TTFT is at least this long
+            stats.ttfts.append(time.perf_counter() - candidate.started)
+            return
+        stats.failures = 0
+        stats.ttfts.append(candidate.first_token_at - candidate.started)
+        duration = time.perf_counter() - candidate.first_token_at
+        if finished and candidate.tokens > 1 and duration > 0:
+            stats.tokens_per_second.append((candidate.tokens - 1) / duration)
+
+    async def stream(
+        self,
+        model: str,
+        start: Callable[[str], AsyncIterator[AIMessageChunk]],
+        prompt_tokens: int = 0,
+    ) -> AsyncIterator[AIMessageChunk]:
+        """
+        Stream the reply of `start(model)`, or of the call that wins the race
+        for the first token if hedging kicks in. Losing calls are cancelled.
+        The caller holds an admission slot of `model` for one call at a time;
+        calls beyond it wait for slots of their own. `prompt_tokens` is the
+        prompt estimate the extra calls are accounted with.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        candidates: list[Candidate] = []
+        # The extra calls of this reply queue for slots as one session
+        key = f"routed:{uuid.uuid4().hex}"
+
+        def launch(target: str) -> None:
+            turn_slot = target == model and not any(c.turn_slot and not c.task.done() for c in candidates)
+            candidate = Candidate(target, turn_slot)
+            candidate.task = asyncio.create_task(self.pump(candidate, start, queue, key))
+            candidates.append(candidate)
+
+        primary = self.choose(model)
+        launch(primary)
+        hedging = "hedge" in self.features
+        loop = asyncio.get_running_loop()
+        delay = self.hedge_delay(primary)
+        hedge_at: float | None = loop.time() + delay
+        winner: Candidate | None = None
+        try:
+            while True:
+                racing = hedging and hedge_at is not None and winner is None and len(candidates) == 1
+                timeout = max(0.0, hedge_at - loop.time()) if racing else None
+                try:
+                    candidate, item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    target = self.hedge_target(primary)
+                    if not admission.gate(target).has_free_slot():
+                        # Hedges only use spare capacity, under load they would queue behind other students
+                        logger.debug("No first token from %s after %.2fs, %s has no free slot to hedge", primary, delay, target)
+                        self.hedges_skipped += 1
+                        hedge_at = None
+                        continue
+                    logger.debug("No first token from %s after %.2fs, hedging to %s", primary, delay, target)
+                    self.hedged += 1
+                    launch(target)
+                    continue
+                if winner is not None and candidate is not winner:
+                    # Queued by a loser before it was cancelled
+                    continue
+                if isinstance(item, Exception):
+                    self.record_failure(candidate.model)
+                    if winner is None:
+                        running = [c for c in candidates if c is not candidate and not c.task.done()]
+                        if running:
+                            continue
+                        if hedging and len(candidates) == 1:
+                            # Failed before its first token, fail over right away
+                            self.failovers += 1
+                            launch(self.hedge_target(primary))
+                            continue
+                    raise item
+                if item is END:
+                    winner = winner or candidate
+                    self.record(winner, finished=True)
+                    return
+                if winner is None:
+                    # Chunks without text (role, usage) do not decide the race
+                    if not item.content:
+                        continue
+                    winner = candidate
+                    winner.first_token_at = time.perf_counter()
+                    if winner is not candidates[0]:
+                        self.hedge_wins += 1
+                    for loser in candidates:
+                        if loser is not winner and not loser.task.done():
+                            loser.task.cancel()
+                            self.record(loser, finished=False)
+                winner.tokens += 1
+                yield item
+        finally:
+            for candidate in candidates:
+                candidate.task.cancel()
+            self.record_extra_calls(candidates, winner or candidates[0], prompt_tokens)
+
+    def record_extra_calls(self, candidates: list[Candidate], reported: Candidate, prompt_tokens: int) -> None:
+        """Count the calls sent upstream besides the one whose usage the reply reports; they are billed all the same."""
+        for candidate in candidates:
+            if candidate is reported or not candidate.sent:
+                continue
+            stats = self.model_stats(candidate.model)
+            stats.extra_calls += 1
+            stats.extra_prompt_tokens += prompt_tokens
+            stats.extra_completion_tokens += count_tokens(candidate.completion)
+
+    async def pump(self, candidate: Candidate, start: Callable[[str], AsyncIterator], queue: asyncio.Queue, key: str) -> None:
+        try:
+            async with nullcontext() if candidate.turn_slot else admission.slot(candidate.model, CHAT, key):
+                # TTFT without the wait for a slot
+                candidate.started = time.perf_counter()
+                # Failures count against the circuit of the model the call went to
+                with breakers.get("chat", candidate.model).guard():
+                    candidate.sent = True
+                    async with aclosing(start(candidate.model)) as chunks:
+                        async for chunk in chunks:
+                            if isinstance(chunk.content, str):
+                                candidate.completion += chunk.content
+                            queue.put_nowait((candidate, chunk))
+            queue.put_nowait((candidate, END))
+        except Exception as e:
+            logger.error("Call to %s failed: %s", candidate.model, str(e))
+            queue.put_nowait((candidate, e))
+
+    def stats(self) -> dict:
+        return {
+            "features": sorted(self.features),
+            "rerouted": self.rerouted,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped": self.hedges_skipped,
+            "failovers": self.failovers,
+            "models": {
+                model: {
+                    "calls": stats.calls,
+                    "extra_calls": stats.extra_calls,
+                    "extra_prompt_tokens": stats.extra_prompt_tokens,
+                    "extra_completion_tokens": stats.extra_completion_tokens,
+                    "ttft_p50_s": percentile(stats.ttfts, 50),
+                    f"ttft_p{HEDGE_PERCENTILE:g}_s": percentile(stats.ttfts, HEDGE_PERCENTILE),
+                    "tokens_per_second_p50": percentile(stats.tokens_per_second, 50),
+                    "healthy": self.healthy(model),
+                    "hedge_delay_s": self.hedge_delay(model),
+                }
+                for model, stats in self.models.items()
+            },
+        }
+
+
+model_router = ModelRouter(
+    {feature.strip() for feature in MODEL_ROUTING.split(",") if feature.strip()},
+    parse_groups(ROUTING_EQUIVALENT_MODELS),
+)
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model standing in for `model_name` that streams whichever upstream
+    call the router picks. The upstream calls run without callbacks, so token
+    usage, timing and the LangGraph message stream see one ordinary model run
+    with the winning call's chunks and usage; the router accounts for the
+    tokens of the other calls.
+    """
+
+    model_name: str
+    make_llm: Callable[[str], BaseChatModel]
+    router: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "symptex-routed"
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Without an event loop there is no race and no admission slot: the chosen model answers
+        router = self.router or model_router
+        model = router.choose(self.model_name)
+        with breakers.get("chat", model).guard():
+            message = self.make_llm(model).invoke(messages, stop=stop, config={"callbacks": []}, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        def start(model: str) -> AsyncIterator[AIMessageChunk]:
+            return self.make_llm(model).astream(messages, stop=stop, config={"callbacks": []}, **kwargs)
+
+        router = self.router or model_router
+        async with aclosing(router.stream(self.model_name, start, count_message_tokens(messages))) as chunks:
+            async for chunk in chunks:
+                yield ChatGenerationChunk(message=chunk)
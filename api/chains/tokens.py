@@ -0,0 +1,47 @@
+import logging
+import os
+from functools import lru_cache
+
+from langchain_core.messages import BaseMessage
+
+# Set up logging
+logger = logging.getLogger('tokens')
+logger.setLevel(logging.DEBUG)
+
+# tiktoken encoding used to estimate token counts; empty to only use the length heuristic
+TOKENIZER_ENCODING = os.environ.get("TOKENIZER_ENCODING", "cl100k_base")
+# Rough characters per token for German text when no tokenizer is available
+CHARS_PER_TOKEN = 3.5
+# Per-message overhead of the chat format (role markers, separators)
+TOKENS_PER_MESSAGE = 4
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Load the tiktoken encoding once; None if it is disabled or unavailable (e.g. offline)."""
+    if not TOKENIZER_ENCODING:
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning("Tokenizer unavailable, estimating tokens from length: %s", str(e))
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text. The ChatAI models use their own
+    tokenizers, so this is an approximation for budgeting and accounting.
+    """
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return int(len(text) / CHARS_PER_TOKEN) + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list[BaseMessage]) -> int:
+    """Estimate the tokens a list of chat messages occupies in a prompt."""
+    return sum(count_tokens(str(message.content)) + TOKENS_PER_MESSAGE for message in messages)
@@ -0,0 +1,60 @@
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from chains.tokens import count_message_tokens, count_tokens
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    Sums prompt and completion tokens over every chat model call of a run
+    (patient reply, context summary, evaluation). Uses the usage reported by
+    ChatAI and falls back to a local estimate of the actual prompt and
+    completion when a response carries none.
+    """
+
+    # Counting is cheap, no need for a thread hop per callback
+    run_inline = True
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+        self.prompt_estimates: dict[UUID, int] = {}
+
+    def on_chat_model_start(
+        self, serialized: dict[str, Any], messages: list[list[BaseMessage]], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self.prompt_estimates[run_id] = sum(count_message_tokens(prompt) for prompt in messages)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_estimate = self.prompt_estimates.pop(run_id, 0)
+        if not response.generations or not response.generations[0]:
+            return
+        # Symptex always requests a single completion per call
+        generation = response.generations[0][0]
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            self.prompt_tokens += usage.get("input_tokens", 0)
+            self.completion_tokens += usage.get("output_tokens", 0)
+        else:
+            self.prompt_tokens += prompt_estimate
+            self.completion_tokens += count_tokens(generation.text)
+            self.estimated = True
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.prompt_estimates.pop(run_id, None)
+
+    def abort(self, partial_completion: str) -> None:
+        """Account for calls cut off before they reported usage, e.g. because the client disconnected."""
+        self.prompt_tokens += sum(self.prompt_estimates.values())
+        self.prompt_estimates.clear()
+        self.completion_tokens += count_tokens(partial_completion)
+        self.estimated = True
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
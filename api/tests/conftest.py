@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+import pytest_asyncio
+
+# Offline defaults so the app and chains can be imported without a ChatAI key or Postgres
+os.environ.setdefault("CHATAI_API_URL", "http://127.0.0.1:9/v1")
+os.environ.setdefault("CHATAI_API_KEY", "test-key")
+os.environ.setdefault("TOKENIZER_ENCODING", "")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/symptex-test-{os.getpid()}.db")
+
+
+@pytest_asyncio.fixture
+async def db_schema():
+    """Fresh schema in the throwaway test database."""
+    from app.db.db import Base, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def count_queries(db_schema):
+    """Collect the SQL statements executed while the fixture is active."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_schema.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db_schema.sync_engine, "before_cursor_execute", record)
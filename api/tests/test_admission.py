@@ -0,0 +1,155 @@
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from sqlalchemy import func, select
+
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, PatientFile
+from chains.admission import CHAT, EVAL, AdmissionController, admission, parse_limits
+
+CHAT_REQUEST = {
+    "message": "Wo tut es weh?",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausgewogen",
+    "patient_file_id": 3,
+    "session_id": "s1",
+}
+
+
+async def queue(controller, order, name, priority, key):
+    async with controller.slot("m", priority, key):
+        order.append(name)
+
+
+@pytest.mark.asyncio
+async def test_chat_before_eval_and_round_robin_over_sessions():
+    controller = AdmissionController(1, {}, 10)
+    order = []
+    async with controller.slot("m", CHAT, "busy"):
+        waiters = [
+            asyncio.create_task(queue(controller, order, name, priority, key))
+            for name, priority, key in [
+                ("eval a", EVAL, "a"), ("chat a1", CHAT, "a"), ("chat a2", CHAT, "a"), ("chat b", CHAT, "b"),
+            ]
+        ]
+        await asyncio.sleep(0)
+        assert controller.gate("m").waiting == 4
+    await asyncio.gather(*waiters)
+
+    assert order == ["chat a1", "chat b", "chat a2", "eval a"]
+    assert controller.stats()["m"]["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    controller = AdmissionController(1, {}, 10)
+    gate = controller.gate("m")
+    async with controller.slot("m", CHAT, "a"):
+        waiter = asyncio.create_task(queue(controller, [], "b", CHAT, "b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert gate.waiting == 0
+    assert gate.active == 0
+
+
+@pytest.mark.asyncio
+async def test_evaluation_reserves_a_slot_per_concurrent_call():
+    controller = AdmissionController(4, {}, 10)
+    gate = controller.gate("m")
+    active = []
+
+    async def evaluate(key, calls):
+        async with controller.slot("m", EVAL, key, calls):
+            active.append((key, gate.active))
+            await asyncio.sleep(0)
+
+    async with controller.slot("m", CHAT, "a"):
+        parallel = asyncio.create_task(evaluate("parallel", 4))
+        single = asyncio.create_task(evaluate("single", 1))
+        await asyncio.sleep(0)
+        # The parallel evaluation needs the whole limit; the later one does not overtake it
+        assert (gate.active, gate.waiting) == (1, 2)
+    await asyncio.gather(parallel, single)
+
+    assert active == [("parallel", 4), ("single", 1)]
+    # A reservation beyond the limit is capped at the limit
+    async with controller.slot("m", EVAL, "huge", 10):
+        assert gate.active == 4
+    assert gate.active == 0
+
+
+def test_per_model_limits():
+    controller = AdmissionController(16, parse_limits("qwen3-235b-a22b=4, gemma-3-27b-it=24"), 10)
+
+    assert controller.gate("qwen3-235b-a22b").limit == 4
+    assert controller.gate("qwq-32b").limit == 16
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_retry_after(db_schema, monkeypatch):
+    from app.main import app
+
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    gate = admission.gate(CHAT_REQUEST["model"])
+    monkeypatch.setattr(gate, "active", gate.limit)
+    monkeypatch.setattr(gate, "queue_size", 0)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/v1/chat", json=CHAT_REQUEST)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Nothing stored, the student can send the message again
+    async with SessionLocal() as db:
+        assert await db.scalar(select(func.count()).select_from(ChatMessage)) == 0
+
+
+@pytest.mark.asyncio
+async def test_simultaneous_burst_is_bounded_by_the_queue(db_schema, monkeypatch):
+    from app.main import app
+    from app.streams import stream_hub
+    from chains import chat_chain
+
+    class SlowModel(GenericFakeChatModel):
+        async def _astream(self, *args, **kwargs):
+            await asyncio.sleep(0.05)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="In der Hüfte."))
+
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: SlowModel(messages=iter([])))
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    gate = admission.gate(CHAT_REQUEST["model"])
+    monkeypatch.setattr(gate, "limit", 1)
+    monkeypatch.setattr(gate, "queue_size", 2)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # The whole course sends at once, before any request reached the queue
+        responses = await asyncio.gather(*[
+            client.post("/api/v1/chat", json={**CHAT_REQUEST, "session_id": f"s{n}"}) for n in range(12)
+        ])
+        await stream_hub.close()
+
+    statuses = [response.status_code for response in responses]
+    # One running and two waiting; the rest is turned away right away
+    assert statuses.count(200) == 3
+    assert statuses.count(429) == 9
+    assert (gate.active, gate.waiting, gate.reserved) == (0, 0, 0)
+
+
+def test_unused_reservation_gives_its_place_back():
+    controller = AdmissionController(1, {}, 1)
+    gate = controller.gate("m")
+    first = controller.reserve("m")
+    controller.reserve("m")
+
+    assert gate.is_full()
+    first.release()
+    first.release()
+    assert (gate.reserved, gate.is_full()) == (1, False)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from langchain_openai import ChatOpenAI
+from sqlalchemy import func, select
+
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, PatientFile, TokenUsage
+from benchmarks import mock_chatai
+from chains.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers, CircuitOpen
+
+CHAT = {
+    "message": "Wo tut es weh?",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausgewogen",
+    "patient_file_id": 3,
+    "session_id": "s1",
+}
+SSE = {"Accept": "text/event-stream"}
+
+
+def fail(breaker: CircuitBreaker) -> None:
+    with pytest.raises(RuntimeError), breaker.guard():
+        raise RuntimeError("502 Bad Gateway")
+
+
+def test_circuit_opens_and_one_probe_closes_it():
+    breaker = CircuitBreaker("chat", "m", threshold=2, reset_timeout=30)
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.check()
+    assert 1 <= rejected.value.retry_after <= 30
+
+    # Reset timeout over: the first call probes, others still fail fast
+    breaker.opened_at -= 30
+    with breaker.guard():
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpen):
+            breaker.check()
+    assert breaker.state == CLOSED
+
+    fail(breaker)
+    fail(breaker)
+    breaker.opened_at -= 30
+    fail(breaker)
+    assert (breaker.state, breaker.opened) == (OPEN, 3)
+
+
+def test_cancelled_call_does_not_count():
+    breaker = CircuitBreaker("eval", "m", threshold=1, reset_timeout=30)
+    with pytest.raises(asyncio.CancelledError), breaker.guard():
+        raise asyncio.CancelledError()
+    assert (breaker.state, breaker.failures) == (CLOSED, 0)
+
+
+@pytest.mark.asyncio
+async def test_outage_of_stub_server_fails_fast_and_recovers(db_schema, monkeypatch):
+    from app.cache.history import history_cache
+    from app.main import app
+    from app.metrics import FAILED
+    from app.streams import stream_hub
+    from chains import chat_chain, routing
+    from chains.prompt_registry import prompt_registry
+
+    upstream_requests = []
+
+    async def count(request):
+        upstream_requests.append(request.url.path)
+
+    # The mock ChatAI server in-process, without client retries
+    stub = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_chatai.app), event_hooks={"request": [count]})
+    llm = ChatOpenAI(
+        model=CHAT["model"], base_url="http://mock/v1", api_key="mock",
+        http_async_client=stub, max_retries=0, stream_usage=True,
+    )
+    breakers = CircuitBreakers(threshold=2, reset_timeout=0.2)
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: llm)
+    monkeypatch.setattr(chat_chain, "breakers", breakers)
+    monkeypatch.setattr(routing, "breakers", breakers)
+    monkeypatch.setattr("app.main.breakers", breakers)
+    monkeypatch.setattr(mock_chatai.settings, "ttft", 0.0)
+    monkeypatch.setattr(mock_chatai.settings, "tokens_per_second", 1000.0)
+    monkeypatch.setattr(mock_chatai.settings, "error_rate", 1.0)
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    prompt_registry.clear()
+    failed = FAILED.labels("chat", CHAT["model"])._value.get()
+
+    async def turn(client) -> list[tuple[str, dict]]:
+        body = (await client.post("/api/v1/chat", json=CHAT, headers=SSE)).text
+        return [
+            (fields["event"], json.loads(fields["data"]))
+            for block in body.replace("\r\n", "\n").split("\n\n")
+            if "event" in (fields := dict(line.split(": ", 1) for line in block.splitlines() if ": " in line))
+        ]
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for _ in range(2):
+                assert [event for event, _ in await turn(client)] == ["error"]
+            assert len(upstream_requests) == 2
+
+            # Open: an immediate error event, ChatAI is not called
+            events = await turn(client)
+            assert events[0][0] == "error" and "nicht erreichbar" in events[0][1]["message"]
+            assert len(upstream_requests) == 2
+            health = (await client.get("/health")).json()
+            assert health["status"] == "degraded"
+            assert health["circuits"]["chat/gemma-3-27b-it"]["state"] == OPEN
+
+            # Outage over: after the reset timeout a probe goes through and closes the circuit
+            mock_chatai.settings.error_rate = 0.0
+            await asyncio.sleep(0.25)
+            assert [event for event, _ in await turn(client)][-2:] == ["usage", "done"]
+            assert (await client.get("/health")).json()["status"] == "ok"
+            await stream_hub.close()
+
+        # The failed turns are neither in the transcript nor in the context of later turns
+        async with SessionLocal() as db:
+            stored = (await db.execute(select(ChatMessage.role, ChatMessage.content).order_by(ChatMessage.id))).all()
+            usage_rows = await db.scalar(select(func.count()).select_from(TokenUsage))
+            history = await history_cache.get(db, CHAT["session_id"])
+        assert [role for role, _ in stored] == ["user", "patient"]
+        assert "nicht erreichbar" not in stored[1].content
+        assert [message.content for message in history] == [content for _, content in stored]
+        assert usage_rows == 1
+        assert FAILED.labels("chat", CHAT["model"])._value.get() == failed + 3
+    finally:
+        prompt_registry.clear()
+        await stub.aclose()
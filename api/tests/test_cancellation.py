@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from sqlalchemy import inspect, select, text
+
+from app.db.db import SessionLocal
+from app.db.migrations import run_migrations
+from app.db.models import ChatMessage, PatientFile, TokenUsage
+from app.streams import StreamHub
+
+CHAT = {
+    "message": "Erzählen Sie mal von Ihrer Familie.",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausschweifend",
+    "patient_file_id": 3,
+    "session_id": "s1",
+}
+
+
+# Streams of SlowModel that were closed
+closed_streams = []
+
+
+class SlowModel(GenericFakeChatModel):
+    """Streams a long reply slowly and notes when its stream is closed."""
+
+    async def _astream(self, *args, **kwargs):
+        try:
+            for n in range(200):
+                await asyncio.sleep(0.01)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=f"Wort{n} "))
+        finally:
+            closed_streams.append(True)
+
+
+async def post_and_disconnect(app, path: str, body: dict, chunks: int, disconnected: asyncio.Event | None = None) -> str:
+    """
+    Call the app like a client that closes the connection after `chunks` body
+    chunks, or once `disconnected` is set.
+    """
+    received = []
+    disconnected = disconnected or asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            received.append(message["body"])
+            if len(received) >= chunks:
+                disconnected.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"content-type", b"application/json"), (b"host", b"test")],
+        "client": ("127.0.0.1", 1234), "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    return b"".join(received).decode()
+
+
+@pytest_asyncio.fixture
+async def app(db_schema, monkeypatch):
+    from app.main import app
+    from chains import chat_chain
+    from chains.prompt_registry import prompt_registry
+
+    closed_streams.clear()
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: SlowModel(messages=iter([])))
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    prompt_registry.clear()
+    yield app
+    prompt_registry.clear()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_generation_and_keeps_partial_reply(app):
+    from app.metrics import CANCELLED
+    from app.routers.chat import background_tasks
+
+    cancelled = CANCELLED.labels("chat", CHAT["model"])._value.get()
+
+    received = await post_and_disconnect(app, "/api/v1/chat", CHAT, chunks=3)
+    await asyncio.wait_for(asyncio.gather(*background_tasks), 5)
+
+    assert closed_streams == [True]
+    async with SessionLocal() as db:
+        reply = (await db.execute(select(ChatMessage).where(ChatMessage.role == "patient"))).scalar_one()
+        usage = (await db.execute(select(TokenUsage))).scalar_one()
+    assert reply.truncated
+    assert reply.content.startswith(received) and len(reply.content.split()) < 200
+    assert usage.estimated and usage.completion_tokens > 0
+    assert CANCELLED.labels("chat", CHAT["model"])._value.get() == cancelled + 1
+
+
+@pytest.mark.asyncio
+async def test_turn_cancelled_before_the_first_token_is_not_stored(app, monkeypatch):
+    from app.cache.history import history_cache
+    from app.metrics import CANCELLED
+    from app.routers.chat import background_tasks
+    from chains import chat_chain
+
+    called = asyncio.Event()
+
+    class Silent(GenericFakeChatModel):
+        async def _astream(self, *args, **kwargs):
+            # The client leaves while the model has not sent anything yet
+            called.set()
+            await asyncio.sleep(5)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="Zu spät."))
+
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: Silent(messages=iter([])))
+    history_cache.invalidate(CHAT["session_id"])
+    cancelled = CANCELLED.labels("chat", CHAT["model"])._value.get()
+
+    assert await post_and_disconnect(app, "/api/v1/chat", CHAT, chunks=1, disconnected=called) == ""
+    await asyncio.wait_for(asyncio.gather(*background_tasks), 5)
+
+    async with SessionLocal() as db:
+        assert (await db.execute(select(ChatMessage))).scalars().all() == []
+        assert (await db.execute(select(TokenUsage))).scalars().all() == []
+        assert await history_cache.get(db, CHAT["session_id"]) == []
+    assert CANCELLED.labels("chat", CHAT["model"])._value.get() == cancelled + 1
+
+
+@pytest.mark.asyncio
+async def test_reset_waits_only_for_its_own_session(app):
+    import httpx
+    from app.routers.chat import background_tasks
+
+    other = asyncio.create_task(asyncio.sleep(60))
+    background_tasks[other] = "s2"
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await asyncio.wait_for(client.post("/api/v1/reset/s1"), 5)
+    finally:
+        other.cancel()
+        background_tasks.pop(other, None)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_is_cancelled():
+    hub = StreamHub(replay_size=10, retention=60, abandon_timeout=0)
+
+    async def endless():
+        while True:
+            await asyncio.sleep(0.01)
+            yield "token", {"text": "bla"}
+
+    stream = hub.start(endless(), key="s1")
+    stream.subscribers += 1
+    await asyncio.sleep(0.05)
+    hub.leave(stream)
+    await asyncio.wait_for(asyncio.wait([stream.task]), 1)
+
+    assert stream.finished and stream.task.cancelled()
+    assert stream.events[-1].event == "error"
+    assert hub.stats()["abandoned"] == 1
+
+
+@pytest.mark.asyncio
+async def test_migration_adds_truncated_column(db_schema):
+    async with db_schema.begin() as conn:
+        await conn.execute(text("ALTER TABLE chat_messages DROP COLUMN truncated"))
+
+    await run_migrations(db_schema)
+
+    async with db_schema.connect() as conn:
+        columns = await conn.run_sync(lambda c: [col["name"] for col in inspect(c).get_columns("chat_messages")])
+        await conn.execute(text("DROP TABLE schema_migrations"))
+    assert "truncated" in columns
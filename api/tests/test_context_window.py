@@ -0,0 +1,87 @@
+import itertools
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from chains import chat_chain
+from chains.prompt_registry import prompt_registry
+
+
+def conversation(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(f"Frage {i}: " + "Wie lange haben Sie die Beschwerden schon? " * 5))
+        messages.append(AIMessage(f"Antwort {i}: " + "Ach, das weiß ich nicht mehr so genau. " * 5))
+    return messages
+
+
+@pytest.fixture
+def patient_calls(monkeypatch):
+    """Record the prompts sent to the patient model and fake the summary model."""
+    calls = []
+
+    def patient_llm(model):
+        def reply(prompt_value):
+            calls.append(prompt_value.to_messages())
+            return AIMessage("Na ja ...")
+        return RunnableLambda(reply)
+
+    summaries = itertools.count()
+    monkeypatch.setattr(chat_chain, "get_llm", patient_llm)
+    monkeypatch.setattr(
+        chat_chain,
+        "get_summary_llm",
+        lambda model: GenericFakeChatModel(messages=(AIMessage(f"Zusammenfassung {n}") for n in summaries)),
+    )
+    monkeypatch.setattr(chat_chain, "CONTEXT_TOKEN_BUDGET", 300)
+    prompt_registry.clear()
+    chat_chain.summaries.invalidate("s1")
+    yield calls
+    prompt_registry.clear()
+    chat_chain.summaries.invalidate("s1")
+
+
+def test_plan_context_keeps_history_within_budget(monkeypatch):
+    monkeypatch.setattr(chat_chain, "CONTEXT_TOKEN_BUDGET", 300)
+    short = conversation(2)
+    assert chat_chain.plan_context(short, 0, 0) == 0
+
+    long = conversation(10) + [HumanMessage("Haben Sie Schmerzen?")]
+    split = chat_chain.plan_context(long, 0, 0)
+    assert isinstance(long[split], HumanMessage)
+    assert len(long) - split >= chat_chain.CONTEXT_MIN_RECENT_MESSAGES
+    assert chat_chain.count_message_tokens(long[split:]) < chat_chain.count_message_tokens(long) / 2
+
+
+@pytest.mark.asyncio
+async def test_older_turns_are_summarized_once_and_not_streamed(patient_calls):
+    state = {
+        "model": "qwq-32b",
+        "condition": "default",
+        "talkativeness": "ausgewogen",
+        "patient_details": "Name: Anna Zank",
+        "session_id": "s1",
+    }
+    history = conversation(10)
+
+    streamed = []
+    async for msg, metadata in chat_chain.symptex_model.astream(
+        {**state, "messages": history + [HumanMessage("Haben Sie Schmerzen?")]},
+        stream_mode="messages",
+    ):
+        streamed.append(msg.content)
+
+    sent = patient_calls[-1]
+    assert "Zusammenfassung 0" in sent[0].content
+    assert sent[-1].content == "Haben Sie Schmerzen?"
+    assert sum(m.content == "Haben Sie Schmerzen?" for m in sent) == 1
+    assert not any("Zusammenfassung" in chunk for chunk in streamed)
+    covered, summary = chat_chain.summaries.get("s1")
+
+    # The next turn fits again and reuses the cached summary
+    history += [HumanMessage("Haben Sie Schmerzen?"), AIMessage("Na ja ...")]
+    await chat_chain.symptex_model.ainvoke({**state, "messages": history + [HumanMessage("Wo genau?")]})
+    assert chat_chain.summaries.get("s1") == (covered, summary)
+    assert "Zusammenfassung 0" in patient_calls[-1][0].content
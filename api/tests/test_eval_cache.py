@@ -0,0 +1,35 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.cache.evaluation import EvaluationCache, evaluation_key, replay
+from app.db.db import SessionLocal
+from chains import eval_chain
+
+
+def test_key_ignores_whitespace_but_not_content_or_rubric(monkeypatch):
+    transcript = [HumanMessage("Wo tut es weh?"), AIMessage("In der  Hüfte.\n")]
+
+    key = evaluation_key(transcript)
+
+    assert key == evaluation_key([HumanMessage(" Wo tut es weh?"), AIMessage("In der Hüfte.")])
+    assert key != evaluation_key([HumanMessage("Wo tut es weh?"), AIMessage("Im Knie.")])
+    assert key != evaluation_key([AIMessage("Wo tut es weh?"), AIMessage("In der Hüfte.")])
+    monkeypatch.setattr(eval_chain, "RUBRIC_VERSION", "cri-ht-2")
+    assert key != evaluation_key(transcript)
+
+
+@pytest.mark.asyncio
+async def test_database_tier_outlives_memory_and_errors_are_not_cached(db_schema):
+    feedback = "**Gesamtbewertung: 4/5**\n- **Stärken**: Gesprächsführung\n"
+    async with SessionLocal() as db:
+        await EvaluationCache(maxsize=4).put(db, "k1", feedback)
+        await EvaluationCache(maxsize=4).put(db, "k2", f"{eval_chain.EVAL_ERROR}: timeout")
+
+    cache = EvaluationCache(maxsize=4)
+    async with SessionLocal() as db:
+        assert await cache.get(db, "k1") == feedback
+        assert await cache.get(db, "k1") == feedback
+        assert await cache.get(db, "k2") is None
+
+    assert (cache.db_hits, cache.memory_hits, cache.misses) == (1, 1, 1)
+    assert "".join([chunk async for chunk in replay(feedback)]) == feedback
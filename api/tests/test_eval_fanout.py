@@ -0,0 +1,34 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chains import eval_chain
+from chains.errors import ErrorText
+
+
+@pytest.mark.asyncio
+async def test_fan_out_streams_sections_and_computes_overall(monkeypatch):
+    replies = [AIMessage(f"<think>\n</think>\n\n{i}. **Kriterium {i}: {4 if i % 2 else 5}/5**\n    - **Begründung:** ...")
+               for i in range(1, 8)]
+    replies.append(AIMessage("Dazu kann ich nichts sagen."))
+    monkeypatch.setattr(eval_chain, "EVAL_MODE", "parallel")
+    monkeypatch.setattr(eval_chain, "get_rating_llm", lambda: GenericFakeChatModel(messages=iter(replies)))
+
+    chunks = [chunk async for chunk in eval_chain.eval_history([HumanMessage("Wo tut es weh?")])]
+
+    assert chunks[0] == eval_chain.EVAL_HEADER
+    assert len(chunks) == 1 + len(eval_chain.CRITERIA) + 1
+    assert not any("<think>" in chunk for chunk in chunks)
+    # 4 criteria rated 4, 3 rated 5, one without a score
+    assert chunks[-1].startswith("**Gesamtbewertung: 4,4/5** (aus 7 von 8 Kriterien)")
+    assert not any(isinstance(chunk, ErrorText) for chunk in chunks)
+
+
+def test_overall_lists_strengths_and_weaknesses():
+    overall = eval_chain.format_overall({"Symptome präzisieren": 5, "Zusammenfassung geben": 2})
+
+    assert overall.splitlines() == [
+        "**Gesamtbewertung: 3,5/5** (aus 2 von 8 Kriterien)",
+        "- **Stärken**: Symptome präzisieren",
+        "- **Verbesserungspotenzial**: Zusammenfassung geben",
+    ]
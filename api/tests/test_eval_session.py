@@ -0,0 +1,143 @@
+import httpx
+import pytest
+import pytest_asyncio
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from sqlalchemy import select
+
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, ChatSession, EvaluationResult, PatientFile, TokenUsage
+
+
+@pytest_asyncio.fixture
+async def client(db_schema, monkeypatch):
+    from app.cache.evaluation import evaluation_cache
+    from app.cache.history import history_cache
+    from app.main import app
+    import chains.eval_chain
+
+    prompts = []
+
+    class RecordingModel(GenericFakeChatModel):
+        async def _astream(self, messages, *args, **kwargs):
+            prompts.append(messages)
+            async for chunk in super()._astream(messages, *args, **kwargs):
+                yield chunk
+
+    monkeypatch.setattr(
+        chains.eval_chain, "get_rating_llm",
+        lambda: RecordingModel(messages=iter([AIMessage("3. **Symptome präzisieren: 3/5**\n\n**Gesamtbewertung: 4/5**")])),
+    )
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        db.add(ChatSession(id="s1", patient_file_id=3))
+        db.add(TokenUsage(session_id="s1", kind="chat", model="gemma-3-27b-it", condition="alzheimer"))
+        db.add_all([
+            ChatMessage(session_id="s1", role="user", content="Wo tut es weh?"),
+            ChatMessage(session_id="s1", role="patient", content="In der Hüfte."),
+        ])
+        await db.commit()
+    history_cache.invalidate("s1")
+    evaluation_cache.feedback.clear()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        client.prompts = prompts
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_session_is_evaluated_from_stored_history(client):
+    response = await client.post("/api/v1/eval/s1")
+
+    assert response.status_code == 200
+    assert response.text.endswith("**Gesamtbewertung: 4/5**")
+    conversation = [m.content for m in client.prompts[0][1:]]
+    assert conversation == ["Wo tut es weh?", "In der Hüfte."]
+    async with SessionLocal() as db:
+        usage = (await db.execute(select(TokenUsage).where(TokenUsage.kind == "eval"))).scalar_one()
+    assert (usage.session_id, usage.kind) == ("s1", "eval")
+
+
+@pytest.mark.asyncio
+async def test_scores_are_stored_once_per_session(client):
+    await client.post("/api/v1/eval/s1")
+    await client.post("/api/v1/eval/s1")
+
+    async with SessionLocal() as db:
+        result = (await db.execute(select(EvaluationResult))).scalar_one()
+    assert (result.session_id, result.patient_file_id) == ("s1", 3)
+    assert (result.score_symptom_detail, result.score_summary, result.overall_score) == (3, None, 4.0)
+    # Condition and model come from the session's last chat turn
+    assert (result.condition, result.model) == ("alzheimer", "gemma-3-27b-it")
+
+
+@pytest.mark.asyncio
+async def test_repeated_evaluation_is_replayed_from_cache(client):
+    first = await client.post("/api/v1/eval/s1")
+    second = await client.post("/api/v1/eval/s1")
+
+    assert second.text == first.text
+    assert len(client.prompts) == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_session_is_404(client):
+    assert (await client.post("/api/v1/eval/nope")).status_code == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("headers", [{}, {"Accept": "text/event-stream"}])
+async def test_no_connection_is_held_while_the_evaluation_streams(client, monkeypatch, headers):
+    from app.db.db import pool_monitor
+    from app.streams import stream_hub
+    import chains.eval_chain
+
+    checked_out = []
+
+    class CheckoutProbe(GenericFakeChatModel):
+        async def _astream(self, *args, **kwargs):
+            checked_out.append(len(pool_monitor.checkouts))
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+    monkeypatch.setattr(
+        chains.eval_chain, "get_rating_llm",
+        lambda: CheckoutProbe(messages=iter([AIMessage("**Gesamtbewertung: 4/5**")])),
+    )
+    response = await client.post("/api/v1/eval/s1", headers=headers)
+    await stream_hub.close()
+
+    assert response.status_code == 200
+    assert checked_out == [0]
+
+
+@pytest.mark.asyncio
+async def test_evaluation_with_an_unrated_criterion_is_not_stored(client, monkeypatch):
+    from app.cache.evaluation import evaluation_cache
+    import chains.eval_chain
+
+    await client.post("/api/v1/eval/s1")
+    unrated = chains.eval_chain.CRITERIA[2][0]
+
+    class Flaky(GenericFakeChatModel):
+        def _generate(self, messages, *args, **kwargs):
+            if unrated in messages[0].content:
+                raise RuntimeError("ChatAI nicht erreichbar")
+            return super()._generate(messages, *args, **kwargs)
+
+    monkeypatch.setattr(chains.eval_chain, "EVAL_MODE", "parallel")
+    monkeypatch.setattr(
+        chains.eval_chain, "get_rating_llm",
+        lambda: Flaky(messages=iter([AIMessage("**Kriterium: 5/5**") for _ in chains.eval_chain.CRITERIA])),
+    )
+    response = await client.post("/api/v1/eval/s1", headers={"Accept": "text/event-stream"})
+
+    assert response.status_code == 200
+    assert "event: error" in response.text
+    assert "ChatAI nicht erreichbar" in response.text
+    async with SessionLocal() as db:
+        result = (await db.execute(select(EvaluationResult))).scalar_one()
+        usage = (await db.execute(select(TokenUsage).where(TokenUsage.kind == "eval"))).scalars().all()
+    # The earlier complete evaluation is kept; the partial one is neither cached, scored nor stored
+    assert (result.score_symptom_detail, result.overall_score) == (3, 4.0)
+    assert len(usage) == 1
+    assert len(evaluation_cache.feedback) == 1
@@ -0,0 +1,58 @@
+import datetime
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.db.db import SessionLocal
+from app.db.models import EvaluationResult
+from app.routers import analytics
+from chains.eval_chain import ScoreExtractor
+
+
+def test_scores_are_extracted_across_chunk_boundaries():
+    rubric = (
+        "**Personalisierte Bewertung der Anamnese**\n\n---\n\n"
+        "1. **Gesprächsführung übernehmen: 4/5**\n    - **Begründung:** ...\n\n"
+        "3. **Symptome präzisieren: 2/5**\n    - **Begründung:** ...\n\n"
+        "**Gesamtbewertung: 3,5/5**\n- **Stärken**: ..."
+    )
+    extractor = ScoreExtractor()
+    for i in range(0, len(rubric), 5):
+        extractor.feed(rubric[i:i + 5])
+        if i < rubric.index("Symptome"):
+            assert "Symptome präzisieren" not in extractor.scores
+    extractor.close()
+
+    assert extractor.scores == {"Gesprächsführung übernehmen": 4, "Symptome präzisieren": 2}
+    assert extractor.overall_score() == 3.5
+
+
+@pytest.mark.asyncio
+async def test_aggregates_by_condition_and_model(db_schema):
+    app = FastAPI()
+    app.include_router(analytics.router, prefix="/api/v1")
+    now = datetime.datetime(2025, 10, 1, 12, 0)
+    async with SessionLocal() as db:
+        db.add_all([
+            EvaluationResult(condition="alzheimer", model="m1", score_summary=2, overall_score=3.0, created_at=now),
+            EvaluationResult(condition="alzheimer", model="m1", score_summary=4, overall_score=4.0, created_at=now),
+            EvaluationResult(condition="default", model="m1", overall_score=5.0, created_at=now),
+            EvaluationResult(condition="alzheimer", model="m1", overall_score=1.0,
+                             created_at=now - datetime.timedelta(days=30)),
+        ])
+        await db.commit()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/api/v1/analytics/evaluations", params={
+            "group_by": ["condition", "model"], "since": "2025-09-15T00:00:00+00:00",
+        })
+        invalid = await client.get("/api/v1/analytics/evaluations", params={"group_by": "student"})
+
+    groups = response.json()
+    assert [(g["condition"], g["model"], g["sessions"], g["overall_score"]) for g in groups] == [
+        ("alzheimer", "m1", 2, 3.5),
+        ("default", "m1", 1, 5.0),
+    ]
+    assert groups[0]["criteria"]["Zusammenfassung geben"] == 3.0
+    assert invalid.status_code == 400
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+import pytest_asyncio
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.cache.history import HistoryCache
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, ChatSession
+
+
+@pytest_asyncio.fixture
+async def session_id(db_schema):
+    async with SessionLocal() as db:
+        db.add(ChatSession(id="s1"))
+        db.add_all([
+            ChatMessage(session_id="s1", role="user", content="Wie geht es Ihnen?"),
+            ChatMessage(session_id="s1", role="patient", content="Es geht so."),
+        ])
+        await db.commit()
+    return "s1"
+
+
+@pytest.mark.asyncio
+async def test_history_is_read_once_and_written_through(session_id, count_queries):
+    cache = HistoryCache(maxsize=8, ttl=60)
+    async with SessionLocal() as db:
+        first = await cache.get(db, session_id)
+        cache.append(session_id, HumanMessage("Haben Sie Schmerzen?"))
+        cache.append(session_id, AIMessage("Die Hüfte ..."))
+        second = await cache.get(db, session_id)
+
+    assert len(count_queries) == 1
+    assert [m.content for m in first] == ["Wie geht es Ihnen?", "Es geht so."]
+    assert [type(m) for m in second] == [HumanMessage, AIMessage, HumanMessage, AIMessage]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["messages"]) == (1, 1, 4)
+    assert stats["memory_bytes"] > 0
+
+
+@pytest.mark.asyncio
+async def test_expired_history_falls_back_to_database(session_id, count_queries):
+    cache = HistoryCache(maxsize=8, ttl=0.01)
+    async with SessionLocal() as db:
+        await cache.get(db, session_id)
+        time.sleep(0.02)
+        history = await cache.get(db, session_id)
+
+    assert len(count_queries) == 2
+    assert len(history) == 2
@@ -0,0 +1,34 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from app.metrics import RequestTimer, StreamTimingHandler
+
+
+def test_server_timing_lists_recorded_stages():
+    timer = RequestTimer("chat")
+    timer.record("parse", 0.0012)
+    with timer.stage("history_load"):
+        pass
+    timer.record("parse", 0.0008)
+
+    header = timer.server_timing()
+
+    assert header.startswith("parse;dur=2.0, history_load;dur=")
+
+
+@pytest.mark.asyncio
+async def test_stream_timing_separates_summary_from_reply():
+    timer = RequestTimer("chat")
+    timing = StreamTimingHandler(timer, "fake")
+    summary_llm = GenericFakeChatModel(messages=iter([AIMessage("Zusammenfassung")]))
+    reply_llm = GenericFakeChatModel(messages=iter([AIMessage("Es geht mir gut, danke.")]))
+
+    await summary_llm.ainvoke([HumanMessage("Fasse zusammen")], config={"callbacks": [timing], "tags": [TAG_NOSTREAM]})
+    chunks = [c async for c in reply_llm.astream([HumanMessage("Wie geht es?")], config={"callbacks": [timing]})]
+    timing.finish()
+
+    assert len(chunks) > 1
+    assert {"summarize", "prompt_build", "upstream_ttft"} <= timer.stages.keys()
+    assert not timing.summary_runs
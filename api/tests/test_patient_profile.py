@@ -0,0 +1,56 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app.cache.patient_profile import PatientProfileCache, patient_profiles
+from app.db.db import SessionLocal
+from app.db.models import Anamnesis, PatientFile
+
+
+@pytest_asyncio.fixture
+async def patient_file_id(db_schema):
+    async with SessionLocal() as db:
+        patient_file = PatientFile(
+            first_name="Anna",
+            last_name="Zank",
+            anamneses=[
+                Anamnesis(category="Allergien", answer="keine"),
+                Anamnesis(category="medikamente", answer="Ramipril"),
+            ],
+        )
+        db.add(patient_file)
+        await db.commit()
+        return patient_file.id
+
+
+@pytest.mark.asyncio
+async def test_profile_is_loaded_in_one_query_and_cached(patient_file_id, count_queries):
+    cache = PatientProfileCache(maxsize=2)
+    async with SessionLocal() as db:
+        first = await cache.get(db, patient_file_id)
+        second = await cache.get(db, patient_file_id)
+
+    assert first is second
+    assert len(count_queries) == 1
+    assert "Ramipril" in first and "Keine Angaben" in first
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_patient_is_not_cached(patient_file_id):
+    cache = PatientProfileCache(maxsize=2)
+    async with SessionLocal() as db:
+        assert await cache.get(db, patient_file_id + 1) is None
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_editing_anamnesis_invalidates_profile(patient_file_id):
+    async with SessionLocal() as db:
+        assert "keine" in await patient_profiles.get(db, patient_file_id)
+
+        allergy = await db.scalar(select(Anamnesis).where(Anamnesis.category == "Allergien"))
+        allergy.answer = "Penicillin"
+        await db.commit()
+
+        assert "Penicillin" in await patient_profiles.get(db, patient_file_id)
@@ -0,0 +1,169 @@
+"""
+Performance budgets of the API, run in-process against a fake streaming model.
+
+A turn must run the same number of SQL statements however long the session
+already is, so N+1 queries and per-message work in chat.py, the caches or
+formatting.py fail here instead of in production. The latency budgets of
+/chat and /eval are loose enough for a slow CI machine but catch quadratic
+work on long sessions.
+"""
+import datetime
+import itertools
+import time
+
+import httpx
+import pytest
+import pytest_asyncio
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.db.db import SessionLocal
+from app.db.models import Anamnesis, ChatMessage, ChatSession, PatientFile
+
+# SQL statements of a turn on a new session, and once its caches are warm
+CHAT_QUERY_BUDGET = 6
+WARM_CHAT_QUERY_BUDGET = 4
+# Statements of an evaluation of a stored session (cache miss)
+EVAL_QUERY_BUDGET = 8
+# Seconds a turn on a long session may take with an instant model
+CHAT_LATENCY_BUDGET = 1.0
+# Seconds an evaluation of a long session may take with an instant model
+EVAL_LATENCY_BUDGET = 1.0
+
+PATIENT_FILE_ID = 3
+CHAT = {
+    "message": "Wie lange haben Sie die Schmerzen schon?",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausgewogen",
+    "patient_file_id": PATIENT_FILE_ID,
+}
+
+
+@pytest_asyncio.fixture
+async def client(db_schema, monkeypatch):
+    from app.cache.evaluation import evaluation_cache
+    from app.cache.patient_profile import patient_profiles
+    from app.main import app
+    from chains import chat_chain, eval_chain
+    from chains.prompt_registry import prompt_registry
+
+    def fake_llm(*args):
+        return GenericFakeChatModel(messages=itertools.repeat(AIMessage("Na ja, seit ein paar Tagen schon.")))
+
+    monkeypatch.setattr(chat_chain, "get_llm", fake_llm)
+    monkeypatch.setattr(chat_chain, "get_summary_llm", fake_llm)
+    monkeypatch.setattr(
+        eval_chain, "get_rating_llm",
+        lambda: GenericFakeChatModel(messages=itertools.repeat(AIMessage("**Gesamtbewertung: 3/5**"))),
+    )
+    async with SessionLocal() as db:
+        db.add(PatientFile(
+            id=PATIENT_FILE_ID, first_name="Anna", last_name="Zank",
+            anamneses=[Anamnesis(category=f"Kategorie {i}", answer="keine") for i in range(50)],
+        ))
+        await db.commit()
+    patient_profiles.invalidate(PATIENT_FILE_ID)
+    evaluation_cache.feedback.clear()
+    prompt_registry.clear()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    prompt_registry.clear()
+
+
+async def seed_session(session_id: str, messages: int) -> str:
+    from app.cache.history import history_cache
+    from chains.chat_chain import summaries
+
+    started = datetime.datetime(2025, 10, 1, 9, 0)
+    async with SessionLocal() as db:
+        db.add(ChatSession(id=session_id, patient_file_id=PATIENT_FILE_ID))
+        db.add_all(
+            ChatMessage(session_id=session_id, role="user" if i % 2 == 0 else "patient",
+                        content=f"Nachricht {i}", timestamp=started + datetime.timedelta(seconds=i))
+            for i in range(messages)
+        )
+        await db.commit()
+    history_cache.invalidate(session_id)
+    summaries.invalidate(session_id)
+    return session_id
+
+
+async def chat_turn(client, session_id: str, count_queries: list) -> tuple[int, float]:
+    """Run one /chat turn; return its SQL statement count and duration."""
+    count_queries.clear()
+    started = time.perf_counter()
+    response = await client.post("/api/v1/chat", json={**CHAT, "session_id": session_id})
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+    assert response.text == "Na ja, seit ein paar Tagen schon."
+    return len(count_queries), elapsed
+
+
+@pytest.mark.asyncio
+async def test_chat_queries_do_not_grow_with_history(client, count_queries):
+    from app.cache.patient_profile import patient_profiles
+
+    counts = {}
+    for length in (2, 400):
+        session_id = await seed_session(f"s{length}", length)
+        patient_profiles.invalidate(PATIENT_FILE_ID)
+        counts[length], _ = await chat_turn(client, session_id, count_queries)
+
+    assert counts[2] == counts[400]
+    assert counts[400] <= CHAT_QUERY_BUDGET
+
+
+@pytest.mark.asyncio
+async def test_warm_chat_turn_stays_within_budget(client, count_queries):
+    session_id = await seed_session("long", 1000)
+    await chat_turn(client, session_id, count_queries)
+
+    queries, elapsed = await chat_turn(client, session_id, count_queries)
+
+    assert queries <= WARM_CHAT_QUERY_BUDGET
+    assert elapsed < CHAT_LATENCY_BUDGET
+
+
+@pytest.mark.asyncio
+async def test_new_session_turn_stays_within_budget(client, count_queries):
+    queries, _ = await chat_turn(client, "new", count_queries)
+
+    assert queries <= CHAT_QUERY_BUDGET
+
+
+@pytest.mark.asyncio
+async def test_eval_queries_do_not_grow_with_history(client, count_queries):
+    counts = {}
+    for length in (2, 400):
+        session_id = await seed_session(f"s{length}", length)
+        count_queries.clear()
+        response = await client.post(f"/api/v1/eval/{session_id}")
+        assert response.status_code == 200
+        counts[length] = len(count_queries)
+
+    assert counts[2] == counts[400]
+    assert counts[400] <= EVAL_QUERY_BUDGET
+
+
+@pytest.mark.asyncio
+async def test_eval_of_long_session_stays_within_budget(client):
+    session_id = await seed_session("long", 1000)
+    transcript = [
+        {"role": "user" if i % 2 == 0 else "patient", "output": f"Frage oder Antwort {i}"}
+        for i in range(1000)
+    ]
+    # The first evaluation of the process builds its chain
+    await client.post(f"/api/v1/eval/{await seed_session('short', 2)}")
+
+    for request in (
+        client.post(f"/api/v1/eval/{session_id}"),
+        client.post("/api/v1/eval", json={"messages": transcript}),
+    ):
+        started = time.perf_counter()
+        response = await request
+        elapsed = time.perf_counter() - started
+
+        assert response.status_code == 200
+        assert response.text.endswith("**Gesamtbewertung: 3/5**")
+        assert elapsed < EVAL_LATENCY_BUDGET
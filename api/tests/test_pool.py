@@ -0,0 +1,43 @@
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from app.db.pool import PoolMonitor, current_request
+
+
+def make_engine(monitor: PoolMonitor):
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=1)
+    monitor.attach(engine)
+    return engine
+
+
+def test_pool_monitor_tracks_checkouts_and_overflow():
+    monitor = PoolMonitor(leak_threshold=60)
+    engine = make_engine(monitor)
+
+    with engine.connect() as first, engine.connect() as second:
+        first.execute(text("SELECT 1"))
+        second.execute(text("SELECT 1"))
+        assert monitor.stats()["checked_out"] == 2
+    stats = monitor.stats()
+    assert stats["checked_out"] == 0
+    assert stats["overflow_events"] == 1
+    assert stats["leaks_detected"] == 0
+
+
+def test_pool_monitor_reports_long_held_connection_once(caplog):
+    monitor = PoolMonitor(leak_threshold=0.01)
+    engine = make_engine(monitor)
+
+    token = current_request.set("POST /api/v1/chat")
+    try:
+        with engine.connect():
+            time.sleep(0.02)
+            monitor.check_leaks()
+            monitor.check_leaks()
+    finally:
+        current_request.reset(token)
+
+    assert monitor.leaks_detected == 1
+    assert "POST /api/v1/chat" in caplog.text
@@ -0,0 +1,48 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from chains.prompt_registry import PromptRegistry
+
+PATIENT_A = "Name: Anna Zank"
+PATIENT_B = "Name: Maria Meier"
+
+
+def fake_llm(model: str) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([AIMessage(content=model)]))
+
+
+def test_chain_is_built_once_per_model():
+    registry = PromptRegistry(maxsize=4)
+
+    first = registry.get_chain("alzheimer", "ausgewogen", PATIENT_A, "qwq-32b", fake_llm)
+    again = registry.get_chain("alzheimer", "ausgewogen", PATIENT_A, "qwq-32b", fake_llm)
+    other_model = registry.get_chain("alzheimer", "ausgewogen", PATIENT_A, "gemma-3-27b-it", fake_llm)
+
+    assert first is again
+    assert other_model is not first
+    assert other_model.first is first.first
+    assert registry.stats() == {"size": 1, "maxsize": 4, "hits": 2, "misses": 1}
+
+
+def test_least_recently_used_prompt_is_evicted():
+    registry = PromptRegistry(maxsize=2)
+    registry.get_prompt("default", "ausgewogen", PATIENT_A)
+    registry.get_prompt("alzheimer", "ausgewogen", PATIENT_A)
+    registry.get_prompt("default", "ausgewogen", PATIENT_A)
+    registry.get_prompt("schwerhörig", "ausgewogen", PATIENT_A)
+
+    assert registry.stats()["size"] == 2
+    registry.get_prompt("default", "ausgewogen", PATIENT_A)
+    assert registry.stats()["misses"] == 3
+
+
+def test_evict_patient_only_drops_that_patient():
+    registry = PromptRegistry(maxsize=8)
+    registry.get_prompt("default", "ausgewogen", PATIENT_A)
+    registry.get_prompt("alzheimer", "kurz angebunden", PATIENT_A)
+    registry.get_prompt("default", "ausgewogen", PATIENT_B)
+
+    registry.evict_patient(PATIENT_A)
+
+    assert registry.stats()["size"] == 1
+    assert "Maria Meier" in registry.get_prompt("default", "ausgewogen", PATIENT_B).messages[0].prompt.template
@@ -0,0 +1,194 @@
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from sqlalchemy import select
+
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, PatientFile
+from chains import routing
+from chains.admission import CHAT as CHAT_PRIORITY, AdmissionController
+from chains.breaker import CLOSED, OPEN, CircuitBreakers
+from chains.routing import ModelRouter, RoutedChatModel
+
+CHAT = {
+    "message": "Wo tut es weh?",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausgewogen",
+    "patient_file_id": 3,
+    "session_id": "s1",
+}
+
+# Models whose upstream stream was closed
+closed = []
+
+
+class FakeUpstream(GenericFakeChatModel):
+    """Waits `delay` seconds before streaming its reply word by word."""
+
+    delay: float = 0.0
+    reply: str = ""
+
+    async def _astream(self, *args, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+            for word in self.reply.split(" "):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        finally:
+            closed.append(self.reply)
+
+
+def chunks_of(text: str):
+    async def stream(model):
+        for word in text.split():
+            yield AIMessageChunk(content=word)
+    return stream
+
+
+def trained(router: ModelRouter, model: str, ttft: float, tokens_per_second: float) -> None:
+    stats = router.model_stats(model)
+    stats.ttfts.extend([ttft] * routing.ROUTING_MIN_SAMPLES)
+    stats.tokens_per_second.extend([tokens_per_second] * routing.ROUTING_MIN_SAMPLES)
+
+
+@pytest.mark.asyncio
+async def test_slow_first_token_is_hedged_and_loser_cancelled(monkeypatch):
+    monkeypatch.setattr(routing, "HEDGE_DEFAULT_DELAY", 0.05)
+    router = ModelRouter({"hedge"}, [{"big", "small"}])
+    cancelled = []
+
+    def start(model):
+        if model == "big":
+            async def never():
+                try:
+                    await asyncio.sleep(5)
+                    yield AIMessageChunk(content="zu spät")
+                finally:
+                    cancelled.append(model)
+            return never()
+        return chunks_of("In der Hüfte")(model)
+
+    reply = [chunk.content async for chunk in router.stream("big", start, prompt_tokens=40)]
+    await asyncio.sleep(0)
+
+    assert reply == ["In", "der", "Hüfte"]
+    assert cancelled == ["big"]
+    assert (router.hedged, router.hedge_wins) == (1, 1)
+    # The cancelled call still counts as a (lower bound) TTFT sample
+    assert len(router.model_stats("big").ttfts) == 1
+    # The losing call was billed for its prompt; the reply reports the winner's usage
+    big, small = router.stats()["models"]["big"], router.stats()["models"]["small"]
+    assert (big["extra_calls"], big["extra_prompt_tokens"], big["extra_completion_tokens"]) == (1, 40, 0)
+    assert small["extra_calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_takes_a_slot_of_its_model_or_is_skipped(monkeypatch):
+    monkeypatch.setattr(routing, "HEDGE_DEFAULT_DELAY", 0.05)
+    controller = AdmissionController(1, {}, 10)
+    monkeypatch.setattr(routing, "admission", controller)
+    router = ModelRouter({"hedge"}, [{"big", "small"}])
+    active = []
+
+    def start(model):
+        async def reply():
+            # The turn itself holds the slot of "big"
+            active.append((model, controller.gate("big").active, controller.gate("small").active))
+            await asyncio.sleep(0.2 if model == "big" else 0)
+            yield AIMessageChunk(content=model)
+        return reply()
+
+    assert [chunk.content async for chunk in router.stream("big", start)] == ["small"]
+    assert active[-1] == ("small", 0, 1)
+    assert controller.gate("small").active == 0
+
+    # No free slot of "small": the late reply is waited for instead of hedged
+    async with controller.slot("small", CHAT_PRIORITY, "other student"):
+        assert [chunk.content async for chunk in router.stream("big", start)] == ["big"]
+    assert (router.hedged, router.hedges_skipped) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_failure_before_first_token_fails_over(monkeypatch):
+    breakers = CircuitBreakers(threshold=1, reset_timeout=30)
+    monkeypatch.setattr(routing, "breakers", breakers)
+    router = ModelRouter({"hedge"}, [{"big", "small"}])
+
+    def start(model):
+        if model == "big":
+            async def broken():
+                raise RuntimeError("502 Bad Gateway")
+                yield
+            return broken()
+        return chunks_of("Hier")(model)
+
+    assert [chunk.content async for chunk in router.stream("big", start, prompt_tokens=40)] == ["Hier"]
+    assert router.failovers == 1
+    assert (router.model_stats("big").extra_calls, router.model_stats("small").extra_calls) == (1, 0)
+    assert router.model_stats("big").failures == 1
+    # The failure counts against the model that failed, the reply against the one that served it
+    assert breakers.get("chat", "big").state == OPEN
+    assert breakers.get("chat", "small").state == CLOSED
+
+
+def test_fastest_healthy_equivalent_model_is_chosen():
+    router = ModelRouter({"fastest"}, [{"big", "small"}, {"other"}])
+    trained(router, "big", ttft=2.0, tokens_per_second=20)
+    trained(router, "small", ttft=0.5, tokens_per_second=60)
+
+    assert router.choose("big") == "small"
+    assert router.choose("other") == "other"
+    for _ in range(routing.ROUTING_FAILURE_THRESHOLD):
+        router.record_failure("small")
+    assert router.choose("big") == "big"
+    assert router.hedge_delay("big") == 2.0
+
+
+def test_sync_invoke_goes_to_the_chosen_model():
+    router = ModelRouter({"fastest"}, [{"big", "small"}])
+    trained(router, "big", ttft=2.0, tokens_per_second=20)
+    trained(router, "small", ttft=0.5, tokens_per_second=60)
+    llm = RoutedChatModel(
+        model_name="big",
+        make_llm=lambda model: GenericFakeChatModel(messages=iter([AIMessage(f"Antwort von {model}")])),
+        router=router,
+    )
+
+    assert llm.invoke("Wo tut es weh?").content == "Antwort von small"
+
+
+@pytest.mark.asyncio
+async def test_chat_reply_comes_from_the_hedged_model(db_schema, monkeypatch):
+    from app.main import app
+    from chains import chat_chain
+    from chains.prompt_registry import prompt_registry
+
+    closed.clear()
+    upstreams = {
+        "gemma-3-27b-it": FakeUpstream(messages=iter([]), delay=5, reply="Zu spät."),
+        "llama-3.3-70b-instruct": FakeUpstream(messages=iter([]), reply="In der rechten Hüfte."),
+    }
+    router = ModelRouter({"hedge"}, [set(upstreams)])
+    monkeypatch.setattr(routing, "HEDGE_DEFAULT_DELAY", 0.05)
+    monkeypatch.setattr(routing, "model_router", router)
+    monkeypatch.setattr(chat_chain, "model_router", router)
+    monkeypatch.setattr(chat_chain, "get_llm", upstreams.get)
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    prompt_registry.clear()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/v1/chat", json=CHAT)
+    finally:
+        prompt_registry.clear()
+
+    assert response.text == "In der rechten Hüfte. "
+    assert "Zu spät." in closed
+    async with SessionLocal() as db:
+        stored = (await db.execute(select(ChatMessage.content).where(ChatMessage.role == "patient"))).scalars().all()
+    assert stored == ["In der rechten Hüfte. "]
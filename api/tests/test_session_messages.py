@@ -0,0 +1,76 @@
+import datetime
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, text
+
+from app.db.db import SessionLocal
+from app.db.migrations import MIGRATIONS, run_migrations
+from app.db.models import ChatMessage, ChatSession
+from app.routers import sessions
+
+
+@pytest_asyncio.fixture
+async def client(db_schema):
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    app.include_router(sessions.router, prefix="/api/v1")
+    started = datetime.datetime(2025, 10, 1, 9, 0)
+    async with SessionLocal() as db:
+        db.add(ChatSession(id="s1"))
+        # Two messages share a timestamp, the id breaks the tie
+        db.add_all(
+            ChatMessage(session_id="s1", role="user" if i % 2 == 0 else "patient", content=f"m{i}",
+                        timestamp=started + datetime.timedelta(seconds=i // 2 * 2))
+            for i in range(7)
+        )
+        await db.commit()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_pages_backwards_from_the_tail(client):
+    tail = (await client.get("/api/v1/sessions/s1/messages", params={"limit": 3})).json()
+    middle = (await client.get("/api/v1/sessions/s1/messages", params={"limit": 3, "before": tail["before"]})).json()
+    start = (await client.get("/api/v1/sessions/s1/messages", params={"limit": 3, "before": middle["before"]})).json()
+
+    assert [m["content"] for m in tail["messages"]] == ["m4", "m5", "m6"]
+    assert [m["content"] for m in middle["messages"]] == ["m1", "m2", "m3"]
+    assert [m["content"] for m in start["messages"]] == ["m0"]
+    assert start["before"] is None
+
+
+@pytest.mark.asyncio
+async def test_after_cursor_returns_newer_messages(client):
+    middle = (await client.get("/api/v1/sessions/s1/messages", params={"limit": 3})).json()
+    first = (await client.get("/api/v1/sessions/s1/messages", params={"limit": 2, "before": middle["before"]})).json()
+
+    newer = (await client.get("/api/v1/sessions/s1/messages", params={"limit": 10, "after": first["after"]})).json()
+
+    assert [m["content"] for m in newer["messages"]] == ["m4", "m5", "m6"]
+    assert (await client.get("/api/v1/sessions/s1/messages", params={"after": newer["after"]})).json()["messages"] == []
+
+
+@pytest.mark.asyncio
+async def test_unknown_session_and_bad_cursor(client):
+    assert (await client.get("/api/v1/sessions/nope/messages")).status_code == 404
+    assert (await client.get("/api/v1/sessions/s1/messages", params={"before": "kaputt"})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_migration_adds_index_to_existing_table(db_schema):
+    async with db_schema.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_chat_messages_session_timestamp_id"))
+
+    applied = await run_migrations(db_schema)
+    again = await run_migrations(db_schema)
+
+    async with db_schema.connect() as conn:
+        indexes = await conn.run_sync(lambda c: [i["name"] for i in inspect(c).get_indexes("chat_messages")])
+        await conn.execute(text("DROP TABLE schema_migrations"))
+    assert applied == [m.version for m in MIGRATIONS]
+    assert again == []
+    assert "ix_chat_messages_session_timestamp_id" in indexes
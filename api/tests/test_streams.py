@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import json
+
+import httpx
+import pytest
+import pytest_asyncio
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from sqlalchemy import select
+
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, PatientFile
+from app.streams import ReplayExpired, Stream
+
+CHAT = {
+    "message": "Wo tut es weh?",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausgewogen",
+    "patient_file_id": 3,
+    "session_id": "s1",
+}
+SSE = {"Accept": "text/event-stream"}
+
+
+def parse_events(body: str) -> list[dict]:
+    events = []
+    for block in body.replace("\r\n", "\n").split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append({"id": fields.get("id"), "event": fields["event"], "data": json.loads(fields["data"])})
+    return events
+
+
+@pytest_asyncio.fixture
+async def client(db_schema, monkeypatch):
+    from app.main import app
+    from app.streams import stream_hub
+    from chains import chat_chain
+    from chains.prompt_registry import prompt_registry
+
+    calls = []
+
+    def fake_llm(model):
+        calls.append(model)
+        return GenericFakeChatModel(messages=itertools.repeat(AIMessage("In der rechten Hüfte.")))
+
+    monkeypatch.setattr(chat_chain, "get_llm", fake_llm)
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    prompt_registry.clear()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        client.calls = calls
+        yield client
+        await stream_hub.close()
+    prompt_registry.clear()
+
+
+@pytest.mark.asyncio
+async def test_chat_streams_typed_events(client):
+    response = await client.post("/api/v1/chat", json=CHAT, headers=SSE)
+
+    events = parse_events(response.text)
+    stream_id = response.headers["X-Stream-ID"]
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "".join(e["data"]["text"] for e in events if e["event"] == "token") == "In der rechten Hüfte."
+    assert [e["event"] for e in events[-2:]] == ["usage", "done"]
+    assert [e["id"] for e in events] == [f"{stream_id}:{n}" for n in range(len(events))]
+    # Persisted by the detached producer with its own session
+    async with SessionLocal() as db:
+        roles = (await db.execute(select(ChatMessage.role).order_by(ChatMessage.id))).scalars().all()
+    assert roles == ["user", "patient"]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_resumes_without_new_generation(client):
+    first = parse_events((await client.post("/api/v1/chat", json=CHAT, headers=SSE)).text)
+
+    resumed = await client.post("/api/v1/chat", json=CHAT, headers={**SSE, "Last-Event-ID": first[1]["id"]})
+
+    assert parse_events(resumed.text) == first[2:]
+    assert len(client.calls) == 1
+    stream_id = first[0]["id"].split(":")[0]
+    replay = parse_events((await client.get(f"/api/v1/streams/{stream_id}")).text)
+    assert replay == first
+    assert (await client.get("/api/v1/streams/nope")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upstream_failure_is_an_error_event(client, monkeypatch):
+    from chains import chat_chain
+
+    class Broken(GenericFakeChatModel):
+        async def _astream(self, *args, **kwargs):
+            raise RuntimeError("ChatAI nicht erreichbar")
+            yield
+
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: Broken(messages=iter([])))
+
+    events = parse_events((await client.post("/api/v1/chat", json=CHAT, headers=SSE)).text)
+
+    assert [e["event"] for e in events] == ["error"]
+    assert events[0]["data"]["message"].startswith("Entschuldigung, es ist ein Fehler aufgetreten")
+    assert "ChatAI nicht erreichbar" in events[0]["data"]["message"]
+
+
+@pytest.mark.asyncio
+async def test_replay_beyond_buffer_is_rejected():
+    stream = Stream("s", replay_size=2)
+    for n in range(4):
+        stream.publish("token", {"text": str(n)})
+    stream.finish()
+
+    assert [e.id for e in [e async for e in stream.subscribe(after=1)]] == [2, 3]
+    with pytest.raises(ReplayExpired):
+        [e async for e in stream.subscribe(after=0)]
+
+
+@pytest.mark.asyncio
+async def test_subscriber_follows_live_stream():
+    stream = Stream("s", replay_size=10)
+    received = asyncio.create_task(asyncio.wait_for(_collect(stream), 1))
+    await asyncio.sleep(0)
+    stream.publish("token", {"text": "a"})
+    stream.publish("done", {})
+    stream.finish()
+
+    assert [e.event for e in await received] == ["token", "done"]
+
+
+async def _collect(stream: Stream) -> list:
+    return [event async for event in stream.subscribe()]
@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+import pytest_asyncio
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from sqlalchemy import select
+
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, PatientFile
+from app.turns import SessionTurns
+
+CHAT = {
+    "message": "Wo tut es weh?",
+    "model": "gemma-3-27b-it",
+    "condition": "default",
+    "talkativeness": "ausgewogen",
+    "patient_file_id": 3,
+    "session_id": "s1",
+}
+
+# Number of messages each generation was sent
+prompts = []
+
+
+class SlowModel(GenericFakeChatModel):
+    """Replies slowly, so overlapping requests really overlap."""
+
+    async def _astream(self, messages, *args, **kwargs):
+        prompts.append(len(messages))
+        for word in ("In ", "der ", "rechten ", "Hüfte."):
+            await asyncio.sleep(0.02)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+@pytest_asyncio.fixture
+async def client(db_schema, monkeypatch):
+    from app.main import app
+    from app.streams import stream_hub
+    from chains import chat_chain
+    from chains.prompt_registry import prompt_registry
+
+    prompts.clear()
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: SlowModel(messages=iter([])))
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    prompt_registry.clear()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+        await stream_hub.close()
+    prompt_registry.clear()
+
+
+async def stored_roles() -> list[str]:
+    async with SessionLocal() as db:
+        return (await db.execute(select(ChatMessage.role).order_by(ChatMessage.id))).scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_overlapping_turns_of_a_session_run_one_after_the_other(client):
+    first, second = await asyncio.gather(
+        client.post("/api/v1/chat", json=CHAT),
+        client.post("/api/v1/chat", json={**CHAT, "message": "Seit wann?"}),
+    )
+
+    assert first.text == second.text == "In der rechten Hüfte."
+    assert await stored_roles() == ["user", "patient", "user", "patient"]
+    # The second turn saw the first one's reply
+    assert prompts[1] == prompts[0] + 2
+
+
+@pytest.mark.asyncio
+async def test_duplicate_request_attaches_to_the_running_generation(client):
+    headers = {"Idempotency-Key": "m1"}
+
+    first, second = await asyncio.gather(
+        client.post("/api/v1/chat", json=CHAT, headers=headers),
+        client.post("/api/v1/chat", json=CHAT, headers=headers),
+    )
+    retried = await client.post("/api/v1/chat", json=CHAT, headers={**headers, "Accept": "text/event-stream"})
+
+    assert first.text == second.text == "In der rechten Hüfte."
+    assert first.headers["X-Stream-ID"] == second.headers["X-Stream-ID"] == retried.headers["X-Stream-ID"]
+    assert len(prompts) == 1
+    assert await stored_roles() == ["user", "patient"]
+    # The key is scoped to its session
+    await client.post("/api/v1/chat", json={**CHAT, "session_id": "s2"}, headers=headers)
+    assert len(prompts) == 2
+
+
+@pytest.mark.asyncio
+async def test_session_lock_is_dropped_after_the_last_turn():
+    turns = SessionTurns()
+    async with turns.turn("s1"):
+        waiter = asyncio.create_task(_take(turns, "s1"))
+        await asyncio.sleep(0)
+        assert turns.stats()["waiting"] == 1
+    await waiter
+
+    assert turns.stats() == {"sessions": 0, "waiting": 0, "turns": 2, "serialized": 1}
+
+
+async def _take(turns: SessionTurns, session_id: str) -> None:
+    async with turns.turn(session_id):
+        pass
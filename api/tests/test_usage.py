@@ -0,0 +1,29 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chains.usage import TokenUsageHandler
+
+
+@pytest.mark.asyncio
+async def test_reported_usage_is_summed_over_calls():
+    usage = TokenUsageHandler()
+    reply = AIMessage("Es geht so.", usage_metadata={"input_tokens": 120, "output_tokens": 5, "total_tokens": 125})
+    llm = GenericFakeChatModel(messages=iter([reply, reply]))
+
+    await llm.ainvoke([HumanMessage("Wie geht es Ihnen?")], config={"callbacks": [usage]})
+    await llm.ainvoke([HumanMessage("Und sonst?")], config={"callbacks": [usage]})
+
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.estimated) == (240, 10, False)
+
+
+@pytest.mark.asyncio
+async def test_missing_usage_is_estimated_from_prompt_and_reply():
+    usage = TokenUsageHandler()
+    llm = GenericFakeChatModel(messages=iter([AIMessage("Ach, die Hüfte tut weh.")]))
+
+    chunks = [chunk async for chunk in llm.astream([HumanMessage("Haben Sie Schmerzen?")], config={"callbacks": [usage]})]
+
+    assert chunks
+    assert usage.estimated
+    assert usage.prompt_tokens > 0 and usage.completion_tokens > 0
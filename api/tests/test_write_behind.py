@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from sqlalchemy import func, select
+
+from app.cache.history import HistoryCache
+from app.db import write_behind as write_behind_module
+from app.db.db import SessionLocal
+from app.db.models import ChatMessage, ChatSession, PatientFile, TokenUsage
+from app.db.write_behind import WriteBehindQueue
+
+
+async def count_messages() -> int:
+    async with SessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(ChatMessage))
+
+
+@pytest.mark.asyncio
+async def test_rows_are_written_in_one_batch(db_schema, count_queries):
+    async with SessionLocal() as db:
+        db.add(ChatSession(id="s1"))
+        await db.commit()
+    queue = WriteBehindQueue(SessionLocal, batch_size=100, flush_interval=60)
+    for i in range(10):
+        queue.add(
+            ChatMessage(session_id="s1", role="user", content=f"Frage {i}"),
+            ChatMessage(session_id="s1", role="patient", content=f"Antwort {i}"),
+        )
+    queue.add(TokenUsage(session_id="s1", kind="chat", model="m", prompt_tokens=10, completion_tokens=2))
+    count_queries.clear()
+
+    assert await count_messages() == 0
+    await queue.flush()
+
+    inserts = [s for s in count_queries if s.startswith("INSERT")]
+    assert len(inserts) == 2
+    assert queue.stats()["flushes"] == 1 and queue.stats()["flushed_rows"] == 21
+    async with SessionLocal() as db:
+        rows = (await db.execute(select(ChatMessage.content).order_by(ChatMessage.timestamp, ChatMessage.id))).scalars().all()
+    assert rows[:3] == ["Frage 0", "Antwort 0", "Frage 1"]
+
+
+@pytest.mark.asyncio
+async def test_history_miss_reads_queued_messages(db_schema, monkeypatch):
+    queue = WriteBehindQueue(SessionLocal, batch_size=100, flush_interval=60)
+    monkeypatch.setattr("app.cache.history.write_behind", queue)
+    async with SessionLocal() as db:
+        db.add(ChatSession(id="s1"))
+        await db.commit()
+    queue.add(ChatMessage(session_id="s1", role="user", content="Wie geht es Ihnen?"))
+
+    async with SessionLocal() as db:
+        history = await HistoryCache(maxsize=8, ttl=60).get(db, "s1")
+
+    assert [m.content for m in history] == ["Wie geht es Ihnen?"]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_and_close_flush(db_schema):
+    async with SessionLocal() as db:
+        db.add(ChatSession(id="s1"))
+        await db.commit()
+    queue = WriteBehindQueue(SessionLocal, batch_size=3, flush_interval=60)
+    queue.start()
+    queue.add(*(ChatMessage(session_id="s1", role="user", content=str(i)) for i in range(3)))
+    await asyncio.sleep(0.05)
+    assert await count_messages() == 3
+
+    queue.add(ChatMessage(session_id="s1", role="user", content="zuletzt"))
+    await queue.close()
+    assert await count_messages() == 4
+
+
+@pytest.mark.asyncio
+async def test_store_commits_directly_when_disabled(db_schema, monkeypatch):
+    monkeypatch.setattr(write_behind_module, "WRITE_BEHIND_ENABLED", False)
+    async with SessionLocal() as db:
+        db.add(ChatSession(id="s1"))
+        await db.commit()
+        await write_behind_module.store(db, ChatMessage(session_id="s1", role="user", content="Hallo"))
+
+    assert await count_messages() == 1
+
+
+# Connections checked out while the model was streaming
+checked_out = []
+
+
+class CheckoutProbe(GenericFakeChatModel):
+    async def _astream(self, *args, **kwargs):
+        from app.db.db import pool_monitor
+
+        checked_out.append(len(pool_monitor.checkouts))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="Seit gestern."))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("enabled", [False, True])
+@pytest.mark.parametrize("headers", [{}, {"Accept": "text/event-stream"}])
+async def test_no_connection_is_held_while_the_reply_streams(db_schema, monkeypatch, enabled, headers):
+    from app.main import app
+    from app.cache.patient_profile import patient_profiles
+    from app.streams import stream_hub
+    from chains import chat_chain
+    from chains.prompt_registry import prompt_registry
+
+    checked_out.clear()
+    monkeypatch.setattr(write_behind_module, "WRITE_BEHIND_ENABLED", enabled)
+    monkeypatch.setattr(chat_chain, "get_llm", lambda model: CheckoutProbe(messages=iter([])))
+    async with SessionLocal() as db:
+        db.add(PatientFile(id=3, first_name="Anna", last_name="Zank"))
+        await db.commit()
+    patient_profiles.invalidate(3)
+    prompt_registry.clear()
+    chat = {
+        "message": "Seit wann?", "model": "gemma-3-27b-it", "condition": "default",
+        "talkativeness": "ausgewogen", "patient_file_id": 3, "session_id": "s1",
+    }
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/v1/chat", json=chat, headers=headers)
+            await stream_hub.close()
+        await write_behind_module.write_behind.flush()
+    finally:
+        prompt_registry.clear()
+
+    assert response.status_code == 200
+    assert checked_out == [0]
@@ -0,0 +1,99 @@
+"""
+Benchmark of rendering a streamed reply in the frontend.
+
+Feeds a synthetic stream of 2,000 tokens, starting with a think block, to the
+previous per-chunk renderer and to streaming.render_stream. The stream is
+replayed with a simulated clock at the given token rate, so the throttling
+behaves as in a live chat, and a fake placeholder counts the updates and the
+characters they would send to the browser.
+
+Usage (from the frontend/ folder):
+    python bench_streaming.py --tokens 2000 --tokens-per-second 50
+"""
+import argparse
+import re
+import time
+
+from streaming import RENDER_INTERVAL, render_stream
+
+
+class Placeholder:
+    """Stands in for st.empty(); counts updates and the characters they carry."""
+
+    def __init__(self):
+        self.updates = 0
+        self.chars = 0
+
+    def markdown(self, text: str) -> None:
+        self.updates += 1
+        self.chars += len(text)
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def synthetic_stream(tokens: int, think_tokens: int) -> list[bytes]:
+    words = ["Ach", " ja,", " die", " Hüfte", " tut", " schon", " seit", " gestern", " weh."]
+    think = ["<think>"] + [" überlege" for _ in range(think_tokens)] + ["</think>", "\n\n"]
+    return [chunk.encode() for chunk in think + [words[i % len(words)] for i in range(tokens - len(think))]]
+
+
+def legacy_render(chunks, placeholder) -> str:
+    """The per-chunk rendering the frontend used before streaming.py."""
+    streamed_text = ""
+    buffer = ""
+    think_tags_removed = False
+    for chunk in chunks:
+        buffer += chunk.decode()
+        if not think_tags_removed and "<think>" in buffer:
+            if "</think>\n" in buffer:
+                buffer = re.sub(r'^<think>[\s\S]*?</think>\n\n?', '', buffer)
+                think_tags_removed = True
+            else:
+                continue
+        if think_tags_removed or not "<think>" in buffer:
+            streamed_text += buffer
+            buffer = ""
+            think_tags_removed = True
+        placeholder.markdown(streamed_text)
+    return streamed_text
+
+
+def paced(chunks, clock: SimulatedClock, tokens_per_second: float):
+    for chunk in chunks:
+        clock.now += 1 / tokens_per_second
+        yield chunk
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000, help="tokens in the synthetic reply")
+    parser.add_argument("--think-tokens", type=int, default=300, help="tokens inside the think block")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="simulated streaming speed")
+    parser.add_argument("--interval", type=float, default=RENDER_INTERVAL, help="render interval in seconds")
+    args = parser.parse_args()
+
+    chunks = synthetic_stream(args.tokens, args.think_tokens)
+    runs = {
+        "per chunk": lambda placeholder, clock: legacy_render(chunks, placeholder),
+        "throttled": lambda placeholder, clock: render_stream(
+            paced(chunks, clock, args.tokens_per_second), placeholder, args.interval, clock),
+    }
+    texts = []
+    for label, run in runs.items():
+        placeholder = Placeholder()
+        started = time.perf_counter()
+        texts.append(run(placeholder, SimulatedClock()))
+        elapsed = time.perf_counter() - started
+        print(f"{label:>9}: {placeholder.updates:5d} updates | {placeholder.chars / 1e6:7.2f}M chars sent | "
+              f"{elapsed * 1000:7.2f}ms CPU")
+    assert texts[0] == texts[1], "renderers disagree on the visible text"
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,8 @@ import logging
 import uuid
 import base64
 from pathlib import Path
-import re
+
+from streaming import render_stream
 
 # Constants
 API_URL = "http://host.docker.internal:8000/api/v1"
@@ -18,6 +19,8 @@ AVAILABLE_MODELS = [
 ]
 PATIENT_ROLES = ["default", "alzheimer", "schwerhörig", "verdrängung"]
 TALKATIVENESS_LEVELS = ["kurz angebunden", "ausgewogen", "ausschweifend"]
+# Keep-alive connections to the API shared by all browser sessions
+API_POOL_SIZE = 20
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
@@ -32,10 +35,23 @@ def init_session_state() -> None:
         st.session_state.session_id = str(uuid.uuid4())
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "pending_message" not in st.session_state:
+        # Sent message whose reply has not arrived yet, with its Idempotency-Key
+        st.session_state.pending_message = None
+
 
+@st.cache_resource
+def get_api_session() -> requests.Session:
+    """Pooled HTTP session to the API, created once per server process"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
+@st.cache_data
 def load_patient_image() -> str:
-    """Load and convert patient image to base64"""
+    """Load and convert patient image to base64 (read once, not on every rerun)"""
     def img_to_base64(image_path: Path) -> str:
         with open(image_path, "rb") as img_file:
             return base64.b64encode(img_file.read()).decode()
@@ -104,12 +120,13 @@ def handle_chat_reset() -> None:
     """Handle chat reset functionality"""
     try:
         # Send request to clear db for this session
-        response = requests.post(f"{API_URL}/reset/{st.session_state.session_id}")
+        response = get_api_session().post(f"{API_URL}/reset/{st.session_state.session_id}")
         if response.status_code == 200:
             # Generate new session ID
             st.session_state.session_id = str(uuid.uuid4())
             # Clear frontend messages
             st.session_state.messages = []
+            st.session_state.pending_message = None
             st.rerun()
         else:
             st.error("Error resetting chat memory")
@@ -124,21 +141,26 @@ def handle_chat_eval() -> None:
         return
 
     try:
-        messages = [
-            {"role": msg["role"], "output": msg["output"]} for msg in st.session_state.messages
-        ]
-
         # Create placeholder for evaluation response
         response_placeholder = st.chat_message("patient").markdown("")
 
         with st.spinner("Anamnese Feedback wird erstellt..."):
-            with requests.post(f"{API_URL}/eval", json={"messages": messages}, stream=True) as response:
+            # The API evaluates the history it stored for this session
+            response = get_api_session().post(f"{API_URL}/eval/{st.session_state.session_id}", stream=True)
+            if response.status_code == 404:
+                # Session unknown to the API (e.g. older API version), upload the transcript instead
+                response.close()
+                response = get_api_session().post(f"{API_URL}/eval", json={"messages": transcript_for_eval()}, stream=True)
+            with response:
                 if response.status_code == 200:
                     evaluation_text = process_llm_response(response, response_placeholder)
                     st.session_state.messages.append({
                         "role": "patient",
                         "output": evaluation_text,
+                        "evaluation": True,
                     })
+                elif response.status_code == 429:
+                    st.warning(busy_message(response))
                 else:
                     st.error(f"Fehler bei der Bewertung (Status: {response.status_code})")
 
@@ -146,48 +168,27 @@ def handle_chat_eval() -> None:
         logger.error(f"Error evaluating chat: {str(e)}")
         st.error(f"Fehler bei der Bewertung: {str(e)}")
 
+def busy_message(response: requests.Response) -> str:
+    """Message for a request the API turned away because the model is at capacity"""
+    return f"Das Modell ist gerade ausgelastet, bitte in {response.headers.get('Retry-After', 'einigen')} Sekunden erneut versuchen."
+
+def transcript_for_eval() -> list[dict]:
+    """Chat messages in the format of the /eval fallback, without earlier evaluations"""
+    return [
+        # Patient replies are displayed as "assistant" messages
+        {"role": "patient" if msg["role"] == "assistant" else msg["role"], "output": msg["output"]}
+        for msg in st.session_state.messages
+        if not msg.get("evaluation")
+    ]
+
 def process_llm_response(response: requests.Response, response_placeholder: st.delta_generator.DeltaGenerator) -> str:
     """Process streaming response from LLM"""
-    streamed_text = ""
-    buffer = ""
-    think_tags_removed = False
-
-    for chunk in response.iter_content(chunk_size=None):
-        chunk_text = chunk.decode()
-        buffer += chunk_text
-        
-        # Check for think tags
-        if not think_tags_removed and "<think>" in buffer:
-            # Wait for closing tag
-            if "</think>\n" in buffer:
-                # Remove tags
-                buffer = re.sub(r'^<think>[\s\S]*?</think>\n\n?', '', buffer)
-                think_tags_removed = True
-            else:
-                # Don't display anything yet, wait for closing tag
-                continue
-        
-        # Add processed text to stream
-        if think_tags_removed or not "<think>" in buffer:
-            streamed_text += buffer
-            buffer = ""
-            think_tags_removed = True if not think_tags_removed else think_tags_removed
-
-        # Update display
-        response_placeholder.markdown(streamed_text)
-    
-    return streamed_text
-
-def main() -> None:
-    """Main application function"""
-    setup_header_layout()
-    img_base64 = load_patient_image()
-    init_session_state()
-    
-    create_header(img_base64)
-    display_patient_info()
-    setup_sidebar()
+    # Think tags are filtered incrementally and the placeholder is updated at most every RENDER_INTERVAL
+    return render_stream(response.iter_content(chunk_size=None), response_placeholder)
 
+@st.fragment
+def chat_area() -> None:
+    """Chat history and input; submitting a message reruns only this fragment"""
     # Display chat history
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -196,10 +197,19 @@ def main() -> None:
 
     # Handle user input
     if prompt := st.chat_input("Fange hier ein Gespräch an..."):
-        with st.chat_message("user"):
-            st.markdown(prompt)
+        # Sending a message again before its reply arrived (retry, double submit) reuses its key,
+        # so the API follows the first request's reply instead of generating another
+        pending = st.session_state.pending_message
+        retried = pending is not None and pending["message"] == prompt
+        if not retried:
+            pending = st.session_state.pending_message = {"message": prompt, "key": str(uuid.uuid4())}
 
-        st.session_state.messages.append({"role": "user", "output": prompt})
+        user_message = {"role": "user", "output": prompt}
+        # A retried message is already shown from its first attempt
+        if not (retried and st.session_state.messages and st.session_state.messages[-1] == user_message):
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            st.session_state.messages.append(user_message)
 
         data = {
             "message": prompt,
@@ -212,16 +222,34 @@ def main() -> None:
 
         with st.spinner("Denkt nach..."):
             response_placeholder = st.chat_message("assistant").markdown("")
-            with requests.post(API_URL + "/chat", json=data, stream=True) as response:
+            headers = {"Idempotency-Key": pending["key"]}
+            with get_api_session().post(API_URL + "/chat", json=data, headers=headers, stream=True) as response:
                 if response.status_code == 200:
                     streamed_text = process_llm_response(response, response_placeholder)
                     st.session_state.messages.append({
                         "role": "assistant",
                         "output": streamed_text,
                     })
+                    st.session_state.pending_message = None
+                elif response.status_code == 429:
+                    # The API did not store the message, it can be sent again
+                    st.session_state.messages.pop()
+                    st.warning(busy_message(response))
                 else:
                     st.error("An error occurred while processing your message.")
 
+def main() -> None:
+    """Main application function"""
+    setup_header_layout()
+    img_base64 = load_patient_image()
+    init_session_state()
+    
+    create_header(img_base64)
+    display_patient_info()
+    setup_sidebar()
+
+    chat_area()
+
     # Add sidebar buttons
     if st.sidebar.button("Chat zurücksetzen", use_container_width=True):
         handle_chat_reset()
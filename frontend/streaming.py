@@ -0,0 +1,121 @@
+"""Incremental processing and throttled rendering of streamed LLM replies."""
+import codecs
+import time
+from typing import Callable, Iterable
+
+# At most one UI update per interval while a reply streams in (seconds)
+RENDER_INTERVAL = 0.1
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+class ThinkFilter:
+    """
+    Drops a leading <think>...</think> block from a reply, chunk by chunk.
+
+    States: "start" until it is known whether the reply opens with a think
+    tag, "think" inside the block, "after" while skipping the blank lines
+    after it and "text" once the visible reply streams. Each chunk is looked
+    at once; only a possible partial closing tag is kept across chunks.
+    """
+
+    def __init__(self):
+        self.state = "start"
+        self.pending = ""
+
+    def feed(self, chunk: str) -> str:
+        """Return the visible part of the chunk."""
+        if self.state == "text":
+            return chunk
+        self.pending += chunk
+
+        if self.state == "start":
+            if self.pending.startswith(THINK_OPEN):
+                self.state = "think"
+                self.pending = self.pending[len(THINK_OPEN):]
+            elif THINK_OPEN.startswith(self.pending):
+                # Could still become a think tag
+                return ""
+            else:
+                self.state = "text"
+                visible, self.pending = self.pending, ""
+                return visible
+
+        if self.state == "think":
+            end = self.pending.find(THINK_CLOSE)
+            if end == -1:
+                # Keep only what may be the start of the closing tag
+                self.pending = self.pending[-(len(THINK_CLOSE) - 1):]
+                return ""
+            self.state = "after"
+            self.pending = self.pending[end + len(THINK_CLOSE):]
+
+        # "after": the reply starts with the first non-blank character
+        visible = self.pending.lstrip()
+        self.pending = ""
+        if visible:
+            self.state = "text"
+        return visible
+
+    def close(self) -> str:
+        """Return what is still held back at the end of the stream."""
+        # An unfinished think block is never shown
+        visible = self.pending if self.state == "start" else ""
+        self.pending = ""
+        return visible
+
+
+class ThrottledRenderer:
+    """
+    Collects streamed text and renders it at most once per interval.
+
+    Streamlit replaces the whole element on each update, so rendering every
+    token sends the growing reply over the websocket again and again.
+    """
+
+    def __init__(self, placeholder, interval: float = RENDER_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.clock = clock
+        self.parts: list[str] = []
+        self.dirty = False
+        self.last_render = None
+
+    def add(self, text: str) -> None:
+        if not text:
+            return
+        self.parts.append(text)
+        self.dirty = True
+        now = self.clock()
+        if self.last_render is None or now - self.last_render >= self.interval:
+            self.render(now)
+
+    def render(self, now: float) -> None:
+        self.placeholder.markdown(self.text())
+        self.dirty = False
+        self.last_render = now
+
+    def text(self) -> str:
+        if len(self.parts) > 1:
+            self.parts[:] = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
+    def finish(self) -> str:
+        """Render the complete text if the last update missed a part of it and return it."""
+        if self.dirty:
+            self.render(self.clock())
+        return self.text()
+
+
+def render_stream(chunks: Iterable[bytes], placeholder, interval: float = RENDER_INTERVAL,
+                  clock: Callable[[], float] = time.monotonic) -> str:
+    """Decode, filter and render a streamed reply; return the visible text."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    think = ThinkFilter()
+    renderer = ThrottledRenderer(placeholder, interval, clock)
+    for chunk in chunks:
+        # A chunk may end inside a multi-byte character
+        renderer.add(think.feed(decoder.decode(chunk)))
+    renderer.add(think.feed(decoder.decode(b"", final=True)) + think.close())
+    return renderer.finish()